@@ -0,0 +1,101 @@
+'''
+Request latency by durability mode
+
+Runs a number of clients at once, each sending messages to its own channel
+through the Flask test client, under each config.durability. With 'sync'
+every request writes and fsyncs the log itself, one after another. With
+'group' requests that finish close together share one write and fsync, and
+with 'async' no request waits for the disk at all.
+
+fsync on a laptop SSD can take well under a millisecond, while on network
+storage it often takes several. An fsync time in milliseconds can be given
+to make every fsync take at least that long.
+
+Usage (from the repository root):
+
+    python -m benchmarks.durability [fsync ms]
+'''
+import os
+import sys
+import tempfile
+import threading
+import time
+
+CLIENT_COUNTS = [1, 4, 16]
+REQUESTS_PER_CLIENT = 100
+MODES = [('sync', 0), ('group', 0), ('group', 2), ('async', 2)]
+
+# Run against a scratch database rather than the one in the working directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from src import config
+from src.server import APP
+from src.data_store import FLUSHER
+from src.auth import auth_register_v2
+from src.channels import channels_create_v2
+from src.other import clear_v1
+
+# Makes every fsync take at least fsync_ms
+def slow_fsync(fsync_ms):
+    fsync = os.fsync
+    def delayed(descriptor):
+        fsync(descriptor)
+        time.sleep(fsync_ms / 1000)
+    os.fsync = delayed
+
+# Registers one user with a channel of their own for each client
+def populate(num_clients):
+    clear_v1()
+    clients = []
+    for i in range(num_clients):
+        user = auth_register_v2(f'user{i}@gmail.com', 'password', 'user', f'number{i}')
+        channel_id = channels_create_v2(user['token'], f'channel{i}', True)['channel_id']
+        clients.append((user['token'], channel_id))
+    return clients
+
+# Sends REQUESTS_PER_CLIENT messages, adding each latency in ms to latencies
+def run_client(token, channel_id, latencies):
+    client = APP.test_client()
+    for i in range(REQUESTS_PER_CLIENT):
+        start = time.perf_counter()
+        response = client.post('/message/send/v1', json={'token': token, 'channel_id': channel_id, 'message': f'hello {i}'})
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.data
+
+# Returns the given percentile of a sorted list
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    if len(sys.argv) > 1:
+        slow_fsync(float(sys.argv[1]))
+    print(f"{'mode':>6} {'ms':>3} {'clients':>8} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>8} {'writes':>7}")
+    for mode, interval in MODES:
+        config.durability = mode
+        FLUSHER.interval = interval / 1000
+        for num_clients in CLIENT_COUNTS:
+            clients = populate(num_clients)
+            FLUSHER.drain()
+            latencies = []
+            writes = []
+            write = FLUSHER.write
+            # Counts the writes the flusher makes, sync writes one per request
+            FLUSHER.write = lambda batches: (writes.append(len(batches)), write(batches))
+            threads = [threading.Thread(target=run_client, args=(token, channel_id, latencies))
+                       for token, channel_id in clients]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            FLUSHER.drain()
+            elapsed = time.perf_counter() - start
+            FLUSHER.write = write
+            latencies.sort()
+            num_writes = len(writes) if mode != 'sync' else len(latencies)
+            print(f'{mode:>6} {interval:>3} {num_clients:>8} {percentile(latencies, 0.5):>8.2f} '
+                  f'{percentile(latencies, 0.99):>8.2f} {len(latencies) / elapsed:>8.0f} {num_writes:>7}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+'''
+Read-only route latency against database size
+
+Fills the store with a growing number of messages and times read-only
+routes through the Flask test client. Since the store is held in memory
+and only read from disk on startup, latency should stay flat as the number
+of messages grows. search/v1 looks up an n-gram index, so its latency
+follows the number of matches rather than the number of messages.
+
+Usage (from the repository root):
+
+    python -m benchmarks.read_latency
+'''
+import os
+import sys
+import tempfile
+import time
+
+MESSAGE_COUNTS = [1000, 10000, 100000]
+NUM_USERS = 50
+NUM_CHANNELS = 20
+REPEAT = 200
+
+# Run against a scratch database rather than the one in the working directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from src.server import APP
+from src.data_store import get_data, save, insert_message
+from src.auth import auth_register_v2
+from src.channels import channels_create_v2
+from src.other import clear_v1
+from src.helper import new_react, get_msg_details
+
+# Creates users and channels then bulk loads num_messages messages
+def populate(num_messages):
+    clear_v1()
+    users = []
+    for i in range(NUM_USERS):
+        users.append(auth_register_v2(f'user{i}@gmail.com', 'password', 'user', f'number{i}'))
+    owner = users[0]
+    channel_ids = []
+    for i in range(NUM_CHANNELS):
+        channel_ids.append(channels_create_v2(owner['token'], f'channel{i}', True)['channel_id'])
+
+    channels = get_data()['channels']
+    time_created = int(time.time())
+    for i in range(num_messages):
+        message_id = i * 2 + 1
+        channel = channels[i % NUM_CHANNELS]
+        insert_message(channel, get_msg_details(message_id, owner['auth_user_id'],
+                                    f'message {i}', time_created, new_react(False), False))
+    save()
+    return owner, channel_ids[0]
+
+# Returns the mean latency of a GET request in milliseconds
+def time_route(client, route, params):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        response = client.get(route, query_string=params)
+        assert response.status_code == 200, response.data
+    return (time.perf_counter() - start) * 1000 / REPEAT
+
+def main():
+    client = APP.test_client()
+    print(f"{'messages':>10} {'route':<24} {'mean ms':>8}")
+    for num_messages in MESSAGE_COUNTS:
+        owner, channel_id = populate(num_messages)
+        token = owner['token']
+        routes = [
+            ('/channels/list/v2', {'token': token}),
+            ('/channel/details/v2', {'token': token, 'channel_id': channel_id}),
+            ('/channel/messages/v2', {'token': token, 'channel_id': channel_id, 'start': 0}),
+            ('/user/profile/v1', {'token': token, 'u_id': owner['auth_user_id']}),
+            ('/dm/list/v1', {'token': token}),
+            # Matches 'message 12345' and nothing else
+            ('/search/v1', {'token': token, 'query_str': 'message 12345'}),
+        ]
+        for route, params in routes:
+            print(f'{num_messages:>10} {route:<24} {time_route(client, route, params):>8.3f}')
+
+if __name__ == '__main__':
+    main()
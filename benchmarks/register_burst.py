@@ -0,0 +1,46 @@
+'''
+Registration burst
+
+Registers a cohort of users who all share the same name, so every
+registration after the first collides on its handle. With the email and
+handle indexes the time per registration should stay flat as the cohort
+grows when the burst runs as one unit of work. The per-request column
+also includes writing each registration out to the log.
+
+Usage (from the repository root):
+
+    python -m benchmarks.register_burst
+'''
+import os
+import sys
+import tempfile
+import time
+
+COHORT_SIZES = [500, 1000, 2000, 4000]
+
+# Run against a scratch database rather than the one in the working directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from src.auth import auth_register_v2
+from src.data_store import transaction
+from src.other import clear_v1
+
+# Returns the mean time per registration in microseconds
+def register_cohort(size):
+    clear_v1()
+    start = time.perf_counter()
+    for i in range(size):
+        auth_register_v2(f'student{i}@gmail.com', 'password', 'anna', 'park')
+    return (time.perf_counter() - start) * 1e6 / size
+
+def main():
+    print(f"{'users':>8} {'one unit us':>12} {'per request us':>15}")
+    for size in COHORT_SIZES:
+        with transaction():
+            batched = register_cohort(size)
+        per_request = register_cohort(size)
+        print(f'{size:>8} {batched:>12.1f} {per_request:>15.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+'''
+Threads held by active standups
+
+Starts a growing number of standups, one per channel, and reports how many
+threads the process is running. Every standup expiry is owned by the shared
+scheduler, so the thread count should stay the same however many standups
+are active.
+
+Usage (from the repository root):
+
+    python -m benchmarks.standup_threads
+'''
+import os
+import sys
+import tempfile
+import threading
+
+STANDUP_COUNTS = [0, 10, 100, 1000]
+STANDUP_LENGTH = 600
+
+# Run against a scratch database rather than the one in the working directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from src.auth import auth_register_v2
+from src.channels import channels_create_v2
+from src.data_store import transaction
+from src.other import clear_v1
+from src.standup import standup_start_v1
+
+def main():
+    print(f"{'standups':>9} {'threads':>8}")
+    for count in STANDUP_COUNTS:
+        with transaction():
+            clear_v1()
+            token = auth_register_v2('owner@gmail.com', 'password', 'owner', 'user')['token']
+            for i in range(count):
+                channel_id = channels_create_v2(token, f'standup{i}', True)['channel_id']
+                standup_start_v1(token, channel_id, STANDUP_LENGTH)
+        print(f'{count:>9} {threading.active_count():>8}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''
+Tag extraction in large channels
+
+Times message/send in a channel with many members for messages carrying a
+growing number of tags. Tags are found in one pass over the message and
+each tagged handle is looked up once in the handles index, then checked
+against the channel's membership, so the time per send should follow the
+number of tags and not the number of members.
+
+Usage (from the repository root):
+
+    python -m benchmarks.tag_extraction
+'''
+import os
+import sys
+import tempfile
+import time
+
+NUM_MEMBERS = 10000
+TAG_COUNTS = [0, 10, 50, 100]
+REPEAT = 200
+
+# Run against a scratch database rather than the one in the working directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from src.data_store import transaction, lookup, add_channel_member, save
+from src.auth import auth_register_v2
+from src.channels import channels_create_v2
+from src.message import message_send_v1
+from src.notifications import NOTIFIER
+from src.other import clear_v1
+
+# Creates a channel holding NUM_MEMBERS users
+# Returns the owner's token, the channel_id and the members' handles
+def populate():
+    clear_v1()
+    with transaction():
+        owner = auth_register_v2('owner@gmail.com', 'password', 'channel', 'owner')
+        channel_id = channels_create_v2(owner['token'], 'big', True)['channel_id']
+        channel = lookup('channels', channel_id)
+        handles = []
+        for i in range(NUM_MEMBERS):
+            user = auth_register_v2(f'member{i}@gmail.com', 'password', 'member', f'number{i}')
+            add_channel_member(channel, user['auth_user_id'])
+            handles.append(lookup('users', user['auth_user_id'])['handle_str'])
+        save()
+    return owner['token'], channel_id, handles
+
+# Returns the mean time of a message/send in microseconds
+def time_send(token, channel_id, message):
+    start = time.perf_counter()
+    with transaction():
+        for _ in range(REPEAT):
+            message_send_v1(token, channel_id, message)
+    elapsed = time.perf_counter() - start
+    # Notifications are sent in the background, wait so runs do not overlap
+    NOTIFIER.wait()
+    return elapsed * 1e6 / REPEAT
+
+def main():
+    token, channel_id, handles = populate()
+    print(f"{'members':>8} {'tags':>6} {'send us':>10}")
+    for num_tags in TAG_COUNTS:
+        step = len(handles) // max(num_tags, 1)
+        tags = ' '.join(f'@{handle}, hi' for handle in handles[::step][:num_tags])
+        message = (tags or 'no tags here')[:1000]
+        print(f'{NUM_MEMBERS:>8} {num_tags:>6} {time_send(token, channel_id, message):>10.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,10 @@ Admin implementation
 from src.error import InputError, AccessError
 from src.helper import check_permision_id, channels_create_check_valid_user, check_number_of_owners, check_permission
 from src.helper import get_user_details
-from src.data_store import get_data, save
-from src.server_helper import decode_token, valid_user
+from src.data_store import get_data, save, set_user_email, set_user_handle, clear_sessions
+from src.data_store import remove_channel_member, remove_channel_owner, remove_dm_member, clear_dm_creator
+from src.data_store import set_message_text, mark_user_removed, clear_notifications
+from src.server_helper import decode_token, valid_user, forget_tokens
 
 def admin_user_remove_v1(token, u_id):
     '''
@@ -46,56 +48,51 @@ def admin_user_remove_v1(token, u_id):
     # remove users from channel
     for channel in get_data()['channels']:
         for member in channel['all_members']:
-            if member['u_id'] == u_id:
-                channel['all_members'].remove(member)
+            if member == u_id:
+                remove_channel_member(channel, member)
         for owner in channel['owner_members']:
-            if owner['u_id'] == u_id:
-                channel['owner_members'].remove(owner)
+            if owner == u_id:
+                remove_channel_owner(channel, owner)
         # replace the message they sent in the channel to be 'Removed user'
         for message in channel['messages']:
             if message['u_id'] == u_id:
-                message['message'] = 'Removed user'
+                set_message_text(message, 'Removed user')
         save()
 
     # remove users from dm
     for dm in get_data()['dms']:    
         for member in dm['members']:
-            if member['u_id'] == u_id:
-                dm['members'].remove(member)
-        if len(dm['creator']) > 0:
-            if dm['creator']['u_id'] == u_id:
-                dm['creator'].clear()
+            if member == u_id:
+                remove_dm_member(dm, member)
+        if dm['creator'] is not None:
+            if dm['creator'] == u_id:
+                clear_dm_creator(dm)
         # replace the message they sent in dm to be 'Removed user'
         for message in dm['messages']:
             if message['u_id'] == u_id:
-                message['message'] = 'Removed user'
-        save()
-    
-    # the contents of the messages they sent will be replaced by 'Removed user'
-    for message in get_data()['messages']:
-        if message['u_id'] == u_id:
-            message['message'] = 'Removed user'
+                set_message_text(message, 'Removed user')
         save()
 
     for user in get_data()['users']:
         if user['auth_user_id'] == u_id:
             # the user will not be included by user/all
-            user['is_removed'] = True
+            mark_user_removed(user)
             # name_first should be 'Removed' and name_last should be 'user'.
             user['name_first'] = 'Removed'
             user['name_last'] = 'user'
             # user's email and handle is set to be empty 
             # so that it can be reusable.
-            user['handle_str'] = ''
-            user['email'] = ''
+            set_user_handle(user, '')
+            set_user_email(user, '')
             user['profile_img_url'] = ''
             user['time_stamp'] = ''
-            user['all_notifications'] = []
+            clear_notifications(user)
             user['channels_joined'].clear()
             user['dms_joined'].clear()
             user['messages_sent'].clear()
             # invalidate user's token
-            user['session_list'].clear()
+            clear_sessions(user)
+            forget_tokens(u_id)
             save()
     return {}
 
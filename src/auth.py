@@ -7,11 +7,12 @@ import random
 import smtplib 
 import hashlib
 import time
-from src.data_store import get_data, save
+from src.data_store import get_data, save, lookup, insert_user, add_session, remove_session
+from src.data_store import transaction, touch_user
 from src.error import InputError, AccessError
 from src.helper import auth_register_handle_generator
 from src.server_helper import generate_token, generate_sess_id
-from src.server_helper import decode_token, decode_token_session_id, valid_user
+from src.server_helper import decode_token, decode_token_session_id, valid_user, forget_tokens
 
 def auth_login_v2(email, password):
     '''
@@ -29,18 +30,18 @@ def auth_login_v2(email, password):
         Returns <{auth_user_id, token}> when user successfully logins into Streams
     '''
 
-    # Iterate through the users list
-    for user in get_data()['users']:
-        # If the email and password the user inputs to login match and exist in data_store
-        if (user['email'] == email) and (user['password'] == hashlib.sha256(password.encode()).hexdigest()):
-            session_id = generate_sess_id()
-            user['session_list'].append(session_id)
-            auth_user_id = user['auth_user_id']
-            save()
-            return {
-                'token': generate_token(auth_user_id, session_id),
-                'auth_user_id': auth_user_id
-            }
+    # Find the user registered with this email
+    user = lookup('emails', email)
+    # If the email and password the user inputs to login match and exist in data_store
+    if user is not None and user['password'] == hashlib.sha256(password.encode()).hexdigest():
+        session_id = generate_sess_id()
+        add_session(user, session_id)
+        auth_user_id = user['auth_user_id']
+        save()
+        return {
+            'token': generate_token(auth_user_id, session_id),
+            'auth_user_id': auth_user_id
+        }
     raise InputError(description='Email and/or password is not valid!')
 
 def auth_logout_v1(token):
@@ -63,11 +64,10 @@ def auth_logout_v1(token):
 
     auth_user_id = decode_token(token)
     session_id = decode_token_session_id(token)
-    for user in get_data()['users']:
-        if user['auth_user_id'] == auth_user_id:
-            # invalidate the user's token and session_id
-            user['session_list'].remove(session_id)
-            save()
+    # invalidate the user's token and session_id
+    remove_session(lookup('users', auth_user_id), session_id)
+    forget_tokens(auth_user_id, session_id)
+    save()
 
     return {}
 
@@ -99,9 +99,8 @@ def auth_register_v2(email, password, name_first, name_last):
         raise InputError(description='This email is of invalid form')
 
     # Check for duplicate emails
-    for user in get_data()['users']:
-        if user['email'] == email:
-            raise InputError(description='This email address has already been registered')
+    if lookup('emails', email) is not None:
+        raise InputError(description='This email address has already been registered')
 
     # Valid Password
     if len(password) < 6:
@@ -125,8 +124,7 @@ def auth_register_v2(email, password, name_first, name_last):
     reset_code = ''
 
     # Creating handle and adding to dict_user
-    len_users = len(get_data()['users'])
-    handle = auth_register_handle_generator(name_first, name_last, len_users)
+    handle = auth_register_handle_generator(name_first, name_last)
 
     # the time when the account create
     time_created = int(time.time())
@@ -153,7 +151,7 @@ def auth_register_v2(email, password, name_first, name_last):
     img_url = str("https://cdn.pixabay.com/photo/2015/10/05/22/37/blank-profile-picture-973460_1280.png")
 
     # Then append dictionary of user email onto initial_objects
-    get_data()['users'].append({
+    insert_user({
         'email' : email,
         'password': password,
         'name_first': name_first,
@@ -209,23 +207,27 @@ def auth_passwordreset_request_v1(email):
         Returns <{}> when user successfully requests a password reset
     '''
     reset_code = ''.join(random.choice(string.ascii_uppercase + string.ascii_letters) for i in range(20)) 
-    # Get valid user
-    for user in get_data()['users']:
-        if user['email'] == email:
-            # Assign reset code
-            user['reset_code'] = reset_code
-
-            # Send email
-            mail = smtplib.SMTP('smtp.gmail.com', 587)
-            mail.ehlo()
-            mail.starttls()
-            mail.login('camel5363885@gmail.com', 'camel_password!')
-            mail.sendmail('camel5363885@gmail.com', email, reset_code)
-            mail.close
-
-            # Log them out of all sessions
-            user['session_list'].clear
-            save()
+    with transaction():
+        # Get valid user
+        user = lookup('emails', email)
+        if user is None:
+            return {}
+
+        # Assign reset code
+        user['reset_code'] = reset_code
+
+        # Log them out of all sessions
+        user['session_list'].clear
+        save()
+
+    # Send email, once the code is saved and holding no locks, since talking
+    # to the mail server may take a while
+    mail = smtplib.SMTP('smtp.gmail.com', 587)
+    mail.ehlo()
+    mail.starttls()
+    mail.login('camel5363885@gmail.com', 'camel_password!')
+    mail.sendmail('camel5363885@gmail.com', email, reset_code)
+    mail.close
    
     return {}
 
@@ -260,6 +262,7 @@ def auth_passwordreset_reset_v1(reset_code, new_password):
             new_password = hashlib.sha256(new_password.encode()).hexdigest() 
             user['password'] = new_password
             user['reset_code'] = ''
+            touch_user(user)
             save()
     
     return {}
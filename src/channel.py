@@ -2,13 +2,16 @@
 Channel implementation
 '''
 import time
+from src import config
 from src.error import InputError, AccessError
-from src.helper import check_valid_start, get_channel_details, check_valid_channel_id, user_info
+from src.helper import check_valid_start, get_channel_details, check_valid_channel_id, members_info
 from src.helper import check_valid_member_in_channel, check_channel_private, check_permision_id, get_user_details
 from src.helper import channels_create_check_valid_user, check_valid_owner, check_channel_owner_permission
-from src.helper import user_stats_update_channels
+from src.helper import user_stats_update_channels, parse_page_size
 from src.notifications import activate_notification_channel_invite
-from src.data_store import save, get_data
+from src.data_store import save, get_data, add_channel_member, remove_channel_member
+from src.data_store import add_channel_owner, remove_channel_owner, newest_messages
+from src.data_store import message_cursor, cursor_start
 from src.server_helper import decode_token, valid_user
 
 def channel_invite_v2(token, channel_id, u_id):
@@ -58,14 +61,11 @@ def channel_invite_v2(token, channel_id, u_id):
     if check_valid_member_in_channel(channel_id, u_id):
         raise InputError(description = 'u_id is already a member of the channel')
 
-    new_user = user_info(u_id)
-
-    for channel in get_data()['channels']:
-        if channel['channel_id'] == channel_id:
-            # append the new user details to all_member
-            channel['all_members'].append(new_user)
-            channel['time_stamp'] = int(time.time())
-            save()
+    # append the new user to all_member
+    channel = get_channel_details(channel_id)
+    add_channel_member(channel, u_id)
+    channel['time_stamp'] = int(time.time())
+    save()
 
     # Activate notification for invite/add
     activate_notification_channel_invite(auth_user_id, channel_id, u_id)
@@ -115,14 +115,15 @@ def channel_details_v2(token, channel_id):
         raise AccessError(description = 'Authorised user is not a member of channel with channel_id')
 
     channel_info = get_channel_details(channel_id)
+    owner_members, all_members = members_info(channel_info['owner_members'], channel_info['all_members'])
     return {
         'name': channel_info['name'],
         'is_public': channel_info['is_public'],
-        'owner_members': channel_info['owner_members'],
-        'all_members': channel_info['all_members'],
+        'owner_members': owner_members,
+        'all_members': all_members,
     }
 
-def channel_messages_v2(token, channel_id, start):
+def channel_messages_v2(token, channel_id, start=0, cursor=None, limit=None):
     
     '''
     Given a channel with ID channel_id that the authorised user is a member of,
@@ -132,10 +133,14 @@ def channel_messages_v2(token, channel_id, start):
         <token>        (<string>)   - an authorisation hash
         <channel_id>   (<int>)    - unique id of a channel
         <start>        (<int>)    - starting index of message pagination
+        <cursor>       (<string>)   - optional, next_cursor of the previous page, used
+                                        instead of start so new messages do not shift the page
+        <limit>        (<int>)    - optional, number of messages per page instead of 50
 
     Exceptions:
         InputError  - Occurs when channel_id does not refer to a valid channel
                     - Occurs when start is greater than the total number of messages in the channel
+                    - Occurs when cursor is invalid or limit is not between 1 and the page cap
 
         AccessError - Occurs when the auth_user_id input is not a valid type
                     - Occurs when the auth_user_id doesn't refer to a valid user
@@ -148,6 +153,7 @@ def channel_messages_v2(token, channel_id, start):
         Returns <start> of valid channel requested by authorised user with valid starting index
         Returns <end> of valid channel requested by authorised user with valid starting index,
             -1 if function has returned the least recent messages in the channel
+        Returns <next_cursor> for the next page, None if <end> is -1
     '''
 
     if not valid_user(token):
@@ -163,15 +169,20 @@ def channel_messages_v2(token, channel_id, start):
     if not check_valid_member_in_channel(channel_id, auth_user_id):
         raise AccessError(description = 'Authorised user is not a member of channel with channel_id')
 
-    for channel in get_data()['channels']:
-        if channel['channel_id'] == channel_id:
-            num_messages = len(channel['messages'])
-            message_pagination = channel['messages']
-            save()
-            
+    page_size = parse_page_size(limit)
+    if page_size is None:
+        raise InputError(description = 'Limit must be a number of messages between 1 and ' + str(config.messages_page_cap))
+
+    message_channel = get_channel_details(channel_id)
+    num_messages = len(message_channel['messages'])
+    if cursor is not None:
+        start = cursor_start(message_channel, cursor)
+        if start is None:
+            raise InputError(description = 'The cursor is invalid')
+
     # if this function has returned the least recent messages in the channel,
     # returns -1 in "end" to indicate there are no more messages to load after this return
-    end = start + 50
+    end = start + page_size
     if end >= num_messages:
         end = -1
 
@@ -179,16 +190,17 @@ def channel_messages_v2(token, channel_id, start):
     if not check_valid_start(num_messages, start):
         raise InputError(description = 'Index start is greater than the total number of messages in channel')
 
-    # Pagination 
+    # Pagination, messages are stored oldest first
     if end == -1:
-        message_pagination = message_pagination[start:]
+        message_pagination = newest_messages(message_channel, start)
     else:
-        message_pagination = message_pagination[start:end]
+        message_pagination = newest_messages(message_channel, start, end)
         
     return {
         'messages': message_pagination,
         'start': start,
         'end': end,
+        'next_cursor': message_cursor(message_channel, start, len(message_pagination)) if end != -1 else None,
     }
 
 def channel_join_v2(token, channel_id):
@@ -235,9 +247,8 @@ def channel_join_v2(token, channel_id):
     if check_valid_member_in_channel(channel_id, auth_user_id):
         raise InputError(description = 'Already a member of this channel')
 
-    new_user = user_info(auth_user_id)
     channel = get_channel_details(channel_id)
-    channel['all_members'].append(new_user)
+    add_channel_member(channel, auth_user_id)
     channel['time_stamp'] = int(time.time())
     save()
 
@@ -283,14 +294,12 @@ def channel_leave_v1(token, channel_id):
 
     channels = get_channel_details(channel_id)
     for member in channels['all_members']: 
-        if member['u_id'] == auth_user_id:
-            channels['all_members'].remove(member)
-            member['is_removed'] = True
+        if member == auth_user_id:
+            remove_channel_member(channels, member)
             save()
     for owner in channels['owner_members']: 
-        if owner['u_id'] == auth_user_id:
-            channels['owner_members'].remove(owner)
-            owner['is_removed'] = True
+        if owner == auth_user_id:
+            remove_channel_owner(channels, owner)
             save()
 
     # For user/stats, append new stat in 'channels_joined'
@@ -348,11 +357,8 @@ def channel_addowner_v1(token, channel_id, u_id):
     if check_valid_owner(u_id, channel_id):
         raise InputError(description = 'User is already an owner of the channel')
    
-    user = user_info(u_id)
-
-    for channels in get_data()['channels']:
-        channels['owner_members'].append(user)
-        save()
+    add_channel_owner(get_channel_details(channel_id), u_id)
+    save()
 
     return {}
 
@@ -405,9 +411,6 @@ def channel_removeowner_v1(token, channel_id, u_id):
     if len(channel['owner_members']) == 1:
         raise InputError(description = 'The u_id refers to a user who is currently the only owner of the channel')
     
-    for channel in get_data()['channels']:
-        for owner in channel['owner_members']:
-            if owner['u_id'] == u_id:
-                channel['owner_members'].remove(owner)
-                save()
+    remove_channel_owner(channel, u_id)
+    save()
     return {}
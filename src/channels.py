@@ -2,9 +2,9 @@
 Channels implementation
 '''
 import time
-from src.data_store import get_data, save
+from src.data_store import get_data, save, members, insert_channel
 from src.error import InputError, AccessError
-from src.helper import user_info, get_channel_member, user_stats_update_channels
+from src.helper import get_channel_details, user_stats_update_channels
 from src.helper import users_stats_update_channels
 from src.server_helper import decode_token, valid_user
 
@@ -30,9 +30,11 @@ def channels_list_v2(token):
     
     auth_user_id = decode_token(token)
     new_list = []
-    for channel in get_data()['channels']:
-        if get_channel_member(auth_user_id, channel):
-            new_list.append({'channel_id' : channel['channel_id'], 'name': channel['name']})
+    # channel_ids are handed out in increasing order, so sorting them
+    # lists the channels in the order they were created
+    for channel_id in sorted(members('user_channels', auth_user_id)):
+        channel = get_channel_details(channel_id)
+        new_list.append({'channel_id' : channel['channel_id'], 'name': channel['name']})
 
     # return to the new list
     return {
@@ -103,14 +105,13 @@ def channels_create_v2(token, name, is_public):
     # generate channel_id according the number of existing channels
     channel_id = len(channels) + 1
 
-    user = user_info(auth_user_id)
     is_active = False
-    get_data()['channels'].append({
+    insert_channel({
         'channel_id': channel_id,
         'name': name,
         'is_public': bool(is_public),
-        'owner_members': [user],
-        'all_members': [user],
+        'owner_members': [auth_user_id],
+        'all_members': [auth_user_id],
         'messages': [],
         'time_stamp': time_created,
         'standup':  {
@@ -1,3 +1,74 @@
 port = 8048
 
 url = f"http://localhost:{port}/"
+
+# Persistence
+# 'wal' keeps the store in database_path and wal_path, 'sqlite' keeps it
+# in an SQLite database at sqlite_path
+storage_backend = 'wal'
+sqlite_path = 'database.db'
+database_path = 'database.json'
+wal_path = 'database.log'
+# Format the snapshot is written in: 'json', or 'binary' and 'binary-zlib'
+# which load and save faster, see src/snapshot.py. A snapshot in any format
+# is read back, so this can be changed on an existing database
+snapshot_format = 'json'
+# Size in bytes at which the log is folded into a new snapshot, or at which
+# the SQLite oplog is emptied
+wal_compact_size = 4 * 1024 * 1024
+# How the changes made by a request reach the disk:
+#   'sync'   written and fsynced by the request before it returns
+#   'group'  written and fsynced by a background flusher, in one write
+#            shared with every request that finished in the meantime. The
+#            request waits for that write before it returns
+#   'async'  written by the background flusher without fsync, the request
+#            does not wait. A crash can lose the last few writes
+durability = 'group'
+# Milliseconds the flusher waits for more requests to join a write
+group_commit_ms = 2
+# Set when several server processes share one database, so each request
+# first picks up changes the other processes wrote to the log. Writes are
+# then always made as with 'sync' durability
+detect_external_changes = False
+
+# Authentication
+# Number of verified tokens remembered so they are not decoded again
+token_cache_size = 4096
+
+# Pagination
+# Number of messages channel/messages and dm/messages return by default,
+# and the most a client may ask for
+messages_page_size = 50
+messages_page_cap = 500
+
+# Locks shared out between channels, DMs and users, requests on records
+# with different locks run in parallel
+store_lock_stripes = 64
+# Adds an X-Store-Concurrency header to every response, the most requests
+# seen holding their locks at once while this one held its own. Only meant
+# for tests, it is left off in production
+concurrency_header = False
+
+# Event streams
+# Events queued for a stream before its client is judged too slow to keep
+# up and the stream is closed
+events_queue_size = 256
+# Seconds between keep-alive comments on an idle stream, which is also how
+# soon a stream notices its client went away or logged out
+events_keepalive_seconds = 15
+
+# Notifications
+# Newest notifications kept for each user, older ones are dropped. Should
+# be at least the 20 that notifications/get returns
+notifications_retention = 20
+
+# Stats
+# Changes to a user/stats or users/stats total made within this many
+# seconds of each other share one entry, 0 gives every change its own entry
+stats_coalesce_seconds = 0
+# Entries older than age seconds are thinned to one per resolution seconds,
+# as a list of (age, resolution), e.g. [(86400, 3600), (30 * 86400, 86400)].
+# Empty keeps every entry
+stats_retention = []
+# Seconds between passes that thin out old entries
+stats_downsample_interval = 3600
@@ -1,5 +1,16 @@
-import json
-import os
+import atexit
+import bisect
+import copy
+import threading
+from contextlib import contextmanager
+from src import config
+from src.wal import WriteAheadLog
+from src.sqlite_storage import SqliteStorage
+from src.storage import TABLES
+from src.flusher import Flusher
+from src.hub import Hub
+from src.locks import StripedLocks, SharedLock
+from src.search_index import SearchIndex
 
 '''
 data_store.py
@@ -30,24 +41,1089 @@ Example usage:
 ## YOU SHOULD MODIFY THIS OBJECT BELOW
 initial_object = {
     'users': [],            # list of dictionaries of users
-    'channels': [],         # list of dictionaries of channels
-    'messages': [],         # list of dictionaries of messages
+    'channels': [],         # list of dictionaries of channels, holding their messages
     'dms': [],              # list of dictionaries of dms 
     'complete_dms': [],     # list of dictionaries of complete dms
     'workspace_stats': {},   # workspace_stats
+    'scheduled_messages': [],   # list of dictionaries of messages to send later
+    'message_ids_issued': 0,    # number of message ids handed out so far
+    'message_order': 'oldest_first',    # messages are appended, the newest is last
+    'member_refs': 'u_id',      # channels and DMs list their members by u_id
+    'cancelled_scheduled': 'removed',   # cancelled scheduled messages are removed
+    'notifications': [],        # notifications, shared by every user they were sent to
+    'notification_ids_issued': 0,   # number of notification ids handed out so far
+    'dm_ids_issued': 0,         # number of dm ids handed out so far
 }
 
+# Returns how many message ids a database written before
+# message_ids_issued existed has handed out
+def count_message_ids(store):
+    records = store.get('messages', [])
+    message_ids = [record['message_id'] for record in records + store['scheduled_messages']]
+    for container in store['channels'] + store['dms']:
+        message_ids += [message['message_id'] for message in container['messages']]
+    count = len(records) + len(store['scheduled_messages'])
+    if message_ids:
+        count = max(count, max(message_ids) // 2 + 1)
+    return count
+
+# Databases written before message_order existed keep the newest message
+# first, their message lists are turned around
+def reverse_message_lists(store):
+    for container in store['channels'] + store['dms']:
+        container['messages'].reverse()
+    return 'oldest_first'
+
+# Databases written before member_refs existed hold a copy of each member's
+# profile in channels and DMs, which are replaced by the member's u_id
+def member_profiles_to_u_ids(store):
+    for channel in store['channels']:
+        channel['all_members'] = [member['u_id'] for member in channel['all_members']]
+        channel['owner_members'] = [owner['u_id'] for owner in channel['owner_members']]
+    for dm in store['dms']:
+        dm['members'] = [member['u_id'] for member in dm['members']]
+        dm['creator'] = dm['creator']['u_id'] if len(dm['creator']) > 0 else None
+    return 'u_id'
+
+# Databases written before cancelled_scheduled existed keep cancelled
+# scheduled messages around, flagged with is_cancelled. They are removed, and
+# the flag dropped from the ones still waiting to be sent
+def remove_cancelled_scheduled(store):
+    store['scheduled_messages'] = [
+        scheduled for scheduled in store['scheduled_messages'] if not scheduled.get('is_cancelled')
+    ]
+    for scheduled in store['scheduled_messages']:
+        scheduled.pop('is_cancelled', None)
+    return 'removed'
+
+# Databases written before notifications existed hold a copy of each
+# notification in every user it was sent to, newest first. Each user keeps
+# the ids of their newest notifications instead, oldest first
+def share_notifications(store):
+    notifications = []
+    for user in store['users']:
+        kept = user['all_notifications'][:config.notifications_retention]
+        user['all_notifications'] = []
+        for notification in reversed(kept):
+            notification = dict(notification, notification_id=len(notifications))
+            notifications.append(notification)
+            user['all_notifications'].append(notification['notification_id'])
+    return notifications
+
+# Returns how many notification ids have been handed out
+def count_notification_ids(store):
+    return max([notification['notification_id'] + 1 for notification in store['notifications']], default=0)
+
+# Returns how many dm ids a database written before dm_ids_issued existed
+# has handed out, as far as the DMs left in it tell
+def count_dm_ids(store):
+    return max([dm['dm_id'] for dm in store['dms']], default=0)
+
+# Collections added after the first databases were written, filled in
+# when an older database is loaded. A function is called with the store
+# to work the value out
+DEFAULTS = {
+    'scheduled_messages': [],
+    'message_ids_issued': count_message_ids,
+    'message_order': reverse_message_lists,
+    'member_refs': member_profiles_to_u_ids,
+    'cancelled_scheduled': remove_cancelled_scheduled,
+    'notifications': share_notifications,
+    'notification_ids_issued': count_notification_ids,
+    'dm_ids_issued': count_dm_ids,
+}
+
+# Collections older databases have that are no longer used, dropped when
+# such a database is loaded
+RETIRED = [
+    'messages',     # copies of every message, the channel/DM messages are used instead
+]
+
 ##### Persistence #####
+# The store lives in memory and is only read from disk once, on startup.
+# Each commit writes out the records changed since the last one, to the
+# backend chosen by config.storage_backend, see src/storage.py
+
+# Returns the storage backend chosen in the config
+def open_storage():
+    wal = WriteAheadLog(config.database_path, config.wal_path, config.wal_compact_size,
+                        config.snapshot_format)
+    if config.storage_backend == 'sqlite':
+        # A database kept in database.json is moved over on first startup
+        return SqliteStorage(config.sqlite_path, config.wal_compact_size, legacy=wal)
+    return wal
+
+STORAGE = open_storage()
+
+# Writes out batches of changes staged by units of work, under the 'group'
+# and 'async' config.durability
+def write_batches(batches):
+    STORAGE.fsync = config.durability != 'async'
+    try:
+        STORAGE.write(batches)
+    except Exception:
+        # The changes are already part of the last committed state, so only
+        # writing the whole store out again gets them to disk
+        STORAGE.needs_compact = True
+        raise
+
+# Writes the whole store out again when the backend asks for it, run by the
+# flusher thread after each write
+def compact_if_needed():
+    if STORAGE.needs_compact:
+        with STORE_LOCK.exclusive():
+            FLUSHER.drain()
+            if STORAGE.needs_compact:
+                STORAGE.compact(initial_object)
+
+FLUSHER = Flusher(write_batches, config.group_commit_ms / 1000, compact_if_needed)
+# Changes still queued under 'async' durability are written before exit
+atexit.register(FLUSHER.drain)
+
+# Total number of times the store has been written out
+FLUSH_COUNT = 0
+
+# The unit of work open on the current thread, if any
+TRANSACTION = threading.local()
+
+##### Locking #####
+# A unit of work names the channels, DMs and users it works on, e.g.
+# ('channel', 1), and holds their stripes until it has been written out, so
+# units on different records run in parallel. Units that name no records
+# hold STORE_LOCK on their own instead, as does anything reading or
+# replacing the whole store, such as flushing it
+STRIPES = StripedLocks(config.store_lock_stripes)
+STORE_LOCK = SharedLock()
+
+# Short global lock around the id counters and totals shared by every
+# channel, DM and user, never held while waiting on another lock
+COUNTER_LOCK = threading.Lock()
+
+# Number of units of work holding their stripes or the whole store right now
+OPEN_UNITS = 0
+
+# Table holding the records each kind of stripe key names
+KEY_TABLES = {
+    'channel': 'channels',
+    'dm': 'dms',
+    'user': 'users',
+}
+
+##### Change tracking #####
+# Each unit of work collects the records it may have changed as (table path,
+# key) marks, e.g. (('users', ), 1) or (('channels', 2, 'messages'), 5). A
+# record is marked when it is looked up, when it is changed through one of
+# the functions below, or when the unit holds its stripe. Flushing compares
+# only the marked records against the last commit, and rolling back puts
+# only those back, so neither costs more as the store grows. Work that
+# changes records it found by walking a whole table calls touch_all()
+
+# Marks of the units of work that have ended since the last flush
+CHANGES = set()
+
+# Mark standing for every record in the store
+EVERYTHING = ((), None)
+
+# Index holding the records of each top level table
+TABLE_INDEXES = {
+    'users': 'users',
+    'channels': 'channels',
+    'dms': 'dms',
+    'scheduled_messages': 'scheduled',
+    'notifications': 'notifications',
+}
+
+# Table of the records each lookup index finds
+INDEX_TABLES = {
+    'users': 'users',
+    'emails': 'users',
+    'handles': 'users',
+    'sessions': 'users',
+    'channels': 'channels',
+    'dms': 'dms',
+    'scheduled': 'scheduled_messages',
+    'notifications': 'notifications',
+}
+
 def get_data():
-    global initial_object
-    if os.path.exists('database.json'):
-        initial_object = json.load(open('database.json', 'r'))
     return initial_object
 
+# Inside a unit of work save() only marks the store dirty, the store is
+# written once when the unit of work commits
 def save():
+    if getattr(TRANSACTION, 'depth', 0) > 0:
+        TRANSACTION.dirty = True
+        return
+    # Changes made outside a unit of work were not tracked
+    touch_all()
+    wait_written(flush())
+
+# Writes every change since the last flush to disk, or hands them to the
+# flusher following config.durability
+# Returns the flusher's ticket for the changes, None if they were written
+def flush():
+    global initial_object, FLUSH_COUNT
+    ticket = None
+    with STORE_LOCK.exclusive():
+        FLUSH_COUNT += 1
+        if config.detect_external_changes:
+            # Catch up with other processes first so the log stays in order,
+            # which needs the write to happen under the same lock
+            FLUSHER.drain()
+            with STORAGE.lock():
+                catch_up()
+                commit_now()
+        elif config.durability == 'sync':
+            FLUSHER.drain()
+            commit_now()
+        else:
+            batch = STORAGE.stage(initial_object, take_changes())
+            if batch is not None:
+                ticket = FLUSHER.submit(batch)
+    return ticket
+
+# Writes the changes out on the current thread
+def commit_now():
+    STORAGE.fsync = config.durability != 'async'
+    STORAGE.commit(initial_object, take_changes())
+
+# Under 'group' durability, blocks until the changes with a ticket from
+# flush() have been written out. Raises WriteFailed if that write failed, so
+# the request fails rather than reporting changes that are not on disk
+def wait_written(ticket):
+    if ticket is not None and config.durability == 'group':
+        FLUSHER.wait(ticket)
+
+# Picks up changes written to disk by other server processes
+def refresh():
+    if config.detect_external_changes:
+        with STORE_LOCK.exclusive(), STORAGE.lock():
+            catch_up()
+
+# Applies commits made by other processes, the caller holds STORAGE.lock()
+def catch_up():
+    global initial_object
+    seq = STORAGE.seq
+    store = STORAGE.refresh(initial_object)
+    if store is not initial_object or STORAGE.seq != seq:
+        initial_object = store
+        upgrade(initial_object)
+        rebuild_indexes()
+
+# Recovers the store from the snapshot and log on startup
+def load():
     global initial_object
-    with open('database.json', 'w') as FILE:
-        json.dump(initial_object, FILE)
+    initial_object = STORAGE.recover(initial_object)
+    upgrade(initial_object)
+    rebuild_indexes()
+
+# Brings a store written by an older version up to date. The result is
+# written out as a new snapshot straight away, so later commits are never
+# replayed onto the old layout
+def upgrade(store):
+    # Defaults may be worked out from retired collections, so they go first
+    filled = fill_defaults(store)
+    retired = [key for key in RETIRED if key in store]
+    for key in retired:
+        del store[key]
+    if filled or retired or STORAGE.needs_compact:
+        STORAGE.reset_baseline(store)
+        STORAGE.compact(store)
+
+# Adds any collection an older database does not have yet
+# Returns true if something was added
+def fill_defaults(store):
+    missing = [key for key in DEFAULTS if key not in store]
+    for key in missing:
+        if callable(DEFAULTS[key]):
+            store[key] = DEFAULTS[key](store)
+        else:
+            store[key] = copy.deepcopy(DEFAULTS[key])
+    return len(missing) > 0
+
+##### Unit of work #####
+# Opens a unit of work on the current thread working on the records named
+# by keys, or on the whole store if keys is None. Nested calls join the
+# outer one and take no further locks
+def begin(keys=None):
+    if getattr(TRANSACTION, 'depth', 0) == 0:
+        if keys is None:
+            STORE_LOCK.acquire()
+            refresh()
+            TRANSACTION.concurrency = count_open_units(1)
+        else:
+            refresh()
+            TRANSACTION.stripes = STRIPES.acquire(keys)
+            TRANSACTION.concurrency = count_open_units(1)
+            STORE_LOCK.acquire_shared()
+        TRANSACTION.keys = None if keys is None else list(keys)
+        # The records under the unit's stripes are always compared
+        TRANSACTION.changes = {((KEY_TABLES[kind], ), key) for kind, key in TRANSACTION.keys or ()}
+        TRANSACTION.dirty = False
+        TRANSACTION.flushes = 0
+        TRANSACTION.after = []
+    TRANSACTION.depth = getattr(TRANSACTION, 'depth', 0) + 1
+
+# Closes the unit of work, flushing once if anything was saved. The
+# stripes are only let go once the changes are written out or handed to the
+# flusher, so the next unit on the same records never sees them unsaved
+def commit():
+    if getattr(TRANSACTION, 'depth', 0) == 0:
+        return
+    TRANSACTION.depth -= 1
+    if TRANSACTION.depth > 0:
+        return
+    # Handed over while the store lock is still held, so no flush is
+    # taking the marks at the same time
+    CHANGES.update(TRANSACTION.changes)
+    TRANSACTION.changes = set()
+    if TRANSACTION.keys is not None:
+        STORE_LOCK.release_shared()
+    ticket = None
+    try:
+        if TRANSACTION.dirty:
+            TRANSACTION.dirty = False
+            TRANSACTION.flushes += 1
+            ticket = flush()
+    finally:
+        release_locks()
+    # The changes are already the last committed state, so the next unit on
+    # these records can go ahead and share the write with this one
+    wait_written(ticket)
+    after, TRANSACTION.after = TRANSACTION.after, []
+    for callback, args in after:
+        callback(*args)
+
+# Closes the unit of work and undoes everything saved since it began.
+# A unit working on named records only undoes those records, since other
+# units may have changed the rest of the store in the meantime
+def rollback():
+    if getattr(TRANSACTION, 'depth', 0) == 0:
+        return
+    TRANSACTION.depth = 0
+    TRANSACTION.after = []
+    keys = TRANSACTION.keys
+    marks, TRANSACTION.changes = TRANSACTION.changes, set()
+    undone = set()
+    if TRANSACTION.dirty:
+        # Records outside the unit's stripes are left as they are, and
+        # written out by the next flush
+        undone = marks if keys is None else in_scope(marks, rollback_scope(keys))
+    CHANGES.update(marks - undone)
+    if keys is not None:
+        STORE_LOCK.release_shared()
+    try:
+        if TRANSACTION.dirty:
+            TRANSACTION.dirty = False
+            with STORE_LOCK.exclusive():
+                if EVERYTHING in marks:
+                    STORAGE.rollback(initial_object, None if keys is None else rollback_scope(keys))
+                    rebuild_indexes()
+                else:
+                    undo_changes(undone)
+    finally:
+        release_locks()
+
+# Lets go of the locks held by the unit of work on the current thread
+def release_locks():
+    TRANSACTION.concurrency = max(TRANSACTION.concurrency, count_open_units(-1) + 1)
+    if TRANSACTION.keys is None:
+        STORE_LOCK.release()
+    else:
+        STRIPES.release(TRANSACTION.stripes)
+
+# Returns the records named by stripe keys, as table name -> primary keys
+def rollback_scope(keys):
+    scope = {}
+    for kind, key in keys:
+        scope.setdefault(KEY_TABLES[kind], set()).add(key)
+    return scope
+
+# Returns the marks of records in scope, or nested in a record in scope
+def in_scope(marks, scope):
+    return {(path, key) for path, key in marks
+            if path and (key if len(path) == 1 else path[1]) in scope.get(path[0], ())}
+
+# Puts the marked records back as they were at the last commit, and brings
+# the indexes up to date. Only the messages put back are indexed again
+def undo_changes(marks):
+    changes = {}
+    for path, key in marks:
+        changes.setdefault(path, set()).add(key)
+    restored = STORAGE.rollback(initial_object, changes=changes)
+    rebuild_record_indexes()
+    for path, key, before, after in restored:
+        if len(path) == 1:
+            continue
+        if before is not None:
+            INDEXES['locations'].pop(key, None)
+            SEARCH.remove((CONTAINER_KINDS[path[0]], path[1]), key, before['message'])
+        if after is not None:
+            container = INDEXES[path[0]].get(path[1])
+            INDEXES['locations'][key] = (container, after)
+            SEARCH.add(container_key(container), key, after['message'])
+
+# Marks a record as possibly changed by the unit of work on the current
+# thread, path is its table path e.g. ('users', )
+def touch(path, key):
+    if getattr(TRANSACTION, 'depth', 0) > 0:
+        TRANSACTION.changes.add((path, key))
+    else:
+        CHANGES.add((path, key))
+
+def touch_user(user):
+    touch(('users', ), user['auth_user_id'])
+
+def touch_container(container):
+    touch(container_path(container)[:1], container_key(container)[1])
+
+def touch_message(container, message):
+    touch(container_path(container), message['message_id'])
+
+# Has the next flush compare the whole store
+def touch_all():
+    touch(*EVERYTHING)
+
+# Returns the marks handed over since the last flush as table path ->
+# {key: record, or None if it is gone}, or None if the whole store has to be
+# compared. The caller holds STORE_LOCK on its own
+def take_changes():
+    global CHANGES
+    marks, CHANGES = CHANGES, set()
+    if EVERYTHING in marks:
+        return None
+    changes = {}
+    for path, key in marks:
+        changes.setdefault(path, {})[key] = find_record(path, key)
+    return changes
+
+# Returns the record a mark stands for, or None if there is none
+def find_record(path, key):
+    if len(path) == 1:
+        return INDEXES[TABLE_INDEXES[path[0]]].get(key)
+    location = INDEXES['locations'].get(key)
+    if location is None or container_path(location[0]) != path:
+        return None
+    return location[1]
+
+# Runs callback(*args) once the unit of work on the current thread has
+# committed, or straight away outside of one. It never runs if the unit of
+# work is rolled back, e.g. a request that fails after queueing work
+def after_commit(callback, *args):
+    if getattr(TRANSACTION, 'depth', 0) == 0:
+        callback(*args)
+        return
+    TRANSACTION.after.append((callback, args))
+
+# Number of flushes made by the unit of work on the current thread
+def transaction_flushes():
+    return getattr(TRANSACTION, 'flushes', 0)
+
+# Most units of work, this one included, seen open at once when the unit of
+# work on the current thread began or ended. Units on different records
+# overlap, units on the same record never do
+def transaction_concurrency():
+    return getattr(TRANSACTION, 'concurrency', 0)
+
+# Adds change to the number of open units of work, returning the new number
+def count_open_units(change):
+    global OPEN_UNITS
+    with COUNTER_LOCK:
+        OPEN_UNITS += change
+        return OPEN_UNITS
+
+@contextmanager
+def transaction(*keys):
+    '''
+    Runs a block as one unit of work, e.g. a standup finishing in a timer
+    thread. The unit holds the locks of the channels, DMs and users named by
+    keys, or of the whole store if none are named
+
+    Example usage:
+
+        with transaction(('channel', channel_id), ('user', auth_user_id)):
+            message_send_v1(token, channel_id, message)
+    '''
+    begin(keys if keys else None)
+    try:
+        yield
+    except Exception:
+        rollback()
+        raise
+    commit()
+
+##### Indexes #####
+# Primary key lookups into the store. They are kept in sync by the insert
+# and remove functions below and rebuilt whenever the store is reloaded,
+# cleared or rolled back
+INDEXES = {
+    'users': {},        # auth_user_id -> user
+    'channels': {},     # channel_id -> channel
+    'dms': {},          # dm_id -> dm
+    'locations': {},    # message_id -> (channel or dm, message) while not removed
+    'emails': {},       # email -> user
+    'handles': {},      # handle_str -> user
+    'sessions': {},     # session_id -> user logged in with it
+    'scheduled': {},    # message_id -> record in initial_object['scheduled_messages']
+    'handle_suffixes': {},  # base handle -> lowest number that may still be free
+    # Membership indexes map an id to {other id: number of list entries}
+    'channel_members': {},      # channel_id -> {u_id: count} in all_members
+    'channel_owners': {},       # channel_id -> {u_id: count} in owner_members
+    'user_channels': {},        # u_id -> {channel_id: count} in all_members
+    'user_owned_channels': {},  # u_id -> {channel_id: count} in owner_members
+    'dm_members': {},           # dm_id -> {u_id: count} in members
+    'user_dms': {},             # u_id -> {dm_id: count} in members
+    'dm_creators': {},          # u_id -> {dm_id: 1} for each DM they created
+    'notifications': {},        # notification_id -> notification
+    'notification_refs': {},    # notification_id -> number of users holding it
+}
+
+EMPTY = {}
+
+# Text of the messages in each channel/DM, see src/search_index.py
+SEARCH = SearchIndex()
+
+# Counts kept up to date alongside the indexes, for users/stats
+COUNTERS = {
+    'active_users': 0,      # users that have not been removed
+    'engaged_users': 0,     # users in at least one channel or DM
+}
+
+# Totals that are the size of an index
+TOTALS = {
+    'messages': 'locations',
+    'channels': 'channels',
+    'dms': 'dms',
+}
+
+# Reverse membership indexes that count towards engaged_users
+ENGAGING = ('user_channels', 'user_dms')
+
+# Kind of topic the event streams of a member of each follow, see HUB
+WATCHED = {
+    'user_channels': 'channel',
+    'user_dms': 'dm',
+}
+
+# Largest session_id ever handed out, so new ones never clash with
+# sessions persisted before a restart
+NEWEST_SESSION_ID = 0
+
+# Rebuilds every index from the store
+def rebuild_indexes():
+    rebuild_record_indexes()
+    INDEXES['locations'].clear()
+    SEARCH.clear()
+    for container in initial_object['channels'] + initial_object['dms']:
+        index_messages(container)
+
+# Rebuilds every index but those of the messages, which are kept up to date
+# message by message
+def rebuild_record_indexes():
+    for name, index in INDEXES.items():
+        if name != 'locations':
+            index.clear()
+    for counter in COUNTERS:
+        COUNTERS[counter] = 0
+    for user in initial_object['users']:
+        COUNTERS['active_users'] += not user['is_removed']
+        INDEXES['users'][user['auth_user_id']] = user
+        INDEXES['emails'][user['email']] = user
+        INDEXES['handles'][user['handle_str']] = user
+        index_sessions(user)
+        for notification_id in user['all_notifications']:
+            count_notification(notification_id, 1)
+    for channel in initial_object['channels']:
+        INDEXES['channels'][channel['channel_id']] = channel
+        index_membership(channel, 1)
+    for dm in initial_object['dms']:
+        INDEXES['dms'][dm['dm_id']] = dm
+        index_membership(dm, 1)
+    for scheduled in initial_object['scheduled_messages']:
+        INDEXES['scheduled'][scheduled['message_id']] = scheduled
+    for notification in initial_object['notifications']:
+        INDEXES['notifications'][notification['notification_id']] = notification
+
+# Adds the messages of a channel or DM to the locations and search indexes
+def index_messages(container):
+    key = container_key(container)
+    for message in container['messages']:
+        INDEXES['locations'][message['message_id']] = (container, message)
+        SEARCH.add(key, message['message_id'], message['message'])
+
+# Kind of container in the search index holding each table's messages
+CONTAINER_KINDS = {'channels': 'channel', 'dms': 'dm'}
+
+# Identifies a channel or DM in the search index
+def container_key(container):
+    if 'channel_id' in container:
+        return ('channel', container['channel_id'])
+    return ('dm', container['dm_id'])
+
+# Returns the table path of the messages of a channel or DM
+def container_path(container):
+    if 'channel_id' in container:
+        return ('channels', container['channel_id'], 'messages')
+    return ('dms', container['dm_id'], 'messages')
+
+# Adds change to the count of u_id under key, and mirrors
+# whether u_id is still counted into the reverse index
+def count_member(index, key, u_id, change, reverse=None):
+    counts = INDEXES[index].setdefault(key, {})
+    count = counts.get(u_id, 0) + change
+    if count > 0:
+        counts[u_id] = count
+    else:
+        counts.pop(u_id, None)
+    if reverse is not None:
+        was_engaged = reverse in ENGAGING and is_engaged(u_id)
+        keys = INDEXES[reverse].setdefault(u_id, {})
+        was_member = key in keys
+        if count > 0:
+            keys[key] = count
+        else:
+            keys.pop(key, None)
+        if reverse in WATCHED and was_member != (count > 0):
+            # The user's event streams follow the channel/DM they joined or left
+            after_commit(HUB.watch if count > 0 else HUB.unwatch, u_id, (WATCHED[reverse], key))
+        if reverse in ENGAGING:
+            with COUNTER_LOCK:
+                COUNTERS['engaged_users'] += is_engaged(u_id) - was_engaged
+
+# Returns true if u_id is a member of at least one channel or DM
+def is_engaged(u_id):
+    return any(INDEXES[index].get(u_id) for index in ENGAGING)
+
+# Counts the members, owners and creator of a channel or DM into the
+# membership indexes, change is 1 to add them and -1 to take them out
+def index_membership(container, change):
+    if 'channel_id' in container:
+        channel_id = container['channel_id']
+        for u_id in container['all_members']:
+            count_member('channel_members', channel_id, u_id, change, 'user_channels')
+        for u_id in container['owner_members']:
+            count_member('channel_owners', channel_id, u_id, change, 'user_owned_channels')
+    else:
+        dm_id = container['dm_id']
+        for u_id in container['members']:
+            count_member('dm_members', dm_id, u_id, change, 'user_dms')
+        if container['creator'] is not None:
+            count_member('dm_creators', container['creator'], dm_id, change)
+
+def lookup(index, key):
+    '''
+    Finds a record by its primary key
+
+    Arguments:
+        <index>   (<string>)   - one of 'users', 'channels', 'dms', 'locations' or 'scheduled'
+        <key>     (<int>)      - the id of the record
+
+    Return Value:
+        Returns the record, or None if there is no record with that id
+    '''
+    try:
+        found = INDEXES[index].get(key)
+    except TypeError:
+        # Ids taken straight from a request body may not be hashable
+        return None
+    # A record looked up inside a unit of work may be changed by it
+    if found is not None and getattr(TRANSACTION, 'depth', 0) > 0:
+        if index == 'locations':
+            touch_container(found[0])
+            touch_message(*found)
+        else:
+            table = INDEX_TABLES[index]
+            touch((table, ), found[TABLES[table]['key']])
+    return found
+
+def members(index, key):
+    '''
+    Finds the ids related to key in a membership index
+
+    Arguments:
+        <index>   (<string>)   - one of the membership indexes, e.g. 'channel_members'
+        <key>     (<int>)      - the id to look up
+
+    Return Value:
+        Returns a dict keyed by the related ids, which may be empty. It
+        must not be modified
+    '''
+    try:
+        return INDEXES[index].get(key, EMPTY)
+    except TypeError:
+        return EMPTY
+
+def newest_messages(container, start, end=None):
+    '''
+    Pages through the messages of a channel or DM, newest first
+
+    Arguments:
+        <container>   (<dict>)   - the channel or DM
+        <start>       (<int>)    - index of the first message, 0 is the newest
+        <end>         (<int>)    - index after the last message, None for all the rest
+
+    Return Value:
+        Returns a list of the messages between start and end
+    '''
+    messages = container['messages']
+    stop = len(messages) - start
+    first = 0 if end is None else max(len(messages) - end, 0)
+    if stop <= first:
+        return []
+    return messages[first:stop][::-1]
+
+def message_cursor(container, start, count):
+    '''
+    Makes the cursor for the page after the count messages from start,
+    see newest_messages
+
+    Return Value:
+        Returns a string to pass back as the cursor, or None if those were
+        the oldest messages
+    '''
+    index = len(container['messages']) - start - count
+    if index <= 0:
+        return None
+    return f"{index}:{container['messages'][index]['message_id']}"
+
+def cursor_start(container, cursor):
+    '''
+    Works out where the page following a cursor made by message_cursor
+    starts. The cursor holds the index of the oldest message of the last
+    page counted from the oldest message, which new messages do not move,
+    and that message's id in case older messages were removed since
+
+    Return Value:
+        Returns the start index for newest_messages, or None if the cursor
+        is not valid
+    '''
+    try:
+        index, message_id = (int(part) for part in str(cursor).split(':'))
+    except ValueError:
+        return None
+    messages = container['messages']
+    if index < 0:
+        return None
+    location = INDEXES['locations'].get(message_id)
+    if location is not None and location[0] is container:
+        # Removing older messages can only move it towards the front
+        for iterate_index in range(min(index, len(messages) - 1), -1, -1):
+            if messages[iterate_index]['message_id'] == message_id:
+                return len(messages) - iterate_index
+    # The message was removed, carry on from where it was
+    return len(messages) - min(index, len(messages))
+
+def search_messages(container, query):
+    '''
+    Finds the messages of a channel or DM containing query, ignoring case
+
+    Arguments:
+        <container>   (<dict>)     - the channel or DM to search
+        <query>       (<string>)   - the text to search for
+
+    Return Value:
+        Yields each matching message in no particular order
+    '''
+    query = query.lower()
+    for message_id in SEARCH.candidates(container_key(container), query):
+        # Searches do not hold the channel/DM, so the message may have been
+        # removed since
+        location = INDEXES['locations'].get(message_id)
+        if location is not None and query in location[1]['message'].lower():
+            yield location[1]
+
+def total(name):
+    '''
+    Counts users, channels, DMs or messages without going through the store
+
+    Arguments:
+        <name>   (<string>)   - 'active_users', 'engaged_users', 'messages',
+                                'channels' or 'dms'
+
+    Return Value:
+        Returns the current count
+    '''
+    if name in COUNTERS:
+        return COUNTERS[name]
+    return len(INDEXES[TOTALS[name]])
+
+def insert_user(user):
+    initial_object['users'].append(user)
+    touch_user(user)
+    COUNTERS['active_users'] += not user['is_removed']
+    INDEXES['users'][user['auth_user_id']] = user
+    INDEXES['emails'][user['email']] = user
+    INDEXES['handles'][user['handle_str']] = user
+    index_sessions(user)
+
+# Adds the sessions of a user to the sessions index
+def index_sessions(user):
+    global NEWEST_SESSION_ID
+    for session_id in user['session_list']:
+        INDEXES['sessions'][session_id] = user
+        NEWEST_SESSION_ID = max(NEWEST_SESSION_ID, session_id)
+
+def add_session(user, session_id):
+    global NEWEST_SESSION_ID
+    user['session_list'].append(session_id)
+    touch_user(user)
+    INDEXES['sessions'][session_id] = user
+    NEWEST_SESSION_ID = max(NEWEST_SESSION_ID, session_id)
+
+def remove_session(user, session_id):
+    user['session_list'].remove(session_id)
+    touch_user(user)
+    if INDEXES['sessions'].get(session_id) is user:
+        del INDEXES['sessions'][session_id]
+
+# Logs a user out of every session
+def clear_sessions(user):
+    for session_id in user['session_list']:
+        if INDEXES['sessions'].get(session_id) is user:
+            del INDEXES['sessions'][session_id]
+    user['session_list'].clear()
+    touch_user(user)
+
+def newest_session_id():
+    return NEWEST_SESSION_ID
+
+# Marks a user as removed from Streams
+def mark_user_removed(user):
+    if not user['is_removed']:
+        COUNTERS['active_users'] -= 1
+    user['is_removed'] = True
+    touch_user(user)
+
+# Changes a user's email, keeping the email index in sync
+def set_user_email(user, email):
+    if INDEXES['emails'].get(user['email']) is user:
+        del INDEXES['emails'][user['email']]
+    user['email'] = email
+    touch_user(user)
+    INDEXES['emails'][email] = user
+
+# Changes a user's handle, keeping the handle index in sync
+def set_user_handle(user, handle_str):
+    old_handle = user['handle_str']
+    if INDEXES['handles'].get(old_handle) is user:
+        del INDEXES['handles'][old_handle]
+        release_handle_suffix(old_handle)
+    user['handle_str'] = handle_str
+    touch_user(user)
+    INDEXES['handles'][handle_str] = user
+
+# Returns the lowest number n for which base + str(n) is not taken
+def next_handle_suffix(base):
+    num = INDEXES['handle_suffixes'].get(base, 0)
+    while base + str(num) in INDEXES['handles']:
+        num += 1
+    INDEXES['handle_suffixes'][base] = num
+    return num
+
+# A freed handle such as 'annalee3' makes suffix 3 of 'annalee' free again.
+# The digits could belong to the base as well, so every split is tried
+def release_handle_suffix(handle_str):
+    suffixes = INDEXES['handle_suffixes']
+    for i in range(len(handle_str)):
+        base, digits = handle_str[:i], handle_str[i:]
+        if base in suffixes and digits.isdigit() and str(int(digits)) == digits:
+            suffixes[base] = min(suffixes[base], int(digits))
+
+def insert_channel(channel):
+    initial_object['channels'].append(channel)
+    touch_container(channel)
+    INDEXES['channels'][channel['channel_id']] = channel
+    index_messages(channel)
+    index_membership(channel, 1)
+
+def insert_dm(dm):
+    initial_object['dms'].append(dm)
+    touch_container(dm)
+    INDEXES['dms'][dm['dm_id']] = dm
+    index_messages(dm)
+    index_membership(dm, 1)
+
+def remove_dm(dm):
+    initial_object['dms'].remove(dm)
+    touch_container(dm)
+    INDEXES['dms'].pop(dm['dm_id'], None)
+    for message in dm['messages']:
+        touch_message(dm, message)
+        INDEXES['locations'].pop(message['message_id'], None)
+        SEARCH.remove(container_key(dm), message['message_id'], message['message'])
+    index_membership(dm, -1)
+
+# Channels and DMs list their members by u_id, profiles are looked up
+# from the users index when a response is built
+def add_channel_member(channel, u_id):
+    channel['all_members'].append(u_id)
+    touch_container(channel)
+    count_member('channel_members', channel['channel_id'], u_id, 1, 'user_channels')
+
+def remove_channel_member(channel, u_id):
+    channel['all_members'].remove(u_id)
+    touch_container(channel)
+    count_member('channel_members', channel['channel_id'], u_id, -1, 'user_channels')
+
+def add_channel_owner(channel, u_id):
+    channel['owner_members'].append(u_id)
+    touch_container(channel)
+    count_member('channel_owners', channel['channel_id'], u_id, 1, 'user_owned_channels')
+
+def remove_channel_owner(channel, u_id):
+    channel['owner_members'].remove(u_id)
+    touch_container(channel)
+    count_member('channel_owners', channel['channel_id'], u_id, -1, 'user_owned_channels')
+
+def remove_dm_member(dm, u_id):
+    dm['members'].remove(u_id)
+    touch_container(dm)
+    count_member('dm_members', dm['dm_id'], u_id, -1, 'user_dms')
+
+def clear_dm_creator(dm):
+    if dm['creator'] is not None:
+        count_member('dm_creators', dm['creator'], dm['dm_id'], -1)
+    dm['creator'] = None
+    touch_container(dm)
+
+# Adds a message to the end of a channel or DM
+def insert_message(container, message):
+    container['messages'].append(message)
+    touch_message(container, message)
+    INDEXES['locations'][message['message_id']] = (container, message)
+    SEARCH.add(container_key(container), message['message_id'], message['message'])
+    publish_message('message_create', container, message)
+
+def remove_message(container, message):
+    container['messages'].remove(message)
+    touch_message(container, message)
+    INDEXES['locations'].pop(message['message_id'], None)
+    SEARCH.remove(container_key(container), message['message_id'], message['message'])
+    publish_message('message_remove', container, message)
+
+# Changes the text of a message in a channel or DM, keeping the search
+# index in sync
+def set_message_text(message, text):
+    location = INDEXES['locations'].get(message['message_id'])
+    if location is not None:
+        SEARCH.update(container_key(location[0]), message['message_id'], message['message'], text)
+    message['message'] = text
+    if location is not None:
+        touch_message(location[0], message)
+        publish_message('message_edit', location[0], message)
+
+# Hands out the next message_id, odd for a channel and even for a DM.
+# The count only goes up, so ids are never reused after a removal
+def allocate_message_id(is_channel):
+    with COUNTER_LOCK:
+        number = initial_object['message_ids_issued']
+        initial_object['message_ids_issued'] = number + 1
+    if is_channel:
+        return number * 2 + 1
+    return number * 2
+
+# Hands out the next dm_id, starting from 1. The count only goes up, so ids
+# are never reused after a removal
+def allocate_dm_id():
+    with COUNTER_LOCK:
+        initial_object['dm_ids_issued'] += 1
+        return initial_object['dm_ids_issued']
+
+def insert_scheduled(scheduled):
+    initial_object['scheduled_messages'].append(scheduled)
+    touch(('scheduled_messages', ), scheduled['message_id'])
+    INDEXES['scheduled'][scheduled['message_id']] = scheduled
+
+def remove_scheduled(scheduled):
+    initial_object['scheduled_messages'].remove(scheduled)
+    touch(('scheduled_messages', ), scheduled['message_id'])
+    INDEXES['scheduled'].pop(scheduled['message_id'], None)
+
+##### Notifications #####
+# A notification is stored once however many users it is sent to. Each
+# user holds the ids of their newest config.notifications_retention
+# notifications, oldest first, and the oldest is dropped to make room for
+# a new one. A notification is removed once no user holds it. The stored
+# notifications are in id order, since only NOTIFIER adds them
+
+# Adds a notification that is about to be sent to users
+def insert_notification(channel_id, dm_id, notification_message):
+    with COUNTER_LOCK:
+        notification_id = initial_object['notification_ids_issued']
+        initial_object['notification_ids_issued'] = notification_id + 1
+    notification = {
+        'notification_id': notification_id,
+        'channel_id': channel_id,
+        'dm_id': dm_id,
+        'notification_message': notification_message,
+    }
+    initial_object['notifications'].append(notification)
+    touch(('notifications', ), notification_id)
+    INDEXES['notifications'][notification_id] = notification
+    return notification
+
+# Gives user a notification, dropping their oldest if they have too many
+def deliver_notification(user, notification):
+    held = user['all_notifications']
+    held.append(notification['notification_id'])
+    touch_user(user)
+    count_notification(notification['notification_id'], 1)
+    excess = len(held) - config.notifications_retention
+    if excess > 0:
+        for notification_id in held[:excess]:
+            count_notification(notification_id, -1)
+        del held[:excess]
+
+# Takes every notification away from user
+def clear_notifications(user):
+    for notification_id in user['all_notifications']:
+        count_notification(notification_id, -1)
+    user['all_notifications'] = []
+    touch_user(user)
+
+# Returns the newest count notifications of user, newest first
+def newest_notifications(user, count):
+    held = user['all_notifications'][-count:] if count > 0 else []
+    return [INDEXES['notifications'][notification_id] for notification_id in reversed(held)]
+
+# Changes how many users hold a notification, removing it once none do
+def count_notification(notification_id, change):
+    refs = INDEXES['notification_refs']
+    refs[notification_id] = refs.get(notification_id, 0) + change
+    if refs[notification_id] > 0:
+        return
+    del refs[notification_id]
+    notification = INDEXES['notifications'].pop(notification_id, None)
+    if notification is not None:
+        notifications = initial_object['notifications']
+        # Notifications are kept in id order, so it is found without a scan
+        index = bisect.bisect_left(notifications, notification_id, key=lambda item: item['notification_id'])
+        if index < len(notifications) and notifications[index] is notification:
+            del notifications[index]
+        else:
+            notifications.remove(notification)
+        touch(('notifications', ), notification_id)
+
+##### Events #####
+# Changes to messages are streamed to the members of their channel/DM, see
+# src/events.py. Each stream is a subscription to the topics of the
+# channels and DMs its user is a member of, e.g. ('channel', 1)
+HUB = Hub(config.events_queue_size)
+
+# Streams a change to a message once the unit of work making it commits,
+# kind is e.g. 'message_create'
+def publish_message(kind, container, message):
+    topic = container_key(container)
+    # Nothing is copied for channels and DMs no one is streaming
+    if not HUB.watched(topic):
+        return
+    event = {
+        'type': kind,
+        'channel_id': container.get('channel_id', -1),
+        'dm_id': container.get('dm_id', -1),
+        'message': copy.deepcopy(message),
+    }
+    after_commit(HUB.publish, topic, event)
 
 ## YOU SHOULD MODIFY THIS OBJECT ABOVE
 
@@ -73,5 +1149,6 @@ class Datastore:
         self.__store = store
 
 print('Loading Datastore...')
+load()
 
 DATASTORE = Datastore()
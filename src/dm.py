@@ -1,13 +1,16 @@
 from re import S
 from src.server_helper import decode_token, valid_user
-from src.helper import channels_create_check_valid_user, get_handle, user_info, check_creator, check_valid_dm, get_dm_dict, check_valid_start
+from src.helper import channels_create_check_valid_user, get_handle, members_info, check_creator, check_valid_dm, get_dm_dict, check_valid_start
 from src.helper import check_valid_member_in_dm, check_valid_message, check_message_dm_tag
 from src.helper import user_stats_update_dms, user_stats_update_messages, users_stats_update_dms, users_stats_update_messages
-from src.helper import new_react, get_msg_details, get_msg_details_dm
+from src.helper import new_react, get_msg_details, generate_message_id, parse_page_size
 from src.server_helper import decode_token, valid_user
 from src.notifications import activate_notification_tag_dm, activate_notification_dm_create
 from src.error import InputError, AccessError
-from src.data_store import get_data, save
+from src.data_store import save, members, insert_dm, remove_dm, allocate_dm_id
+from src.data_store import remove_dm_member, clear_dm_creator
+from src.data_store import insert_message, newest_messages, message_cursor, cursor_start
+from src import config
 import time
 
 def dm_create_v1(token, u_ids):
@@ -36,28 +39,24 @@ def dm_create_v1(token, u_ids):
         if not channels_create_check_valid_user(u_ids[i]):
             raise InputError(description= 'any u_id in u_ids does not refer to a valid user')
 
-    complete_dms = get_data()['dms']
-    # generate dm_id according the number of existing dms
-    dm_id = len(complete_dms) + 1
+    dm_id = allocate_dm_id()
 
     # create a list that stores the handles of all the users given 
     # including creator
     handle_list = []
     creator_handle = get_handle(auth_user_id)
     handle_list.append(creator_handle)
-    creator_info = user_info(auth_user_id)
 
-    # create a list that stores member's info
-    member_list = [creator_info]
+    # create a list that stores member's u_id
+    member_list = [auth_user_id]
 
     for i in range(len(u_ids)):
         # append the handle of the users
         handle = get_handle(u_ids[i])
         handle_list.append(handle)
 
-        # append the info of the users
-        info = user_info(u_ids[i])
-        member_list.append(info)
+        # append the u_id of the users
+        member_list.append(u_ids[i])
 
     # alphabetically-sorted the handle
     handle_list.sort()
@@ -68,10 +67,10 @@ def dm_create_v1(token, u_ids):
     name = separation.join(handle_list)
 
     time_created = int(time.time())
-    get_data()['dms'].append({
+    insert_dm({
         'dm_id': dm_id,
         'name': name,
-        'creator': creator_info,
+        'creator': auth_user_id,
         'members': member_list,
         'messages': [],
         'time_stamp': time_created
@@ -115,10 +114,11 @@ def dm_list_v1(token):
     #creating the list 
     auth_user_id = decode_token(token)
     dm_list = []
-    for dm in get_data()['dms']:
-        for member in dm['members']:
-            if member['u_id'] == auth_user_id:
-                dm_list.append({'dm_id': dm['dm_id'], 'name': dm['name']})
+    # dm_ids are handed out in increasing order, so sorting them
+    # lists the DMs in the order they were created
+    for dm_id in sorted(members('user_dms', auth_user_id)):
+        dm = get_dm_dict(dm_id)
+        dm_list.append({'dm_id': dm['dm_id'], 'name': dm['name']})
 
     return {'dms':dm_list}
 
@@ -154,16 +154,13 @@ def dm_remove_v1(token, dm_id):
         raise AccessError(description= 'The user is not the original DM creator')
 
 
-    num_message = 0
-    dms = get_data()['dms']
-    for dm in dms:
-        if dm['dm_id'] == dm_id:
-            num_message = len(dm['messages'])
-            dms.remove(dm)
-            save()
-            for j in range(len(dm['members'])):
-                user_stats_update_dms(dm['members'][j]['u_id'], -1)
-                save()
+    dm = get_dm_dict(dm_id)
+    num_message = len(dm['messages'])
+    remove_dm(dm)
+    save()
+    for j in range(len(dm['members'])):
+        user_stats_update_dms(dm['members'][j], -1)
+        save()
 
     # For users/stats, append new stat in 'dms_exist'
     users_stats_update_dms(-1)
@@ -171,9 +168,8 @@ def dm_remove_v1(token, dm_id):
 
     # For users/stats, append new stat in 'num_messages_exist'
     # the messages in dm will all be removed as dm is removed
-    for i in range(0, num_message):
-        users_stats_update_messages(-1)
-        i += 1
+    if num_message > 0:
+        users_stats_update_messages(-num_message)
         save()
 
     return {}
@@ -210,9 +206,10 @@ def dm_details_v1(token, dm_id):
         raise AccessError(description="The user is not an authorised member of the DM")
 
     dm = get_dm_dict(dm_id)
+    members, = members_info(dm['members'])
     return { 
         'name': dm['name'],
-        'members': dm['members']
+        'members': members
     }
 
 def dm_leave_v1(token, dm_id):
@@ -249,13 +246,13 @@ def dm_leave_v1(token, dm_id):
 
     dm = get_dm_dict(dm_id)
     for member in dm['members']:
-        if member['u_id'] == auth_user_id: 
-            dm['members'].remove(member)
+        if member == auth_user_id: 
+            remove_dm_member(dm, member)
             save()
     # clearing the creator if the creator leaves 
-    if len(dm['creator']) > 0:
-        if dm['creator']['u_id'] == auth_user_id:
-            dm['creator'].clear()
+    if dm['creator'] is not None:
+        if dm['creator'] == auth_user_id:
+            clear_dm_creator(dm)
             save()
 
     # For user/stats, append new stat in 'dms_joined'
@@ -264,7 +261,7 @@ def dm_leave_v1(token, dm_id):
 
     return{}
 
-def dm_messages_v1(token, dm_id, start): 
+def dm_messages_v1(token, dm_id, start=0, cursor=None, limit=None): 
     '''
     Given a dm with dm_id that authorised user
     is a member, return up to 50 messages between a index "start"
@@ -276,16 +273,21 @@ def dm_messages_v1(token, dm_id, start):
         token   (<string>)  - a user's unique token 
         dm_id   (<int>)     - a user's unique dm id
         start   (<int>)     - starting index of message pagination
+        cursor  (<string>)  - optional, next_cursor of the previous page, used instead
+                              of start so new messages do not shift the page
+        limit   (<int>)     - optional, number of messages per page instead of 50
         ...
 
     Exceptions:
         InputError  - Occurs when the dm id is invalid or the token is invalid.
                     - Start is greater then total number of messages in channel 
+                    - Cursor is invalid or limit is not between 1 and the page cap
         AccessError - Occurs when the dm_id is not an authorised member of the DM 
                     - Occurs when invalid token
 
     Return Value:
         Returns end - if end is -1 then it returns the recent messages of the channel 
+        Returns next_cursor - for the next page, None if end is -1
     '''
     #not valid 
     if not valid_user(token):
@@ -301,27 +303,35 @@ def dm_messages_v1(token, dm_id, start):
     if not check_valid_member_in_dm(dm_id, auth_user_id): 
         raise AccessError(description="The user is not an authorised member of the DM")
 
+    page_size = parse_page_size(limit)
+    if page_size is None:
+        raise InputError(description="Limit must be a number of messages between 1 and " + str(config.messages_page_cap))
+
     dm = get_dm_dict(dm_id)
     num_messages = len(dm['messages'])
-    dm_pagination = dm['messages']
+    if cursor is not None:
+        start = cursor_start(dm, cursor)
+        if start is None:
+            raise InputError(description="The cursor is invalid")
 
-    end = start + 50 
+    end = start + page_size 
     if end >= num_messages: 
         end = -1
 
     # Start is greater than the total number of messages in the channel
     if not check_valid_start(num_messages, start): 
         raise InputError(description = 'Start is greater then total messages')
-    #PAGINATION 
+    #PAGINATION, messages are stored oldest first
     if end == -1: 
-        dm_pagination = dm_pagination[start:] 
+        dm_pagination = newest_messages(dm, start)
     else: 
-        dm_pagination = dm_pagination[start:end]
+        dm_pagination = newest_messages(dm, start, end)
 
     return { 
         'messages': dm_pagination,
         'start': start,
         'end': end,
+        'next_cursor': message_cursor(dm, start, len(dm_pagination)) if end != -1 else None,
     }
 
 def message_senddm_v1(token, dm_id, message):
@@ -366,7 +376,7 @@ def message_senddm_v1(token, dm_id, message):
         activate_notification_tag_dm(auth_user_id, tagged_user_list, dm_id, message)
 
     # Creating unique message_id 
-    dmsend_id = (len(get_data()['messages']) * 2) 
+    dmsend_id = generate_message_id(False)
 
     # Current time message was created and sent
     time_created = int(time.time())
@@ -379,16 +389,7 @@ def message_senddm_v1(token, dm_id, message):
                                         time_created, reacts_details, is_pinned)
 
     # Append dictionary of message details into initial_objects['dm']['messages']
-    for dm in get_data()['dms']:
-        if dm['dm_id'] == dm_id:
-            dm['messages'].insert(0, dmsend_details_dm)
-            save()
-
-    dmsend_details_msgs = get_msg_details_dm(dmsend_id, auth_user_id, message, time_created, 
-                                                    dm_id, reacts_details, is_pinned)
-
-    # Append dictionary of message details into intital_objects['messages']
-    get_data()['messages'].insert(0, dmsend_details_msgs)
+    insert_message(get_dm_dict(dm_id), dmsend_details_dm)
     save()
 
     # For user/stats, append a new stat in 'messages_sent'
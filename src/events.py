@@ -0,0 +1,82 @@
+'''
+Event stream implementation
+
+Streams changes to the messages of the channels and DMs a user is a member
+of as Server-Sent Events, so clients no longer poll channel/messages and
+dm/messages. Each event is one of message_create, message_edit,
+message_remove, message_react or message_pin, carrying the channel_id or
+dm_id (the other is -1) and the message as it is after the change.
+'''
+import json
+from src import config
+from src.data_store import HUB, members, transaction
+from src.error import AccessError
+from src.server_helper import decode_token, valid_user
+
+def events_stream_v1(token):
+    '''
+    Open a stream of changes to messages in the channels and DMs the
+    authorised user is a member of, including ones they join later
+
+    Arguments:
+        <token>        (<string>)   - an authorisation hash
+
+    Exceptions:
+        AccessError     - Occurs when token is invalid
+
+    Return Value:
+        Returns a generator of the lines of the stream
+    '''
+    if not valid_user(token):
+        raise AccessError(description='User is not valid')
+
+    auth_user_id = decode_token(token)
+
+    # The stream starts watching inside the unit of work that reads the
+    # memberships, so a join or leave committing after it finds the
+    # subscription and watches or unwatches it too
+    with transaction(('user', auth_user_id)):
+        topics = [('channel', channel_id) for channel_id in members('user_channels', auth_user_id)]
+        topics += [('dm', dm_id) for dm_id in members('user_dms', auth_user_id)]
+        subscription = HUB.subscribe(auth_user_id, topics)
+    return stream_events(token, subscription)
+
+# Yields the stream until the client goes away, logs out or falls too far
+# behind. Comment lines keep the connection open while nothing happens.
+# Members can be removed without their own lock being held, e.g. by dm/remove,
+# so events are only passed on while the user is still a member
+def stream_events(token, subscription):
+    try:
+        yield f'retry: {config.events_keepalive_seconds * 1000}\n: connected\n\n'
+        while True:
+            item = subscription.get(timeout=config.events_keepalive_seconds)
+            if subscription.closed or not valid_user(token):
+                return
+            if item is None:
+                yield ': keep-alive\n\n'
+                continue
+            event_id, event = item
+            if not is_member(subscription.u_id, event):
+                continue
+            yield format_event(event_id, event, subscription.u_id)
+    finally:
+        HUB.unsubscribe(subscription)
+
+# Returns true if u_id is a member of the channel/DM an event happened in
+def is_member(u_id, event):
+    if event['channel_id'] != -1:
+        return event['channel_id'] in members('user_channels', u_id)
+    return event['dm_id'] in members('user_dms', u_id)
+
+# Returns an event in the Server-Sent Events format, as seen by u_id
+def format_event(event_id, event, u_id):
+    message = dict(event['message'])
+    message['reacts'] = [
+        dict(react, is_this_user_reacted=u_id in react['u_ids']) for react in message.get('reacts', [])
+    ]
+    data = {
+        'channel_id': event['channel_id'],
+        'dm_id': event['dm_id'],
+        'message': message,
+    }
+    return f"id: {event_id}\nevent: {event['type']}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,172 @@
+'''
+Background flusher that writes the store's changes out in batches
+
+Each unit of work works out what it changed and hands it to the flusher,
+which writes everything handed over since its last write in one go, so many
+requests share a single write and fsync. A unit that has to know its changes
+are on disk waits for the ticket submit() gave it. While waiting it makes
+the write itself if no other thread is already making one. If the write
+holding its batch fails, wait() raises WriteFailed.
+
+Example usage:
+
+    from src.flusher import Flusher
+
+    flusher = Flusher(storage.write, interval=0.002)
+    ticket = flusher.submit(storage.stage(store))
+    flusher.wait(ticket)
+'''
+import threading
+import time
+import traceback
+
+class WriteFailed(Exception):
+    '''
+    Raised by Flusher.wait() when the write holding the batch failed
+    '''
+
+class Flusher:
+    '''
+    Batches of changes written in order by a flusher thread
+    '''
+    def __init__(self, write, interval=0, after_write=None):
+        '''
+        Arguments:
+            <write>         (<function>)   - called with a list of batches to
+                                             write them out, oldest first
+            <interval>      (<float>)      - seconds a write waits for more
+                                             batches to join it
+            <after_write>   (<function>)   - optional, called on the thread
+                                             after each write, holding no locks
+        '''
+        self.write = write
+        self.interval = interval
+        self.after_write = after_write
+        self.queue = []
+        # Tickets handed out, and the newest ticket written out
+        self.submitted = 0
+        self.written = 0
+        # Newest ticket taken off the queue to be written
+        self.taken = 0
+        # (first ticket, last ticket, reason) of each write that failed
+        self.failures = []
+        self.condition = threading.Condition()
+        # Held while batches are written, so they go out in the order they
+        # were submitted
+        self.writing = threading.Lock()
+        self.thread = None
+
+    def submit(self, batch):
+        '''
+        Queue a batch to be written after every batch before it
+
+        Return Value:
+            Returns a ticket to pass to wait()
+        '''
+        with self.condition:
+            self.queue.append(batch)
+            self.submitted += 1
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+            return self.submitted
+
+    def wait(self, ticket):
+        '''
+        Block until the batch with this ticket has been written. If no write
+        is in progress the caller makes it, taking along every batch queued
+        so far, rather than waiting for the flusher thread to be scheduled
+
+        Exceptions:
+            WriteFailed     - Occurs when the write holding the batch failed
+        '''
+        self.wait_done(ticket)
+        with self.condition:
+            for first, last, reason in self.failures:
+                if first <= ticket <= last:
+                    raise WriteFailed(f'Batch {ticket} was not written: {reason}')
+
+    # Blocks until the write holding ticket is over, whether or not it failed
+    def wait_done(self, ticket):
+        while True:
+            with self.condition:
+                if self.written >= ticket:
+                    return
+            if self.writing.acquire(blocking=False):
+                try:
+                    if self.interval > 0:
+                        time.sleep(self.interval)
+                    self.write_locked()
+                except Exception:
+                    # Same as on the flusher thread, every waiter is let go
+                    # and finds out from the failure recorded for its ticket
+                    traceback.print_exc()
+                finally:
+                    self.writing.release()
+                continue
+            with self.condition:
+                if self.written < ticket:
+                    self.condition.wait()
+
+    def drain(self):
+        '''
+        Write every batch submitted so far on the calling thread, waiting
+        for a write the flusher thread has already started
+        '''
+        with self.condition:
+            ticket = self.submitted
+        self.write_queued()
+        self.wait_done(ticket)
+
+    def pending(self):
+        '''
+        Return Value:
+            Returns the number of batches that have not been written
+        '''
+        with self.condition:
+            return self.submitted - self.written
+
+    # Writes out the batches queued so far, as one call to write
+    def write_queued(self):
+        with self.writing:
+            self.write_locked()
+
+    # Same as write_queued, for a caller already holding self.writing
+    def write_locked(self):
+        with self.condition:
+            batches, self.queue = self.queue, []
+            first, ticket = self.taken + 1, self.submitted
+            self.taken = ticket
+        try:
+            if batches:
+                self.write(batches)
+        except Exception as error:
+            # Recorded before the waiters are let go below. Only the reason
+            # is kept, the traceback would keep the batches alive
+            with self.condition:
+                self.failures.append((first, ticket, repr(error)))
+            raise
+        finally:
+            # Waiters are let go even if the write failed, it is up to write
+            # to make sure the changes are written out later
+            with self.condition:
+                self.written = max(self.written, ticket)
+                self.condition.notify_all()
+
+    # Flusher loop, writes whatever arrived during the last write and the
+    # interval after the first batch of the next one
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+            if self.interval > 0:
+                time.sleep(self.interval)
+            try:
+                self.write_queued()
+                if self.after_write is not None:
+                    self.after_write()
+            except Exception:
+                # A failed write must not stop the writes after it
+                traceback.print_exc()
@@ -2,8 +2,10 @@
 Helper functions
 '''
 import re
-import time
-from src.data_store import get_data
+from src import config
+from src.timeseries import record
+from src.data_store import get_data, lookup, members, next_handle_suffix, allocate_message_id
+from src.data_store import COUNTER_LOCK
 
 #Helper function for channels_create, channel_invite, channel_join
 #Helper function to return the specific details of users
@@ -22,32 +24,35 @@ def user_info(auth_user_id):
         'profile_img_url': user['profile_img_url']
     }
 
+# Helper function for channel/details, dm/details
+# Returns the profiles of the users in each list of u_ids. A user in more
+# than one list has their profile built once
+def members_info(*u_id_lists):
+    profiles = {}
+    members_lists = []
+    for u_ids in u_id_lists:
+        for u_id in u_ids:
+            if u_id not in profiles:
+                profiles[u_id] = user_info(u_id)
+        members_lists.append([profiles[u_id] for u_id in u_ids])
+    return members_lists
+
 #################################################
 ######### Helper functions for auth.py ##########
 #################################################
 # Helper function for auth_register
 # Creates handle from given name_first and name_last
-def auth_register_handle_generator(name_first, name_last, len_users):
+def auth_register_handle_generator(name_first, name_last):
     # Creating handle and adding to dict_user
     handle = (name_first + name_last).lower()
     handle = re.sub(r'[^a-z0-9]', '', handle)
     if len(handle) > 20:
         handle = handle[0:20]
 
-    new_len = len(handle)
-
-    # Check for duplicate handles
-    num_dup = 0
-    i = 0
-    while i < len_users:
-        user = get_data()['users'][i]
-        if user['handle_str'] == handle:
-            handle = handle[0:new_len]
-            handle = handle[0:20] + str(num_dup)
-            num_dup += 1
-            i = 0
-        else:
-            i += 1
+    # Check for duplicate handles, a taken handle gets the
+    # lowest free number appended, i.e. handle0, handle1, ...
+    if lookup('handles', handle) is not None:
+        handle = handle + str(next_handle_suffix(handle))
     return str(handle)
 
 #################################################
@@ -62,10 +67,7 @@ def channels_create_check_valid_user(auth_user_id):
     '''
     return type: bool
     '''
-    for user in get_data()['users']:
-        if user['auth_user_id'] == auth_user_id:
-            return True
-    return False
+    return lookup('users', auth_user_id) is not None
 
 # Helper function for helper user_info
 # Access the details of the given auth_user_id
@@ -74,9 +76,7 @@ def get_user_details(auth_user_id):
     '''
     return type: dict
     '''
-    for user in get_data()['users']:
-        if user['auth_user_id'] == auth_user_id:
-            return user
+    return lookup('users', auth_user_id)
 
 #################################################
 ######## Helper functions for channel.py ########
@@ -96,6 +96,26 @@ def check_valid_start(num_messages, start):
         return False
     return True
 
+# Helper function for search, channel/messages and dm/messages
+# Converts a request argument to an int, returns None if it is not one
+def parse_int(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+# Helper function for channel/messages and dm/messages
+# Returns the page size asked for, or None if it is not valid
+def parse_page_size(limit):
+    if limit is None:
+        return config.messages_page_size
+    limit = parse_int(limit)
+    if limit is None or limit < 1 or limit > config.messages_page_cap:
+        return None
+    return limit
+
 # Helper function for channel_details
 # Checks if a valid channel_id is being passed in or not
 # If valid channel, returns the detail of the channel
@@ -103,9 +123,11 @@ def get_channel_details(channel_id):
     '''
     return type: dict
     '''
-    for channel in get_data()['channels']:
-        if int(channel['channel_id']) == int(channel_id):
-            return channel
+    try:
+        channel_id = int(channel_id)
+    except (TypeError, ValueError):
+        return None
+    return lookup('channels', channel_id)
 
 # Helper function for channel_invite, channel_details,
 # channel_messages and channel_join
@@ -116,18 +138,12 @@ def check_valid_channel_id(channel_id):
     '''
     return type: bool
     '''
-    for channel in get_data()['channels']:
-        if int(channel_id) == int(channel['channel_id']):
-            return True
-    return False
+    return get_channel_details(channel_id) is not None
 
 # Helper function for channels_list
 # Checks if user is a member of the channel
 def get_channel_member(auth_user_id, channel):
-    for member in channel['all_members']:
-        if member['u_id'] == auth_user_id:
-            return True
-    return False
+    return auth_user_id in members('channel_members', channel['channel_id'])
 
 # Helper function for channel_invite, channel_details,
 # channel_messages and channel_join
@@ -139,10 +155,7 @@ def check_valid_member_in_channel(channel_id, auth_user_id):
     return type: bool
     '''
     channel = get_channel_details(channel_id)
-    for member in channel['all_members']:
-        if member['u_id'] == auth_user_id:
-            return True
-    return False
+    return auth_user_id in members('channel_members', channel['channel_id'])
 
 # Helper function for channel_join
 # Checks if the channel is public or private
@@ -177,29 +190,18 @@ def check_permision_id(auth_user_id):
 # Returns false otherwise
 def check_valid_owner(auth_user_id, channel_id):
     channel = get_channel_details(channel_id)
-    for member in channel['owner_members']:
-        if member['u_id'] == auth_user_id:
-            return True
-    return False
+    return auth_user_id in members('channel_owners', channel['channel_id'])
 
 # Helper function for channel_addowner, channel_removeowner
 # Checks if auth_user_id has owner permission
 # Returns true if they are global owners
 # Returns false otherwise
 def check_channel_owner_permission(auth_user_id, channel_id):
-    found_permission = 0
-
-    channel = get_channel_details(channel_id)
-    for member in channel['all_members']:
-        if member['u_id'] == auth_user_id:
-            if check_permision_id(member['u_id']):
-                found_permission = 1
-    if check_valid_owner(auth_user_id, channel_id):
-        found_permission = 1
-
-    if found_permission == 1:
-        return True
-    return False
+    # Global owners who are members of the channel
+    if check_valid_member_in_channel(channel_id, auth_user_id):
+        if check_permision_id(auth_user_id):
+            return True
+    return check_valid_owner(auth_user_id, channel_id)
 
 # Helper function for admin_user_remove, admin_userpermisisons_change
 # Checks number of owners of a channel
@@ -218,13 +220,10 @@ def check_number_of_owners(u_id):
 # Returns true if valid
 # Returns false otherwise
 def check_permission(u_id, permission_id):
-    for user in get_data()['users']:
-        if user['auth_user_id'] != u_id:
-            continue
-        # If the user is a global owner
-        if permission_id == 1:
-            return True
-    return False
+    if lookup('users', u_id) is None:
+        return False
+    # If the user is a global owner
+    return permission_id == 1
 
 #################################################
 ######## Helper functions for message.py ########
@@ -244,15 +243,10 @@ def check_valid_message_id(auth_user_id, message_id):
         return False
 
     # Finds the channel_id or dm_id that message is part of 
-    for message in get_data()['messages']:
-        if message['message_id'] == message_id:
-            if message_id % 2 == 1:
-                # Odd message_id means it is a message in a channel
-                channel_dm_id = message['channel_id']
-            else:
-                # Even message_id means it is a message in a DM
-                channel_dm_id = message['dm_id']
-            found_message_id = 1
+    location = channel_dm_of_message_id(message_id)
+    if location is not None:
+        channel_dm_id = location['channel_dm_id']
+        found_message_id = 1
 
     # If message_id is odd, message is from channel
     # Go through channels to determine if user is part of channel of that message_id
@@ -288,18 +282,13 @@ def check_authorised_user_edit(auth_user_id, message_id):
     channel_dm_id = 0
     # Check message_id is an existing id, and check if u_id of user that 
     # sent the message is the auth_user_id
-    for message in get_data()['messages']:
-        if message['message_id'] == message_id:
-            found_message_id = 1
-            if message_id % 2 == 1:
-                # Odd message_id means it is a message in a channel
-                channel_dm_id = message['channel_id']
-            elif message_id % 2 == 0:
-                # Even message_id means it is a message in a DM
-                channel_dm_id = message['dm_id']
-
-            if message['u_id'] == auth_user_id:
-                found_u_id = 1
+    location = channel_dm_of_message_id(message_id)
+    if location is not None:
+        found_message_id = 1
+        channel_dm_id = location['channel_dm_id']
+
+        if location['u_id'] == auth_user_id:
+            found_u_id = 1
 
     # Message_id refers to a valid message in joined channel/DM and
     # message was sent by the authorised user making the request
@@ -343,35 +332,17 @@ def check_valid_message_send_format(message):
 # Returns true if message_id is valid in channel/dm
 # Returns false otherwise
 def check_valid_channel_dm_message_ids(message_id):
-    
-    found = 0
-    for channel in get_data()['channels']:
-        for message in channel['messages']:
-            if message_id == message['message_id']:
-                found = 1
-
-    for dm in get_data()['dms']:
-        for message in dm['messages']:
-            if message['message_id'] == message_id:
-                found = 1
-
-    if found == 1:
-        return True
-    return False
+    return lookup('locations', message_id) is not None
 
 # Helper function for message_pin
 # Returns true if the user has owner permission
 def check_authorised_user_pin(message_id, auth_user_id):
     found = 0
     if message_id % 2 == 1:
-        for channel in get_data()['channels']:
-            for owner in channel['owner_members']:
-                if owner['u_id'] == auth_user_id:
-                    found = 1
-            for member in channel['all_members']:         
-                if member['u_id'] == auth_user_id:
-                    if check_permision_id(member['u_id']):
-                        found = 1
+        if members('user_owned_channels', auth_user_id):
+            found = 1
+        if members('user_channels', auth_user_id) and check_permision_id(auth_user_id):
+            found = 1
     if message_id % 2 == 0:
         if check_creator(auth_user_id):
             found = 1
@@ -382,15 +353,15 @@ def check_authorised_user_pin(message_id, auth_user_id):
 # Helper function for message/pin, message/react and message/unreact
 # Returns a dict of message in the channel or dm 
 def get_message(message_id):
-    if message_id % 2 == 1:
-        for channel in get_data()['channels']:
-            for message in channel['messages']:
-                if message['message_id'] == int(message_id):
-                    return message
-    for dm in get_data()['dms']:
-        for message in dm['messages']:
-            if message['message_id'] == message_id:
-                return message
+    location = lookup('locations', message_id)
+    if location is not None:
+        return location[1]
+
+# Helper function for message/send, message/sendlater,
+# message/sendlaterdm, dm/message_senddm
+# Returns a new message_id, odd for a channel and even for a DM
+def generate_message_id(is_channel):
+    return allocate_message_id(is_channel)
 
 # Helper function for message/react and message/unreact
 # Returns a dict of react in the channel/dm
@@ -425,34 +396,6 @@ def get_msg_details(mg_id, u_id, msg, time, react, is_pinned):
     }
     return message_details_channels
 
-# Helper function for message/send, message/sendlater
-# Return the new message details dictionary for channels
-def get_msg_details_channels(mg_id, u_id, msg, time, ch_id, react, is_pinned):
-    message_details_channels = {
-        'message_id': mg_id,
-        'u_id': u_id, 
-        'message': msg,
-        'time_created': time,
-        'channel_id': ch_id,
-        'reacts':[react],
-        'is_pinned': bool(is_pinned)
-    }
-    return message_details_channels
-
-# Helper function for dm/message_senddm, message/sendlaterdm
-# Return the new message details dictionary for dm
-def get_msg_details_dm(mg_id, u_id, msg, time, dm_id, react, is_pinned):
-    message_details_dm = {
-        'message_id': mg_id,
-        'u_id': u_id, 
-        'message': msg,
-        'time_created': time,
-        'dm_id': dm_id,
-        'reacts':[react],
-        'is_pinned': bool(is_pinned)
-    }
-    return message_details_dm
-
 # Helper function for message_share
 # Checks both channel_id and dm_id are valid 
 # Return true if both are valid and false otherwise
@@ -498,10 +441,7 @@ def check_valid_member_in_dm(dm_id, auth_user_id):
     return type: bool
     '''
     dm = get_dm_dict(dm_id)
-    for member in dm['members']:
-        if member['u_id'] == auth_user_id:
-            return True
-    return False
+    return auth_user_id in members('dm_members', dm['dm_id'])
 
 # Helper function for message_senddm
 # Returns true if valid message length
@@ -529,11 +469,7 @@ def check_creator(auth_user_id):
     '''
     return type: bool
     '''
-    for dm in get_data()['dms']:
-        if len(dm['creator']) > 0:
-            if dm['creator']['u_id'] == auth_user_id:
-                return True
-    return False
+    return len(members('dm_creators', auth_user_id)) > 0
 
 # Helper function for dm_remove, dm_details, dm_leave, dm_messages, message_senddm, message_sendlaterdm
 # Returns true if dm exists
@@ -542,10 +478,7 @@ def check_valid_dm(dm_id):
     '''
     return type: bool
     '''
-    for dm in get_data()['dms']:
-        if dm['dm_id'] == dm_id:
-            return True
-    return False
+    return lookup('dms', dm_id) is not None
 
 # Helper function for dm_remove, dm_details, dm_messages, message_send_dm
 # Returns a dict of dm if given dm_id exists
@@ -553,72 +486,53 @@ def get_dm_dict(dm_id):
     '''
     return type: dictionary
     '''
-    for dm in get_data()['dms']:
-        if dm['dm_id'] == dm_id:
-            return dm
+    return lookup('dms', dm_id)
 
 ######################################################
 ####### Helper functions for notifications.py ########
 ######################################################
 
+# Matches a tag, '@' followed by the handle it names. A handle is only
+# letters and digits, so the tag ends at the first other character
+TAG_PATTERN = re.compile(r'@([0-9a-zA-Z]+)')
+
 # Helper function in message_send_v1 
 # Checks if a member of channel has been tagged
 # Return a list of all the handle strings tagged 
 # and an empty string if no users are tagged in message
 def check_message_channel_tag(message, channel_id):
-    handle_str_list = []
-    alpha_numeric_str1 = re.sub("[^0-9a-zA-Z@]+", " ", message)
-    alpha_numeric_str2 = re.sub("@", " @", alpha_numeric_str1)
-    for word in alpha_numeric_str2.split():
-        if '@' in word:
-            handle_str = word[1:]
-
-            print(f"handle_stry {handle_str}")
-            channel = get_channel_details(channel_id)
-            for member in channel['all_members']:
-
-                if member['handle_str'] == handle_str:
-                    handle_str_list.append(handle_str)
-
-    return list(set(handle_str_list))
+    return tagged_member_handles(message, members('channel_members', channel_id))
 
 # Helper function in message_senddm_v1
 # Checks if a member of DM has been tagged
 # Return true if valid member has been tagged, false otherwise
 def check_message_dm_tag(message, dm_id):
+    return tagged_member_handles(message, members('dm_members', dm_id))
+
+# Helper function for check_message_channel_tag, check_message_dm_tag
+# Returns the handles tagged in message whose user is in member_ids,
+# looking each handle up once however large the channel/DM is
+def tagged_member_handles(message, member_ids):
     handle_str_list = []
-    alpha_numeric_str1 = re.sub("[^0-9a-zA-Z@]+", " ", message)
-    alpha_numeric_str2 = re.sub("@", " @", alpha_numeric_str1)
-    for word in alpha_numeric_str2.split():
-        if '@' in word:
-            handle_str = word[1:]
-            dm = get_dm_dict(dm_id)
-            for member in dm['members']:
-                if member['handle_str'] == handle_str:
-                    handle_str_list.append(handle_str)
-
-    return list(set(handle_str_list))
+    for handle_str in set(TAG_PATTERN.findall(message)):
+        user = lookup('handles', handle_str)
+        if user is not None and user['auth_user_id'] in member_ids:
+            handle_str_list.append(handle_str)
+    return handle_str_list
 
 # Helper function in message_react_v1
 # Returns the channel_id of message and u_id of user that sent message as a dict
 def channel_dm_of_message_id(message_id):
-    if message_id % 2 == 1:
-        for channel in get_data()['channels']:
-            for message in channel['messages']:
-                if message['message_id'] == message_id:
-                    return {
-                        'channel_dm_id': channel['channel_id'],
-                        'u_id': message['u_id'], 
-                    }
-
-    else:
-        for dm in get_data()['dms']:
-            for message in dm['messages']:
-                if message['message_id'] == message_id:
-                    return {
-                        'channel_dm_id': dm['dm_id'],
-                        'u_id': message['u_id'],
-                    }
+    location = lookup('locations', message_id)
+    if location is None:
+        return None
+    container, message = location
+    # Odd message_id means it is a message in a channel, even means a DM
+    channel_dm_id = container['channel_id'] if message_id % 2 == 1 else container['dm_id']
+    return {
+        'channel_dm_id': channel_dm_id,
+        'u_id': message['u_id'],
+    }
 
 # Helper function for activate_notification_tag_channel
 # Finds the name of the channel from channel_id
@@ -654,86 +568,37 @@ def check_valid_email(email):
 # the user joins/being invited to a channel or when user leaves the channel
 def user_stats_update_channels(auth_user_id, update_type):
     user = get_user_details(auth_user_id)
-    length = user['channels_joined'][-1]['num_channels_joined']
-    user['channels_joined'].append({
-        'num_channels_joined': length + update_type,
-        'time_stamp': int(time.time())
-    })
+    record(user['channels_joined'], 'num_channels_joined', update_type)
 
 # Helper function for user/stat
 # Appends num_dms_joined and time_stamp when the user creates a dm or 
 # when user leaves/removes a dm
 def user_stats_update_dms(auth_user_id, update_type):
     user = get_user_details(auth_user_id)
-    length = user['dms_joined'][-1]['num_dms_joined']
-    user['dms_joined'].append({
-        'num_dms_joined': length + update_type,
-        'time_stamp': int(time.time())
-    })
+    record(user['dms_joined'], 'num_dms_joined', update_type)
 
 # Helper function for user/stat
 # Appends num_messages_sent and time_stamp when the user sends 
 # a message in dm/ channel or when user removes a message in dm/channel
 def user_stats_update_messages(auth_user_id, update_type):
     user = get_user_details(auth_user_id)
-    length = user['messages_sent'][-1]['num_messages_sent']
-    user['messages_sent'].append({
-        'num_messages_sent': length + update_type,
-        'time_stamp': int(time.time())
-    })
-
-# Helper function for user/stat
-# Gets the total number of messages in dm and channels
-def get_messages_total_number():
-    number = 0
-    for channel in get_data()['channels']:
-        for message in channel['messages']:
-            assert message != None
-            number += 1
-    for dm in get_data()['dms']:
-        for message in dm['messages']:
-            assert message != None
-            number += 1
-    return number
-
-# Helper function for users/stats
-# Check if this user at least joins one channel or dm
-def check_join_channel_or_dm(auth_user_id):
-    for channel in get_data()['channels']:
-        if get_channel_member(auth_user_id, channel):
-            return True
-    
-    for dm in get_data()['dms']:
-        for member in dm['members']:
-            if member['u_id'] == auth_user_id:
-                return True
-    
-    return False
+    record(user['messages_sent'], 'num_messages_sent', update_type)
 
 # Helper function for users/stats
 # Appends new stat as 'num_channels_exist' and time stamp
 def users_stats_update_channels(update_type):
-    curr_num_channel = get_data()['workspace_stats']['channels_exist'][-1]['num_channels_exist']
-    get_data()['workspace_stats']['channels_exist'].append({
-        'num_channels_exist': curr_num_channel + update_type,
-        'time_stamp': int(time.time())
-    })
+    with COUNTER_LOCK:
+        record(get_data()['workspace_stats']['channels_exist'], 'num_channels_exist', update_type)
 
 # Helper function for users/stats
 # Appends new stat as 'num_messages_exist' and time stamp
 def users_stats_update_messages(update_type):
-    curr_num_message = get_data()['workspace_stats']['messages_exist'][-1]['num_messages_exist']
-    get_data()['workspace_stats']['messages_exist'].append({
-        'num_messages_exist': curr_num_message + update_type,
-        'time_stamp': int(time.time())
-    })
+    with COUNTER_LOCK:
+        record(get_data()['workspace_stats']['messages_exist'], 'num_messages_exist', update_type)
 
 # Helper function for users/stats
 # Appends new stat as 'num_dms_exist' and time stamp
 def users_stats_update_dms(update_type):
-    curr_num_dm = get_data()['workspace_stats']['dms_exist'][-1]['num_dms_exist']
-    get_data()['workspace_stats']['dms_exist'].append({
-        'num_dms_exist': curr_num_dm + update_type,
-        'time_stamp': int(time.time())
-    })
+    with COUNTER_LOCK:
+        record(get_data()['workspace_stats']['dms_exist'], 'num_dms_exist', update_type)
 
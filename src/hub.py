@@ -0,0 +1,187 @@
+'''
+In-process publish/subscribe hub for streaming events to clients
+
+Events are published under a topic, e.g. ('channel', 1), and handed to every
+subscription watching that topic. A subscription belongs to one user and
+watches the topics given when it was made, plus any the user is added to
+later through watch(). Each subscription keeps its own bounded queue, so a
+slow client only ever holds up itself. A client that falls too far behind
+is closed rather than buffered without limit.
+
+Waiting for an event blocks on a condition, so idle subscriptions use no
+CPU until something is published to them.
+
+Example usage:
+
+    hub = Hub(256)
+    subscription = hub.subscribe(1, [('channel', 1)])
+    hub.publish(('channel', 1), {'type': 'message_create'})
+    subscription.get(timeout=15)    # (1, {'type': 'message_create'})
+'''
+import collections
+import itertools
+import threading
+
+class Subscription:
+    '''
+    Queue of events waiting to be sent to one client
+    '''
+    def __init__(self, u_id, size):
+        self.u_id = u_id
+        self.size = size
+        self.topics = set()
+        self.queue = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def put(self, event):
+        '''
+        Queue an event, closing the subscription if its queue is full
+        '''
+        with self.condition:
+            if self.closed:
+                return
+            if len(self.queue) >= self.size:
+                self.closed = True
+            else:
+                self.queue.append(event)
+            self.condition.notify_all()
+
+    def get(self, timeout=None):
+        '''
+        Wait for the next event
+
+        Arguments:
+            <timeout>   (<float>)   - most seconds to wait, None to wait forever
+
+        Return Value:
+            Returns the next (event id, event), or None if the timeout passed
+            or the subscription was closed
+        '''
+        with self.condition:
+            if not self.queue and not self.closed:
+                self.condition.wait(timeout)
+            if self.closed or not self.queue:
+                return None
+            return self.queue.popleft()
+
+    def close(self):
+        '''
+        Stop the subscription, waking a get() waiting on it
+        '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class Hub:
+    '''
+    Topics and the subscriptions watching them
+    '''
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        # topic -> subscriptions watching it
+        self.topics = {}
+        # u_id -> subscriptions of that user
+        self.users = {}
+        # Event ids are handed out by next(), which is safe from any thread
+        self.counter = itertools.count(1)
+
+    def subscribe(self, u_id, topics=()):
+        '''
+        Start a subscription for u_id watching topics
+
+        Return Value:
+            Returns the Subscription, to be passed to unsubscribe() once done
+        '''
+        subscription = Subscription(u_id, self.queue_size)
+        with self.lock:
+            self.users.setdefault(u_id, set()).add(subscription)
+            for topic in topics:
+                self.add_topic(subscription, topic)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        '''
+        End a subscription, e.g. once its client has gone away
+        '''
+        subscription.close()
+        with self.lock:
+            for topic in subscription.topics:
+                self.discard(self.topics, topic, subscription)
+            subscription.topics.clear()
+            self.discard(self.users, subscription.u_id, subscription)
+
+    def watch(self, u_id, topic):
+        '''
+        Have every subscription of u_id watch topic, e.g. after the user
+        joined a channel
+        '''
+        with self.lock:
+            for subscription in self.users.get(u_id, ()):
+                self.add_topic(subscription, topic)
+
+    def unwatch(self, u_id, topic):
+        '''
+        Stop every subscription of u_id watching topic
+        '''
+        with self.lock:
+            for subscription in self.users.get(u_id, ()):
+                subscription.topics.discard(topic)
+                self.discard(self.topics, topic, subscription)
+
+    def watched(self, topic):
+        '''
+        Return Value:
+            Returns true if any subscription is watching topic
+        '''
+        with self.lock:
+            return topic in self.topics
+
+    def publish(self, topic, event):
+        '''
+        Hand an event to every subscription watching topic
+
+        Return Value:
+            Returns the id given to the event
+        '''
+        event_id = next(self.counter)
+        with self.lock:
+            subscriptions = list(self.topics.get(topic, ()))
+        for subscription in subscriptions:
+            subscription.put((event_id, event))
+        return event_id
+
+    def clear(self):
+        '''
+        Close every subscription
+        '''
+        with self.lock:
+            subscriptions = [subscription for by_user in self.users.values() for subscription in by_user]
+            self.topics.clear()
+            self.users.clear()
+        for subscription in subscriptions:
+            subscription.topics.clear()
+            subscription.close()
+
+    def count(self):
+        '''
+        Return Value:
+            Returns the number of open subscriptions
+        '''
+        with self.lock:
+            return sum(len(by_user) for by_user in self.users.values())
+
+    # Adds a subscription to a topic, the caller holds self.lock
+    def add_topic(self, subscription, topic):
+        subscription.topics.add(topic)
+        self.topics.setdefault(topic, set()).add(subscription)
+
+    # Removes value from the set under key, dropping the set once empty
+    def discard(self, sets, key, value):
+        values = sets.get(key)
+        if values is None:
+            return
+        values.discard(value)
+        if not values:
+            del sets[key]
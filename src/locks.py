@@ -0,0 +1,132 @@
+'''
+Locks used to let requests run in parallel on the data store
+
+A StripedLocks hands out one of a fixed number of locks for each record,
+e.g. ('channel', 1), so work on different channels, DMs and users can run
+at the same time while work on the same one waits its turn. Locks are
+always taken in stripe order, so two holders can never wait on each other.
+
+A SharedLock is held shared by everyone changing records under their
+stripes, and exclusively by work that reads or replaces the whole store,
+such as writing it out to disk.
+
+Example usage:
+
+    STRIPES = StripedLocks(64)
+    with STRIPES.hold([('channel', 1), ('user', 2)]):
+        ...
+'''
+import threading
+from contextlib import contextmanager
+
+class StripedLocks:
+    '''
+    Fixed pool of locks shared out between records by hash
+    '''
+    def __init__(self, count):
+        self.locks = [threading.RLock() for _ in range(count)]
+
+    def stripes(self, keys):
+        '''
+        Return Value:
+            Returns the stripes used by keys, in the order they are taken
+        '''
+        return sorted({hash(key) % len(self.locks) for key in keys})
+
+    def acquire(self, keys):
+        '''
+        Take the locks of keys, returning the stripes taken for release()
+        '''
+        stripes = self.stripes(keys)
+        for stripe in stripes:
+            self.locks[stripe].acquire()
+        return stripes
+
+    def release(self, stripes):
+        '''
+        Let go of the stripes returned by acquire()
+        '''
+        for stripe in reversed(stripes):
+            self.locks[stripe].release()
+
+    @contextmanager
+    def hold(self, keys):
+        '''
+        Hold the locks of keys for a block
+        '''
+        stripes = self.acquire(keys)
+        try:
+            yield
+        finally:
+            self.release(stripes)
+
+class SharedLock:
+    '''
+    Lock held either by any number of threads at once, or by one thread on
+    its own. A thread waiting to hold it on its own goes before threads
+    that have not started holding it shared yet, so it is never starved.
+    The thread holding it on its own may take it again either way.
+    '''
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.shared = 0
+        self.owner = None
+        self.depth = 0
+        self.waiting = 0
+
+    def acquire_shared(self):
+        with self.condition:
+            if self.owner == threading.get_ident():
+                self.depth += 1
+                return
+            while self.owner is not None or self.waiting > 0:
+                self.condition.wait()
+            self.shared += 1
+
+    def release_shared(self):
+        with self.condition:
+            if self.owner == threading.get_ident():
+                self.depth -= 1
+                return
+            self.shared -= 1
+            if self.shared == 0:
+                self.condition.notify_all()
+
+    def acquire(self):
+        with self.condition:
+            me = threading.get_ident()
+            if self.owner == me:
+                self.depth += 1
+                return
+            self.waiting += 1
+            while self.owner is not None or self.shared > 0:
+                self.condition.wait()
+            self.waiting -= 1
+            self.owner = me
+            self.depth = 1
+
+    def release(self):
+        with self.condition:
+            self.depth -= 1
+            if self.depth == 0:
+                self.owner = None
+                self.condition.notify_all()
+
+    def is_owned(self):
+        '''
+        Return Value:
+            Returns true if the current thread holds the lock on its own
+        '''
+        with self.condition:
+            return self.owner == threading.get_ident()
+
+    @contextmanager
+    def exclusive(self):
+        '''
+        Hold the lock on its own for a block
+        '''
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
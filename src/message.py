@@ -2,7 +2,8 @@
 Messages implementation
 '''
 import time
-from src.data_store import get_data, save
+from src.data_store import get_data, save, lookup, insert_message, remove_message, set_message_text
+from src.data_store import insert_scheduled, remove_scheduled, transaction, publish_message, after_commit
 from src.error import InputError, AccessError
 from src.helper import check_valid_channel_id, check_valid_member_in_channel, check_valid_message
 from src.helper import check_authorised_user_edit, check_valid_message_send_format, check_authorised_user_pin
@@ -10,11 +11,12 @@ from src.helper import get_message, check_valid_channel_dm_message_ids, get_chan
 from src.helper import check_valid_dm, check_valid_member_in_dm, get_reacts, check_valid_message_id
 from src.helper import check_valid_channel_id_and_dm_id_format, check_share_message_authorised_user
 from src.helper import check_message_channel_tag, user_stats_update_messages, get_dm_dict
-from src.helper import users_stats_update_messages, new_react, get_msg_details, get_msg_details_channels
-from src.helper import get_msg_details_dm
+from src.helper import users_stats_update_messages, new_react, get_msg_details
+from src.helper import generate_message_id, get_user_details
 from src.server_helper import decode_token, valid_user
 from src.notifications import activate_notification_tag_channel, activate_notification_react
 from src.dm import message_senddm_v1
+from src.scheduler import SCHEDULER
 
 def message_send_v1(token, channel_id, message):
     '''
@@ -53,13 +55,19 @@ def message_send_v1(token, channel_id, message):
     if not check_valid_message(message):
         raise InputError(description="Message is invalid as length of message is less than 1 or over 1000 characters.")
 
+    return send_channel_message(auth_user_id, channel_id, message)
+
+# Helper function for message_send, standup
+# Sends a message to the channel as auth_user_id, the caller has already
+# checked that the user may post the message
+def send_channel_message(auth_user_id, channel_id, message):
     # Checks if message contains a tag to an authorised user
     tagged_user_list = check_message_channel_tag(message, channel_id)
     if tagged_user_list != []:
         activate_notification_tag_channel(auth_user_id, tagged_user_list, channel_id, message)
     
     # Creating unique message_id 
-    message_id = (len(get_data()['messages']) * 2) + 1
+    message_id = generate_message_id(True)
     # Current time message was created and sent
     time_created = int(time.time())
 
@@ -70,16 +78,7 @@ def message_send_v1(token, channel_id, message):
     msg_details_channels = get_msg_details(message_id, auth_user_id, message, 
                                             time_created, reacts_details, is_pinned)
     # Append dictionary of message details into initial_objects['channels']['messages']
-    for channel in get_data()['channels']:
-        if channel['channel_id'] == channel_id:
-            channel['messages'].insert(0, msg_details_channels)
-            save()
-    
-    msg_details_msgs = get_msg_details_channels(message_id, auth_user_id, message,time_created,
-                                                        channel_id, reacts_details, is_pinned)
-
-    # Append dictionary of message details into intital_objects['messages']
-    get_data()['messages'].insert(0, msg_details_msgs)
+    insert_message(get_channel_details(channel_id), msg_details_channels)
     save()
 
     # For user/stats, append a new stat in 'messages_sent'
@@ -143,23 +142,13 @@ def message_edit_v1(token, message_id, message):
     if not check_authorised_user_edit(auth_user_id, message_id):
         raise AccessError(description="The user is unauthorised to edit the message.")
     
-    for channel in get_data()['channels']:
-        for iterate_message in channel['messages']:
-            if iterate_message['message_id'] == message_id:
-                if message == '':
-                    channel['messages'].remove(iterate_message)
-                else:
-                    iterate_message['message'] = message
-            save()
-
-    for dm in get_data()['dms']:
-        for iterate_message in dm['messages']:
-            if iterate_message['message_id'] == message_id:
-                if message == '':
-                    dm['messages'].remove(iterate_message)
-                else:
-                    iterate_message['message'] = message
-            save()
+    # Find the channel/DM holding the message and update it there
+    container, iterate_message = lookup('locations', message_id)
+    if message == '':
+        remove_message(container, iterate_message)
+    else:
+        set_message_text(iterate_message, message)
+    save()
             
     if message == '':
         # For users/stats, append new stat in 'messages_exist'
@@ -206,17 +195,9 @@ def message_remove_v1(token, message_id):
         raise AccessError(description="The user is unauthorised to edit the message.")
 
     # Given a message_id for a message, remove message from the channel/DM
-    for channel in get_data()['channels']:
-        for message in channel['messages']:
-            if message['message_id'] == message_id:
-                channel['messages'].remove(message)
-                save()
-    
-    for dm in get_data()['dms']:
-        for message in dm['messages']:
-            if message['message_id'] == message_id:
-                dm['messages'].remove(message)
-                save()
+    container, message = lookup('locations', message_id)
+    remove_message(container, message)
+    save()
 
     # For users/stats, append new stat in 'messages_exist'
     users_stats_update_messages(-1)
@@ -334,6 +315,7 @@ def message_react_v1(token, message_id, react_id):
 
     react['u_ids'].append(int(auth_user_id))
     react['is_this_user_reacted'] = True
+    publish_message('message_react', *lookup('locations', message_id))
     save()
 
     # Activate notification for react
@@ -385,6 +367,7 @@ def message_unreact_v1(token, message_id, react_id):
 
     react['u_ids'].remove(int(auth_user_id))
     react['is_this_user_reacted'] = False
+    publish_message('message_react', *lookup('locations', message_id))
     save()
     return {}
 
@@ -431,6 +414,7 @@ def message_pin_v1(token, message_id):
         raise InputError(description="The message is already pinned.")
 
     message['is_pinned'] = True
+    publish_message('message_pin', *lookup('locations', message_id))
     save()
     return {}
 
@@ -477,6 +461,7 @@ def message_unpin_v1(token, message_id):
         raise InputError(description="The message is not already pinned.")
 
     message['is_pinned'] = False
+    publish_message('message_pin', *lookup('locations', message_id))
     save()
     return {}
 
@@ -522,39 +507,8 @@ def message_sendlater_v1(token, channel_id, message, time_sent):
         raise InputError(description='Time_sent is a time in the past')
 
     # generate a message_id as soon as message_sendlater is called
-    message_id = (len(get_data()['messages']) * 2) + 1
-
-    # wait for [time_wait] amount of time
-    time_wait = time_sent - int(time.time())
-    time.sleep(time_wait)
-
-    is_this_user_reacted = False
-    is_pinned = False
-
-    reacts_details = new_react(is_this_user_reacted)
-
-    msg_details_channels = get_msg_details(message_id, auth_user_id, message, 
-                                                time_sent, reacts_details, is_pinned)
-
-    # Append dictionary of message details into initial_objects['channels']['messages']
-    channel = get_channel_details(channel_id)
-    channel['messages'].insert(0, msg_details_channels)
-    save()
-
-    msg_details_msgs = get_msg_details_channels(message_id, auth_user_id, message, time_sent, 
-                                                        channel_id, reacts_details, is_pinned)
-
-    # Append dictionary of message details into intital_objects['messages']
-    get_data()['messages'].insert(0, msg_details_msgs)
-    save()
-
-    # For user/stats, append a new stat in 'messages_sent'
-    user_stats_update_messages(auth_user_id, 1)
-    save()
-
-    # For users/stats, append new stat in 'messages_exist'
-    users_stats_update_messages(1)
-    save()
+    message_id = generate_message_id(True)
+    schedule_message(message_id, auth_user_id, message, time_sent, channel_id, -1)
 
     return {
         'message_id': message_id
@@ -602,40 +556,148 @@ def message_sendlaterdm_v1(token, dm_id, message, time_sent):
         raise InputError(description='Time_sent is a time in the past')
 
     # generate a message_id as soon as message_sendlater is called
-    message_id = (len(get_data()['messages']) * 2)
+    message_id = generate_message_id(False)
+    schedule_message(message_id, auth_user_id, message, time_sent, -1, dm_id)
 
-    # wait for [time_wait] amount of time
-    time_wait = time_sent - int(time.time())
-    time.sleep(time_wait)
+    return {
+        'message_id': message_id
+    }
 
-    is_this_user_reacted = False
-    is_pinned = False
+def message_sendlater_list_v1(token):
+    '''
+    List the messages the authorised user has scheduled that have not been sent yet
 
-    reacts_details = new_react(is_this_user_reacted)
+    Arguments:
+        <token>        (<string>)   - an authorisation hash
 
-    msg_details_dm = get_msg_details(message_id, auth_user_id, message, 
-                                        time_sent, reacts_details, is_pinned)
+    Exceptions:
+        AccessError     - Occurs when token is invalid
 
-    # Append dictionary of message details into initial_objects['dms']['messages']
-    dm = get_dm_dict(dm_id)
-    dm['messages'].insert(0, msg_details_dm)
-    save()
+    Return Value:
+        Returns <{messages}> where messages is a list of dictionaries with
+        message_id, channel_id, dm_id, message and time_sent, earliest first
+    '''
+    # invalid token
+    if not valid_user(token):
+        raise AccessError(description='User is not valid')
 
-    msg_details_msgs = get_msg_details_dm(message_id, auth_user_id, message, time_sent, 
-                                                    dm_id, reacts_details, is_pinned)
+    auth_user_id = decode_token(token)
 
-    # Append dictionary of message details into intital_objects['messages']
-    get_data()['messages'].insert(0, msg_details_msgs)
-    save()
+    messages = []
+    for scheduled in get_data()['scheduled_messages']:
+        if scheduled['u_id'] == auth_user_id:
+            messages.append({
+                'message_id': scheduled['message_id'],
+                'channel_id': scheduled['channel_id'],
+                'dm_id': scheduled['dm_id'],
+                'message': scheduled['message'],
+                'time_sent': scheduled['time_sent']
+            })
+    messages.sort(key=lambda scheduled: scheduled['time_sent'])
 
-    # For user/stats, append a new stat in 'messages_sent'
-    user_stats_update_messages(auth_user_id, 1)
+    return {
+        'messages': messages
+    }
+
+def message_sendlater_cancel_v1(token, message_id):
+    '''
+    Cancel a message scheduled with message/sendlater or message/sendlaterdm
+    before it is sent
+
+    Arguments:
+        <token>        (<string>)   - an authorisation hash
+        <message_id>   (<int>)      - message_id returned when the message was scheduled
+
+    Exceptions:
+        InputError      - Occurs when message_id does not refer to a message
+                          waiting to be sent
+
+        AccessError     - Occurs when token is invalid
+                        - Occurs when the message was scheduled by another user
+
+    Return Value:
+        N/A
+    '''
+    # invalid token
+    if not valid_user(token):
+        raise AccessError(description='User is not valid')
+
+    auth_user_id = decode_token(token)
+
+    scheduled = lookup('scheduled', message_id)
+    if scheduled is None:
+        raise InputError(description='The message_id does not refer to a message waiting to be sent')
+
+    if scheduled['u_id'] != auth_user_id:
+        raise AccessError(description='The message was scheduled by another user')
+
+    remove_scheduled(scheduled)
     save()
 
-    # For users/stats, append new stat in 'messages_exist'
-    users_stats_update_messages(1)
+    return {}
+
+# Helper function for message_sendlater, message_sendlaterdm
+# Stores the message in the scheduled messages and queues it to be sent
+def schedule_message(message_id, auth_user_id, message, time_sent, channel_id, dm_id):
+    insert_scheduled({
+        'message_id': message_id,
+        'u_id': auth_user_id,
+        'channel_id': channel_id,
+        'dm_id': dm_id,
+        'message': message,
+        'time_sent': int(time_sent)
+    })
     save()
+    # The timer is only started once the request commits, a request rolled
+    # back has nothing to send
+    after_commit(SCHEDULER.schedule, int(time_sent), send_scheduled_message, message_id)
+
+# Helper function for the scheduler
+# Sends a scheduled message once it is due
+def send_scheduled_message(message_id):
+    with transaction():
+        scheduled = lookup('scheduled', message_id)
+        if scheduled is None:
+            return
+
+        auth_user_id = scheduled['u_id']
+        channel_id = scheduled['channel_id']
+        dm_id = scheduled['dm_id']
+        if channel_id != -1:
+            container = get_channel_details(channel_id)
+        else:
+            container = get_dm_dict(dm_id)
+
+        # The channel/DM was removed or the sender was removed from Streams
+        # since the message was scheduled, so it is dropped
+        if container is None or get_user_details(auth_user_id)['is_removed']:
+            remove_scheduled(scheduled)
+            save()
+            return
 
-    return {
-        'message_id': message_id
-    }
\ No newline at end of file
+        remove_scheduled(scheduled)
+        save()
+
+        message = scheduled['message']
+        time_sent = scheduled['time_sent']
+        reacts_details = new_react(False)
+        is_pinned = False
+
+        # Append dictionary of message details into the channel/DM messages
+        insert_message(container, get_msg_details(message_id, auth_user_id, message,
+                                                    time_sent, reacts_details, is_pinned))
+        save()
+
+        # For user/stats, append a new stat in 'messages_sent'
+        user_stats_update_messages(auth_user_id, 1)
+        save()
+
+        # For users/stats, append new stat in 'messages_exist'
+        users_stats_update_messages(1)
+        save()
+
+# Queues the scheduled messages loaded from the database, called on startup.
+# Messages that fell due while the server was down are sent straight away
+def restore_scheduled_messages():
+    for scheduled in get_data()['scheduled_messages']:
+        SCHEDULER.schedule(scheduled['time_sent'], send_scheduled_message, scheduled['message_id'])
@@ -2,14 +2,29 @@
 Notifications implementation
 '''
 
-from src.data_store import get_data, save
+import threading
+from src.data_store import save, lookup, transaction, after_commit
+from src.data_store import insert_notification, deliver_notification, newest_notifications
 from src.error import InputError, AccessError
 from src.helper import channel_dm_of_message_id, get_handle, channel_id_to_channel_name, dm_id_to_dm_name
 from src.server_helper import decode_token, valid_user
+from src.worker import Worker
 
 TAG_START = 0
 TAG_END = 20
 
+# Number of notifications returned by notifications/get
+NOTIFICATIONS_SHOWN = 20
+
+# Delivers notifications in the background, so a message tagging many
+# users does not wait for every one of them to be given the notification
+NOTIFIER = Worker()
+
+# u_id -> ticket of the newest job delivering a notification to that user,
+# so reading notifications only waits for the ones sent to the reader
+DELIVERIES = {}
+DELIVERIES_LOCK = threading.Lock()
+
 def notifications_get_v1(token):
     '''
     Return the user's most recent 20 notifications, ordered from most recent to least recent.
@@ -28,13 +43,24 @@ def notifications_get_v1(token):
         
     auth_user_id = decode_token(token)
 
-    for user in get_data()['users']:
-        if user['auth_user_id'] == auth_user_id:
-            notifications = user['all_notifications'][0:20]
-
-    return {
-        'notifications': notifications
-    }
+    # Notifications sent to the user before this request are delivered
+    # first, which is done before taking the user's lock since delivering
+    # needs it
+    with DELIVERIES_LOCK:
+        ticket = DELIVERIES.get(auth_user_id, 0)
+    NOTIFIER.wait(ticket)
+    with transaction(('user', auth_user_id)):
+        notifications = newest_notifications(lookup('users', auth_user_id), NOTIFICATIONS_SHOWN)
+        return {
+            'notifications': [
+                {
+                    'channel_id': notification['channel_id'],
+                    'dm_id': notification['dm_id'],
+                    'notification_message': notification['notification_message'],
+                }
+                for notification in notifications
+            ]
+        }
 
 
 ##### Helper functions for notifications_get_v1 #######
@@ -42,6 +68,38 @@ def notifications_get_v1(token):
     # 1. Authorised user of channel is tagged by other member in a message in channel/DM
     # 2. Valid member of channel reacts to authorised user's message in channel/DM
     # 3. Authorised user is invited to a channel or is added to a DM
+# The notification is handed to NOTIFIER once the unit of work making the
+# change commits, and is never sent if it is rolled back
+
+# Queues a notification to be sent to every user in u_ids
+def send_notification(channel_id, dm_id, notification_message, u_ids):
+    after_commit(submit_delivery, channel_id, dm_id, notification_message, list(u_ids))
+
+# Hands a notification to NOTIFIER, noting the ticket against each recipient
+def submit_delivery(channel_id, dm_id, notification_message, u_ids):
+    if not u_ids:
+        return
+    # Submitted under the lock, so tickets are noted in the order they
+    # were handed out
+    with DELIVERIES_LOCK:
+        ticket = NOTIFIER.submit(deliver, channel_id, dm_id, notification_message, u_ids)
+        for u_id in u_ids:
+            DELIVERIES[u_id] = ticket
+
+# Helper function for NOTIFIER
+# Stores the notification once and gives it to each of the users
+def deliver(channel_id, dm_id, notification_message, u_ids):
+    if not u_ids:
+        return
+    with transaction(*[('user', u_id) for u_id in u_ids]):
+        recipients = [lookup('users', u_id) for u_id in u_ids]
+        recipients = [user for user in recipients if user is not None and not user['is_removed']]
+        if not recipients:
+            return
+        notification = insert_notification(channel_id, dm_id, notification_message)
+        for user in recipients:
+            deliver_notification(user, notification)
+        save()
 
 # Sends notification for when a user is tagged in a channel they are a member of 
 # auth_user_id is the user that completed the above action to activate the notification
@@ -54,18 +112,7 @@ def activate_notification_tag_channel(auth_user_id, handle_str_list, channel_id,
         
     notification_message = f"{handle_str_notif_from} tagged you in {channel_name}: {message[TAG_START:TAG_END]}"
 
-    notification = {
-        'channel_id': channel_id,
-        'dm_id': -1,
-        'notification_message': notification_message
-    }
-
-    for tagged_user in handle_str_list:
-        for user2 in get_data()['users']:
-
-            if user2['handle_str'] == tagged_user:
-                user2['all_notifications'].insert(0, notification)
-                save()
+    send_notification(channel_id, -1, notification_message, tagged_u_ids(handle_str_list))
 
 # Sends notification for when a user is tagged in a DM they are a member of
 def activate_notification_tag_dm(auth_user_id, handle_str_list, dm_id, message):
@@ -76,18 +123,13 @@ def activate_notification_tag_dm(auth_user_id, handle_str_list, dm_id, message):
         
     notification_message = f"{handle_str_notif_from} tagged you in {dm_name}: {message[TAG_START:TAG_END]}"
 
-    notification = {
-        'channel_id': -1,
-        'dm_id': dm_id,
-        'notification_message': notification_message
-    }
+    send_notification(-1, dm_id, notification_message, tagged_u_ids(handle_str_list))
 
-    for tagged_user in handle_str_list:
-        for user2 in get_data()['users']:
-
-            if user2['handle_str'] == tagged_user:
-                user2['all_notifications'].insert(0, notification)
-                save()
+# Helper function for activate_notification_tag_channel/dm
+# Returns the u_ids of the users with the tagged handles
+def tagged_u_ids(handle_str_list):
+    users = [lookup('handles', handle_str) for handle_str in handle_str_list]
+    return [user['auth_user_id'] for user in users if user is not None]
 
 # Sends notification for when a user reacts to a message
 def activate_notification_react(auth_user_id, message_id):
@@ -106,16 +148,7 @@ def activate_notification_react(auth_user_id, message_id):
 
         notification_message = f"{handle_str_notif_from} reacted to your message in {channel_name}"
 
-        notification = {
-            'channel_id': channel_dm_id,
-            'dm_id': -1,
-            'notification_message': notification_message
-        }
-
-        for user in get_data()['users']:
-            if user['auth_user_id'] == u_id:
-                user['all_notifications'].insert(0, notification)
-                save()
+        send_notification(channel_dm_id, -1, notification_message, [u_id])
 
     else:
         # Message reacted is from DM
@@ -123,16 +156,7 @@ def activate_notification_react(auth_user_id, message_id):
 
         notification_message = f"{handle_str_notif_from} reacted to your message in {dm_name}"
 
-        notification = {
-            'channel_id': -1,
-            'dm_id': channel_dm_id,
-            'notification_message': notification_message
-        }
-
-        for user in get_data()['users']:
-            if user['auth_user_id'] == u_id:
-                user['all_notifications'].insert(0, notification)
-                save()
+        send_notification(-1, channel_dm_id, notification_message, [u_id])
 
 # Sends notification for when a user invites another to a channel
 def activate_notification_channel_invite(auth_user_id, channel_id, u_id):
@@ -144,16 +168,7 @@ def activate_notification_channel_invite(auth_user_id, channel_id, u_id):
 
     notification_message = f"{handle_str_notif_from} added you to {channel_name}"
 
-    notification = {
-        'channel_id': channel_id,
-        'dm_id': -1,
-        'notification_message': notification_message
-    }
-
-    for user in get_data()['users']:
-        if user['auth_user_id'] == u_id:
-            user['all_notifications'].insert(0, notification)
-            save()
+    send_notification(channel_id, -1, notification_message, [u_id])
 
 def activate_notification_dm_create(auth_user_id, dm_id, member_list):
 
@@ -163,15 +178,5 @@ def activate_notification_dm_create(auth_user_id, dm_id, member_list):
 
     notification_message = f"{handle_str_notif_from} added you to {dm_name}"
 
-    notification = {
-        'channel_id': -1,
-        'dm_id': dm_id,
-        'notification_message': notification_message
-    }
-
-    for dm_member in member_list:
-        if dm_member['u_id'] != auth_user_id:
-            for user in get_data()['users']:
-                if user['auth_user_id'] == dm_member['u_id']:
-                    user['all_notifications'].insert(0, notification)
-                    save()
\ No newline at end of file
+    dm_members = [dm_member for dm_member in member_list if dm_member != auth_user_id]
+    send_notification(-1, dm_id, notification_message, dm_members)
\ No newline at end of file
@@ -2,7 +2,10 @@
 Clear the data that has been stored
 '''
 
-from src.data_store import get_data, save
+from src.data_store import get_data, save, rebuild_indexes, transaction, touch_all, HUB
+from src.scheduler import SCHEDULER
+from src.notifications import NOTIFIER
+from src.user import downsample_stats
 
 def clear_v1():
     '''
@@ -18,12 +21,28 @@ def clear_v1():
         N/A
     '''
 
-    data = get_data()
-    data['users'] = []
-    data['channels'] = []
-    data['dms'] = []
-    data['messages'] = []
-    data['workspace_stats'] = {}
-    save()
+    # Notifications still being sent would land in the cleared store. This
+    # is waited on before locking the store, since sending them needs it
+    NOTIFIER.clear()
+    # Open event streams end, ids they follow are about to be reused
+    HUB.clear()
+    with transaction():
+        data = get_data()
+        data['users'] = []
+        data['channels'] = []
+        data['dms'] = []
+        data['workspace_stats'] = {}
+        data['scheduled_messages'] = []
+        data['message_ids_issued'] = 0
+        data['notifications'] = []
+        data['notification_ids_issued'] = 0
+        data['dm_ids_issued'] = 0
+        # Downsampling schedules itself again each time it runs, dropping it
+        # would stop it until the next restart
+        SCHEDULER.clear(keep=[downsample_stats])
+        rebuild_indexes()
+        # Every table was replaced rather than changed record by record
+        touch_all()
+        save()
 
     return {}
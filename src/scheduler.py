@@ -0,0 +1,82 @@
+'''
+Scheduler for work that is due at a later time
+
+Jobs are kept in a heap ordered by the time they are due, and a single
+dispatcher thread sleeps until the earliest one is due and runs it. Request
+handlers only push onto the heap, so they return straight away no matter
+how far in the future the job is.
+
+Example usage:
+
+    from src.scheduler import SCHEDULER
+
+    SCHEDULER.schedule(time.time() + 60, print, 'a minute later')
+'''
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+class Scheduler:
+    '''
+    Heap of timed jobs run one at a time by a dispatcher thread
+    '''
+    def __init__(self):
+        self.heap = []
+        # Breaks ties between jobs due at the same time, first come first served
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def schedule(self, time_due, callback, *args):
+        '''
+        Run callback(*args) on the dispatcher thread once time_due has passed
+
+        Arguments:
+            <time_due>   (<float>)      - unix timestamp the job is due at
+            <callback>   (<function>)   - the job to run
+            <args>                      - arguments passed to callback
+        '''
+        with self.condition:
+            heapq.heappush(self.heap, (time_due, next(self.counter), callback, args))
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def clear(self, keep=()):
+        '''
+        Drop every job that has not run yet
+
+        Arguments:
+            <keep>   (<list>)   - callbacks whose jobs are kept, e.g. ones
+                                  that schedule themselves again
+        '''
+        with self.condition:
+            self.heap = [job for job in self.heap if job[2] in keep]
+            heapq.heapify(self.heap)
+
+    def pending(self):
+        '''
+        Return Value:
+            Returns the number of jobs that have not run yet
+        '''
+        with self.condition:
+            return len(self.heap)
+
+    # Dispatcher loop, waits for the earliest job to be due then runs it
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0][0] > time.time():
+                    timeout = self.heap[0][0] - time.time() if self.heap else None
+                    self.condition.wait(timeout)
+                _, _, callback, args = heapq.heappop(self.heap)
+            try:
+                callback(*args)
+            except Exception:
+                # One failing job must not stop the jobs after it
+                traceback.print_exc()
+
+SCHEDULER = Scheduler()
@@ -1,16 +1,15 @@
 '''
 Search implementation
 '''
-
-from src.data_store import get_data
+import heapq
+from src.data_store import lookup, members, search_messages
 from src.error import InputError, AccessError
-from src.helper import check_valid_message
+from src.helper import check_valid_message, parse_int
 from src.server_helper import decode_token, valid_user
-from src.channels import channels_list_v2
-from src.dm import dm_list_v1
 
+ORDERS = ['joined', 'time', 'relevance']
 
-def search_v1(token, query_str):
+def search_v1(token, query_str, limit=None, cursor=None, order='joined'):
     '''
     Given a query string, return a collection of messages in 
     all of the channels/DMs that the user has joined that contain the query.
@@ -18,14 +17,23 @@ def search_v1(token, query_str):
     Arguments:
         token       (<string>)        - a user's unique token 
         query_str   (<string>)        - a string that user wants to search
+        limit       (<int>)           - optional, most messages to return
+        cursor      (<string>)        - optional, next_cursor of the previous page
+        order       (<string>)        - 'joined' lists channels then DMs by id with
+                                        the newest message first, 'time' the newest
+                                        message first and 'relevance' the messages
+                                        containing the query most often first
         ...
 
     Exceptions:
         InputError  - Occurs when length of query_str is less than 1 or over 1000 characters 
+                    - Occurs when limit is not a positive integer
+                    - Occurs when cursor or order is invalid
         AccessError - Occurs when token is invalid
 
     Return Value:
-        { messages }
+        { messages }, and { messages, next_cursor } when a limit is given.
+        next_cursor is None on the last page
     '''
     if not valid_user(token):
         raise AccessError(description='User is not valid')
@@ -34,28 +42,63 @@ def search_v1(token, query_str):
     if not check_valid_message(query_str):
         raise InputError(description="Invalid query string format of less than 1 or over 1000 characters.")
 
-    messages_search_list = []
+    if order not in ORDERS:
+        raise InputError(description="Invalid order, must be one of " + ", ".join(ORDERS) + ".")
 
-    channel_list = channels_list_v2(token)
+    if limit is not None:
+        limit = parse_int(limit)
+        if limit is None or limit < 1:
+            raise InputError(description="Invalid limit, must be a positive integer.")
 
-    for member_channel in channel_list['channels']:
-        for test_channel in get_data()['channels']:
-            if member_channel['channel_id'] == test_channel['channel_id']:
-                for message_channel in test_channel['messages']:
-                    if query_str.lower() in message_channel['message'].lower():
-                        messages_search_list.append(message_channel)
-    
-    dm_list = dm_list_v1(token)
+    after = None
+    if cursor is not None:
+        after = parse_cursor(cursor, order)
+        if after is None:
+            raise InputError(description="Invalid cursor.")
+
+    auth_user_id = decode_token(token)
+    matches = ranked_matches(auth_user_id, query_str, order)
+    if after is not None:
+        matches = (match for match in matches if match[0] > after)
 
-    for member_dm in dm_list['dms']:
-        for test_dm in get_data()['dms']:
-            if member_dm['dm_id'] == test_dm['dm_id']:
-                for message_dm in test_dm['messages']:
-                    if query_str.lower() in message_dm['message'].lower():
-                        messages_search_list.append(message_dm)
+    if limit is None:
+        return {
+            'messages': [message for _, message in sorted(matches, key=lambda match: match[0])]
+        }
 
+    # Only the best limit + 1 matches are kept, the extra one tells
+    # whether there is another page
+    page = heapq.nsmallest(limit + 1, matches, key=lambda match: match[0])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = ','.join(str(part) for part in page[-1][0])
     return {
-        'messages': messages_search_list
+        'messages': [message for _, message in page],
+        'next_cursor': next_cursor
     }
 
+# Yields (rank, message) for every message the user can see containing
+# query_str, messages with a smaller rank come first
+def ranked_matches(auth_user_id, query_str, order):
+    query = query_str.lower()
+    containers = [(0, channel_id, lookup('channels', channel_id))
+                  for channel_id in sorted(members('user_channels', auth_user_id))]
+    containers += [(1, dm_id, lookup('dms', dm_id))
+                   for dm_id in sorted(members('user_dms', auth_user_id))]
+    for kind, container_id, container in containers:
+        for message in search_messages(container, query):
+            if order == 'joined':
+                rank = (kind, container_id, -message['time_created'], -message['message_id'])
+            elif order == 'time':
+                rank = (-message['time_created'], -message['message_id'])
+            else:
+                rank = (-message['message'].lower().count(query), -message['time_created'], -message['message_id'])
+            yield rank, message
 
+# Returns the rank a cursor stands for, or None if it is not valid for order
+def parse_cursor(cursor, order):
+    parts = [parse_int(part) for part in str(cursor).split(',')]
+    if None in parts or len(parts) != {'joined': 4, 'time': 2, 'relevance': 3}[order]:
+        return None
+    return tuple(parts)
@@ -0,0 +1,155 @@
+'''
+Inverted index over the text of messages in channels and DMs
+
+Every lowercased substring of GRAM_SIZE characters of a message is posted
+under the channel or DM holding it. A query is answered by intersecting the
+postings of its own substrings within each channel/DM the user has joined,
+so only messages that may contain the query are looked at. The candidates
+still need checking against the full query, since all the substrings of a
+longer query can appear without the query itself.
+
+A query shorter than GRAM_SIZE is found inside the posted substrings that
+contain it, plus the messages too short to have any, which are kept apart.
+Nothing is kept per message, so removing or changing one takes its old
+text to work out what to take out.
+
+The index has a lock of its own, since searches only hold the searching
+user's stripe while messages are added and removed under the stripes of
+their channels/DMs. Candidates are handed back as a set of their own.
+
+Example usage:
+
+    index = SearchIndex()
+    index.add(('channel', 1), 3, 'Hello world')
+    index.candidates(('channel', 1), 'WORLD')   # {3}
+'''
+
+import threading
+
+# Length of the substrings that are posted
+GRAM_SIZE = 3
+
+# Returns the lowercased substrings of text of GRAM_SIZE characters
+def message_grams(text):
+    text = text.lower()
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+# Returns the substrings every message containing query must contain, the
+# query must be at least GRAM_SIZE characters
+def query_grams(query):
+    return {query[i:i + GRAM_SIZE] for i in range(len(query) - GRAM_SIZE + 1)}
+
+class SearchIndex:
+    '''
+    Postings of message substrings, partitioned by channel/DM
+    '''
+    def __init__(self):
+        # container key -> {gram -> set of message_ids}
+        self.postings = {}
+        # container key -> set of message_ids shorter than GRAM_SIZE
+        self.short = {}
+        self.lock = threading.Lock()
+
+    def clear(self):
+        '''
+        Forget every message
+        '''
+        with self.lock:
+            self.postings.clear()
+            self.short.clear()
+
+    def add(self, key, message_id, text):
+        '''
+        Post a message that was added to a channel/DM
+
+        Arguments:
+            <key>          (<tuple>)    - identifies the channel/DM
+            <message_id>   (<int>)      - id of the message
+            <text>         (<string>)   - text of the message
+        '''
+        with self.lock:
+            self.post(key, message_id, text)
+
+    def update(self, key, message_id, old_text, text):
+        '''
+        Repost a message whose text has changed from old_text
+        '''
+        with self.lock:
+            self.unpost(key, message_id, old_text)
+            self.post(key, message_id, text)
+
+    def remove(self, key, message_id, text):
+        '''
+        Forget a message that was removed from its channel/DM, text is the
+        text it was posted with
+        '''
+        with self.lock:
+            self.unpost(key, message_id, text)
+
+    def candidates(self, key, query):
+        '''
+        Find the messages of a channel/DM that may contain query
+
+        Arguments:
+            <key>     (<tuple>)    - identifies the channel/DM
+            <query>   (<string>)   - text to search for, any case
+
+        Return Value:
+            Returns the candidate message_ids as an unordered set
+        '''
+        query = query.lower()
+        with self.lock:
+            by_gram = self.postings.get(key, {})
+            if len(query) < GRAM_SIZE:
+                found = set(self.short.get(key, ()))
+                for gram, message_ids in by_gram.items():
+                    if query in gram:
+                        found |= message_ids
+                return found
+            found = None
+            # Start from the shortest posting list so the sets only shrink
+            postings = sorted((by_gram.get(gram, ()) for gram in query_grams(query)), key=len)
+            for message_ids in postings:
+                if found is None:
+                    found = set(message_ids)
+                else:
+                    found &= message_ids
+                if not found:
+                    return set()
+            return found
+
+    # Adds a message to the postings, the caller holds the lock
+    def post(self, key, message_id, text):
+        if len(text) < GRAM_SIZE:
+            self.short.setdefault(key, set()).add(message_id)
+            return
+        by_gram = self.postings.setdefault(key, {})
+        for gram in message_grams(text):
+            message_ids = by_gram.get(gram)
+            if message_ids is None:
+                by_gram[gram] = {message_id}
+            else:
+                message_ids.add(message_id)
+
+    # Takes a message out of the postings, the caller holds the lock
+    def unpost(self, key, message_id, text):
+        if len(text) < GRAM_SIZE:
+            discard(self.short, key, message_id)
+            return
+        by_gram = self.postings.get(key)
+        if by_gram is None:
+            return
+        for gram in message_grams(text):
+            discard(by_gram, gram, message_id)
+        if not by_gram:
+            del self.postings[key]
+
+# Helper function for SearchIndex
+# Takes message_id out of the set kept under key, dropping the set once empty
+def discard(sets, key, message_id):
+    message_ids = sets.get(key)
+    if message_ids is None:
+        return
+    message_ids.discard(message_id)
+    if not message_ids:
+        del sets[key]
@@ -1,6 +1,6 @@
 import signal
 from json import dumps
-from flask import Flask, request, send_from_directory
+from flask import Flask, Response, request, send_from_directory
 from flask_cors import CORS
 from src.error import InputError
 from src import config
@@ -13,12 +13,17 @@ from src.channel import channel_removeowner_v1, channel_addowner_v1, channel_mes
 from src.dm import dm_create_v1, dm_list_v1, dm_remove_v1, dm_details_v1, message_senddm_v1, dm_messages_v1, dm_leave_v1
 from src.message import message_send_v1, message_edit_v1, message_remove_v1, message_react_v1, message_unreact_v1, message_pin_v1
 from src.message import message_unpin_v1, message_sendlater_v1, message_sendlaterdm_v1, message_share_v1
+from src.message import message_sendlater_list_v1, message_sendlater_cancel_v1, restore_scheduled_messages
 from src.user import user_profile_sethandle_v1, user_profile_setemail_v1, user_profile_setname_v1, user_profile_v1, users_all_v1
-from src.standup import standup_start_v1, standup_active_v1, standup_send_v1
+from src.standup import standup_start_v1, standup_active_v1, standup_send_v1, restore_standups
 from src.user import user_stats_v1, user_profile_uploadphoto_v1, users_stats_v1
+from src.user import downsample_stats
 from src.notifications import notifications_get_v1
+from src.events import events_stream_v1
 from src.search import search_v1
 from src.other import clear_v1
+from src.data_store import begin, commit, rollback, transaction_flushes, transaction_concurrency
+from src.server_helper import request_keys
 
 def quit_gracefully(*args):
     '''For coverage'''
@@ -43,6 +48,77 @@ APP.register_error_handler(Exception, defaultHandler)
 
 #### NO NEED TO MODIFY ABOVE THIS POINT, EXCEPT IMPORTS
 
+######## UNIT OF WORK ########
+
+# Routes that may change records beyond the channels, DMs and users named
+# in their parameters, their unit of work holds the whole store
+WHOLE_STORE_ROUTES = {
+    '/auth/register/v2',
+    '/auth/login/v2',
+    '/auth/passwordreset/reset/v1',
+    '/channels/create/v2',
+    '/dm/create/v1',
+    '/dm/remove/v1',
+    '/user/profile/setemail/v1',
+    '/user/profile/sethandle/v1',
+    '/admin/user/remove/v1',
+    '/admin/userpermission/change/v1',
+}
+
+# Routes that wait on background work, they open their own unit of work
+# once it is done
+SELF_LOCKING_ROUTES = {
+    '/clear/v1',
+    '/notifications/get/v1',
+    # Talking to the mail server or fetching the image happens outside the
+    # unit of work, so it never holds up other requests
+    '/auth/passwordreset/request/v1',
+    '/user/profile/uploadphoto/v1',
+    # Holding locks for as long as the stream is open would stall everyone
+    '/events/stream/v1',
+}
+
+# Each request is one unit of work: save() calls made by the handler only
+# mark the store dirty, and it is written out once when the request ends.
+# It holds the locks of the channels, DMs and users the request names
+@APP.before_request
+def begin_unit_of_work():
+    if request.path in SELF_LOCKING_ROUTES:
+        return
+    if request.path in WHOLE_STORE_ROUTES:
+        begin()
+        return
+    params = dict(request.args)
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        params.update(body)
+    begin(request_keys(params))
+
+@APP.after_request
+def end_unit_of_work(response):
+    if response.status_code >= 400:
+        rollback()
+    else:
+        commit()
+    response.headers['X-Store-Flushes'] = str(transaction_flushes())
+    if config.concurrency_header:
+        response.headers['X-Store-Concurrency'] = str(transaction_concurrency())
+    return response
+
+# Makes sure a unit of work never leaks into the next request on this thread
+@APP.teardown_request
+def close_unit_of_work(exc):
+    rollback()
+
+######## SCHEDULED WORK ########
+
+# Messages scheduled and standups started before a restart are queued again
+restore_scheduled_messages()
+restore_standups()
+# Old stats are thinned out in the background when a retention is set
+if config.stats_retention:
+    downsample_stats()
+
 # Example
 @APP.route("/echo", methods=['GET'])
 def echo():
@@ -180,8 +256,10 @@ def channel_leave():
 def channel_messages():
     token = (request.args.get('token'))
     channel_id = int(request.args.get('channel_id'))
-    start = int(request.args.get('start'))
-    return dumps(channel_messages_v2(token, channel_id, start))
+    start = int(request.args.get('start', 0))
+    cursor = (request.args.get('cursor'))
+    limit = (request.args.get('limit'))
+    return dumps(channel_messages_v2(token, channel_id, start, cursor, limit))
 
 ############ USERS #################
 
@@ -194,7 +272,8 @@ def user_all():
 # Fetches the required statistics about the use of UNSW Streams
 @APP.route("/users/stats/v1", methods=['GET'])
 def users_stats(): 
-    result = users_stats_v1(request.args.get('token'))
+    result = users_stats_v1(request.args.get('token'), request.args.get('from'),
+                            request.args.get('to'))
     return dumps(result)
 
 ############## USER #################
@@ -229,7 +308,8 @@ def user_sethandle():
 # Returns information about 1 user
 @APP.route("/user/stats/v1", methods=['GET'])
 def user_stats(): 
-    result = user_stats_v1(request.args.get('token'))
+    result = user_stats_v1(request.args.get('token'), request.args.get('from'),
+                           request.args.get('to'))
     return dumps(result)
 
 # Uploads given photo to given dimensions
@@ -316,6 +396,19 @@ def message_sendlaterdm():
     resp = message_sendlaterdm_v1(json['token'], json['dm_id'], json['message'], json['time_sent'])
     return dumps(resp)
 
+# List the messages the auth_user has scheduled that have not been sent yet
+@APP.route("/message/sendlater/list/v1", methods=['GET'])
+def message_sendlater_list():
+    token = request.args.get('token')
+    return dumps(message_sendlater_list_v1(token))
+
+# Cancel a scheduled message before it is sent
+@APP.route("/message/sendlater/cancel/v1", methods=['DELETE'])
+def message_sendlater_cancel():
+    json = request.get_json()
+    resp = message_sendlater_cancel_v1(json['token'], json['message_id'])
+    return dumps(resp)
+
 # Message is shared to another channel/DM. An optional message can be added 
 # onto the shared message
 @APP.route("/message/share/v1", methods=['POST'])
@@ -348,8 +441,10 @@ def dm_create():
 def dm_message(): 
     token = (request.args.get('token'))
     dm_id = int(request.args.get('dm_id'))
-    start = int(request.args.get('start'))
-    return dumps(dm_messages_v1(token, dm_id, start))
+    start = int(request.args.get('start', 0))
+    cursor = (request.args.get('cursor'))
+    limit = (request.args.get('limit'))
+    return dumps(dm_messages_v1(token, dm_id, start, cursor, limit))
 
 # Returns the list of DMs that the user is a member of
 @APP.route("/dm/list/v1", methods=['GET'])
@@ -395,15 +490,48 @@ def notifications_get():
     token = (request.args.get('token'))
     return dumps(notifications_get_v1(token))
 
+############ EVENTS #################
+
+# Stream changes to the messages of the user's channels and DMs as
+# Server-Sent Events
+@APP.route("/events/stream/v1", methods=['GET'])
+def events_stream():
+    token = (request.args.get('token'))
+    return Response(events_stream_v1(token), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 ############ SEARCH #################
 
 # Given a query string, return a collection of messages in all of the channels/DMs that the
 # user has joined that contain the query.
+# With stream=true the messages are sent one JSON object per line, followed
+# by a {"next_cursor": ...} line. Streamed results are always paged,
+# config.messages_page_size at a time unless a limit is given, so no request
+# sorts every match
 @APP.route("/search/v1", methods=['GET'])
 def search():
     token = (request.args.get('token'))
     query_str = (request.args.get('query_str'))
-    return dumps(search_v1(token, query_str))
+    limit = (request.args.get('limit'))
+    cursor = (request.args.get('cursor'))
+    order = (request.args.get('order', 'joined'))
+    stream = request.args.get('stream') == 'true'
+    if stream and limit is None:
+        limit = config.messages_page_size
+    resp = search_v1(token, query_str, limit, cursor, order)
+    if not stream:
+        return dumps(resp)
+    # The messages are live store records, so the lines are serialised here
+    # while the unit of work still holds their locks, and only the prepared
+    # strings are streamed once it has ended
+    return Response(stream_lines(resp), mimetype='application/x-ndjson')
+
+# Serialises a search result into the lines to stream
+def stream_lines(resp):
+    lines = [dumps(message) + '\n' for message in resp['messages']]
+    if 'next_cursor' in resp:
+        lines.append(dumps({'next_cursor': resp['next_cursor']}) + '\n')
+    return lines
 
 ######## STANDUP ######## 
 
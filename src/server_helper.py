@@ -1,14 +1,24 @@
 import jwt
+import threading
+from collections import OrderedDict
+from src import config
 
 SESS_COUNTER = 0
 SECRET = "CAMEL"
 
-from src.data_store import get_data
+from src.data_store import lookup, newest_session_id, container_key
+from src.helper import parse_int
 
-# Generates session id 
+# Tokens that have already been verified, mapped to their payload and
+# kept in least recently used order
+TOKEN_CACHE = OrderedDict()
+TOKEN_CACHE_LOCK = threading.Lock()
+
+# Generates session id
 def generate_sess_id():
     global SESS_COUNTER
-    SESS_COUNTER += 1
+    # Carry on after the sessions loaded from the database
+    SESS_COUNTER = max(SESS_COUNTER, newest_session_id()) + 1
     return SESS_COUNTER
 
 # Helper function for auth_register
@@ -24,25 +34,64 @@ def generate_token(auth_user_id, session_id=None):
     }
     token = jwt.encode(payload, SECRET, algorithm='HS256')
     return token
-    
+
+# Decodes the token once and remembers the payload
+def decode_payload(token):
+    with TOKEN_CACHE_LOCK:
+        payload = TOKEN_CACHE.get(token)
+        if payload is not None:
+            TOKEN_CACHE.move_to_end(token)
+            return payload
+    payload = jwt.decode(token, SECRET, algorithms=['HS256'])
+    with TOKEN_CACHE_LOCK:
+        TOKEN_CACHE[token] = payload
+        if len(TOKEN_CACHE) > config.token_cache_size:
+            TOKEN_CACHE.popitem(last=False)
+    return payload
+
+# Helper function for auth_logout, admin_user_remove
+# Drops the cached tokens of a user, or only the one for session_id
+def forget_tokens(auth_user_id, session_id=None):
+    with TOKEN_CACHE_LOCK:
+        for token, payload in list(TOKEN_CACHE.items()):
+            if payload['auth_user_id'] != auth_user_id:
+                continue
+            if session_id is None or payload['session_id'] == session_id:
+                del TOKEN_CACHE[token]
+
 # Decoding the token and returning the auth_user_id
 def decode_token(token):
-    global SECRET
-    decode = jwt.decode(token, SECRET, algorithms=['HS256'])
-    return decode['auth_user_id']
+    return decode_payload(token)['auth_user_id']
 
 # Decoding the token and returning the session_id
 def decode_token_session_id(token):
-    global SECRET
-    decode = jwt.decode(token, SECRET, algorithms=['HS256'])
-    return decode['session_id']
+    return decode_payload(token)['session_id']
 
 # Check token is valid with valid session_id
 def valid_user(token):
-    
-    for user in get_data()['users']:
-        if user['auth_user_id'] == decode_token(token):
-            for session in range(len(user['session_list'])):
-                if (user['session_list'][session]) == decode_token_session_id(token):
-                    return True
-    return False
+    try:
+        payload = decode_payload(token)
+    except (jwt.InvalidTokenError, TypeError):
+        return False
+    user = lookup('sessions', payload.get('session_id'))
+    return user is not None and user['auth_user_id'] == payload.get('auth_user_id')
+
+# Helper function for the unit of work of a request
+# Returns the stripe keys of the channels, DMs and users named in the
+# request's parameters, e.g. [('user', 1), ('channel', 2)]
+def request_keys(params):
+    keys = []
+    try:
+        keys.append(('user', decode_token(params.get('token'))))
+    except (jwt.InvalidTokenError, TypeError, KeyError):
+        pass
+    for field, kind in (('u_id', 'user'), ('channel_id', 'channel'), ('dm_id', 'dm')):
+        value = parse_int(params.get(field))
+        if value is not None:
+            keys.append((kind, value))
+    # A message is worked on under the lock of the channel/DM holding it
+    for field in ('message_id', 'og_message_id'):
+        location = lookup('locations', parse_int(params.get(field)))
+        if location is not None:
+            keys.append(container_key(location[0]))
+    return keys
@@ -0,0 +1,225 @@
+'''
+Binary snapshot format for the write-ahead log
+
+A JSON snapshot has to be parsed in one go, and writing one builds the
+whole document as text. A binary snapshot stores the store one record at
+a time instead, each record encoded with marshal and prefixed with its
+length, optionally compressed with zlib as it is written.
+
+Layout:
+
+    header    MAGIC, format version, marshal version, compression, seq
+    body      for each collection in the store:
+                  name      (length-prefixed UTF-8)
+                  count     (-1 for a value that is not a table)
+                  records   (length-prefixed marshal data, count of them)
+
+marshal's format is only promised to stay the same within one version of
+Python, so the marshal version is kept in the header. A snapshot written by
+a different version is refused, and should be converted through JSON.
+
+Converting (from the repository root):
+
+    python -m src.snapshot to-binary database.json database.snap
+    python -m src.snapshot to-json database.snap database.json
+'''
+import gc
+import json
+import marshal
+import os
+import struct
+import sys
+import zlib
+from contextlib import contextmanager
+
+MAGIC = b'DREAMSNP'
+FORMAT_VERSION = 1
+
+# Version of the JSON snapshot layout, {'version', 'seq', 'store'}
+JSON_VERSION = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+# Magic, format version, marshal version, compression, seq
+HEADER = struct.Struct('<8sBBBxQ')
+LENGTH = struct.Struct('<I')
+COUNT = struct.Struct('<i')
+
+# Data is compressed and written out in chunks of this many bytes
+CHUNK_SIZE = 1024 * 1024
+
+# Helper function for load_any
+# Holds off the garbage collector while a snapshot is decoded. Decoding
+# allocates millions of containers, none of them garbage, and otherwise the
+# collector keeps walking every one of them as the store grows
+@contextmanager
+def paused_gc():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+class SnapshotError(Exception):
+    '''
+    Raised when a snapshot cannot be read
+    '''
+
+# Helper class for write_snapshot
+# Collects encoded records and writes them out a chunk at a time
+class ChunkWriter:
+    def __init__(self, FILE, compress):
+        self.FILE = FILE
+        self.compressor = zlib.compressobj(1) if compress else None
+        self.parts = []
+        self.size = 0
+
+    def add(self, data):
+        self.parts.append(LENGTH.pack(len(data)))
+        self.parts.append(data)
+        self.size += LENGTH.size + len(data)
+        if self.size >= CHUNK_SIZE:
+            self.flush()
+
+    def add_count(self, count):
+        self.parts.append(COUNT.pack(count))
+        self.size += COUNT.size
+
+    def flush(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        self.size = 0
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self.FILE.write(data)
+
+    def close(self):
+        self.flush()
+        if self.compressor is not None:
+            self.FILE.write(self.compressor.flush())
+
+def write_snapshot(path, seq, store, compress=False):
+    '''
+    Write a store as a binary snapshot
+
+    Arguments:
+        <path>       (<string>)   - file to write
+        <seq>        (<int>)      - seq of the last commit in the snapshot
+        <store>      (<dict>)     - the store
+        <compress>   (<bool>)     - compress the body with zlib
+    '''
+    compression = COMPRESSION_ZLIB if compress else COMPRESSION_NONE
+    with open(path, 'wb') as FILE:
+        FILE.write(HEADER.pack(MAGIC, FORMAT_VERSION, marshal.version, compression, seq))
+        writer = ChunkWriter(FILE, compress)
+        for name, value in store.items():
+            writer.add(name.encode())
+            if isinstance(value, list):
+                writer.add_count(len(value))
+                for record in value:
+                    writer.add(marshal.dumps(record))
+            else:
+                writer.add_count(-1)
+                writer.add(marshal.dumps(value))
+        writer.close()
+
+def is_snapshot(path):
+    '''
+    Return Value:
+        Returns true if path holds a binary snapshot rather than JSON
+    '''
+    with open(path, 'rb') as FILE:
+        return FILE.read(len(MAGIC)) == MAGIC
+
+def read_snapshot(path):
+    '''
+    Read a binary snapshot
+
+    Exceptions:
+        SnapshotError - Occurs when the file is not a binary snapshot, or was
+                        written by a different format or marshal version
+
+    Return Value:
+        Returns (seq, store)
+    '''
+    with open(path, 'rb') as FILE:
+        header = FILE.read(HEADER.size)
+        body = FILE.read()
+    if len(header) < HEADER.size:
+        raise SnapshotError(f'{path} is too short to be a snapshot')
+    magic, version, marshal_version, compression, seq = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise SnapshotError(f'{path} is not a binary snapshot')
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f'{path} has snapshot format {version}, expected {FORMAT_VERSION}')
+    if marshal_version != marshal.version:
+        raise SnapshotError(f'{path} was written with marshal version {marshal_version}, '
+                            f'convert it to JSON with the Python version that wrote it')
+    if compression == COMPRESSION_ZLIB:
+        body = zlib.decompress(body)
+    elif compression != COMPRESSION_NONE:
+        raise SnapshotError(f'{path} has unknown compression {compression}')
+
+    view = memoryview(body)
+    offset = 0
+    # Returns the next length-prefixed item of the body
+    def read_item():
+        nonlocal offset
+        (length, ) = LENGTH.unpack_from(view, offset)
+        offset += LENGTH.size
+        item = view[offset:offset + length]
+        offset += length
+        return item
+
+    store = {}
+    try:
+        while offset < len(view):
+            name = bytes(read_item()).decode()
+            (count, ) = COUNT.unpack_from(view, offset)
+            offset += COUNT.size
+            if count < 0:
+                store[name] = marshal.loads(read_item())
+            else:
+                store[name] = [marshal.loads(read_item()) for _ in range(count)]
+    except (struct.error, ValueError, EOFError, TypeError) as error:
+        raise SnapshotError(f'{path} is damaged: {error}') from error
+    return seq, store
+
+# Writes a store as a JSON snapshot. json.dumps encodes it in one call,
+# json.dump would hand the file thousands of small pieces
+def write_json(path, seq, store):
+    with open(path, 'w') as FILE:
+        FILE.write(json.dumps({'version': JSON_VERSION, 'seq': seq, 'store': store}))
+
+# Reads either kind of snapshot as (seq, store), a database.json written
+# before the log existed has a seq of 0
+def load_any(path):
+    with paused_gc():
+        if is_snapshot(path):
+            return read_snapshot(path)
+        with open(path, 'r') as FILE:
+            snapshot = json.load(FILE)
+    if 'store' in snapshot and 'seq' in snapshot:
+        return snapshot['seq'], snapshot['store']
+    return 0, snapshot
+
+# Converts a snapshot between JSON and binary
+def convert(command, source, target):
+    seq, store = load_any(source)
+    temp_path = target + '.tmp'
+    if command == 'to-binary':
+        write_snapshot(temp_path, seq, store, compress=True)
+    elif command == 'to-json':
+        write_json(temp_path, seq, store)
+    else:
+        raise ValueError(f'unknown command {command}')
+    os.replace(temp_path, target)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] not in ('to-binary', 'to-json'):
+        print('usage: python -m src.snapshot to-binary|to-json SOURCE TARGET')
+        sys.exit(1)
+    convert(*sys.argv[1:])
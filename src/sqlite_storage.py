@@ -0,0 +1,567 @@
+'''
+SQLite storage for the data store
+
+Records are kept in indexed tables: users, sessions, channels, dms,
+memberships, messages, reacts, scheduled_messages, notifications,
+user_notifications and stats. The list fields of a record, such as a
+channel's members or a user's stats, are rows of their own table. The
+other fields of a record are kept as JSON, with the fields worth looking
+records up by copied into indexed columns.
+
+Every commit is also added to the oplog table, so that other server
+processes sharing the database pick up only what changed instead of
+reading every table again. The database runs in WAL journal mode, so they
+can read while one of them writes.
+
+Example usage:
+
+    storage = SqliteStorage('database.db', 1024 * 1024)
+    store = storage.recover(default)
+    ...
+    storage.commit(store)
+'''
+import json
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from src.storage import Storage, TABLES
+from src.timeseries import USER_SERIES, WORKSPACE_SERIES
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS oplog (
+    seq INTEGER PRIMARY KEY,
+    ops TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_values (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    auth_user_id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    email TEXT,
+    handle_str TEXT,
+    is_removed INTEGER,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE INDEX IF NOT EXISTS users_handle ON users (handle_str);
+CREATE TABLE IF NOT EXISTS sessions (
+    auth_user_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    session_id INTEGER NOT NULL,
+    PRIMARY KEY (auth_user_id, position)
+);
+CREATE INDEX IF NOT EXISTS sessions_session ON sessions (session_id);
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT,
+    is_public INTEGER,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dms (
+    dm_id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT,
+    creator INTEGER,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dms_creator ON dms (creator);
+CREATE TABLE IF NOT EXISTS memberships (
+    container TEXT NOT NULL,
+    role TEXT NOT NULL,
+    container_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    PRIMARY KEY (container, role, container_id, position)
+);
+CREATE INDEX IF NOT EXISTS memberships_user ON memberships (u_id, container, role);
+CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY,
+    container TEXT NOT NULL,
+    container_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    u_id INTEGER,
+    time_created INTEGER,
+    message TEXT,
+    is_pinned INTEGER,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_container ON messages (container, container_id, position);
+CREATE INDEX IF NOT EXISTS messages_user ON messages (u_id);
+CREATE TABLE IF NOT EXISTS reacts (
+    message_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    react_id INTEGER,
+    record TEXT NOT NULL,
+    PRIMARY KEY (message_id, position)
+);
+CREATE TABLE IF NOT EXISTS scheduled_messages (
+    message_id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    u_id INTEGER,
+    time_sent INTEGER,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scheduled_messages_time ON scheduled_messages (time_sent);
+CREATE TABLE IF NOT EXISTS notifications (
+    notification_id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    channel_id INTEGER,
+    dm_id INTEGER,
+    notification_message TEXT,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_notifications (
+    auth_user_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    notification_id INTEGER NOT NULL,
+    PRIMARY KEY (auth_user_id, position)
+);
+CREATE INDEX IF NOT EXISTS user_notifications_notification ON user_notifications (notification_id);
+CREATE TABLE IF NOT EXISTS stats (
+    owner INTEGER NOT NULL,
+    series TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    total INTEGER,
+    time_stamp INTEGER,
+    PRIMARY KEY (owner, series, position)
+);
+'''
+
+# Owner of the workspace stats rows, no user has this id
+WORKSPACE = -1
+
+# Which kind of container the messages nested in each table belong to
+CONTAINERS = {
+    'channels': 'channel',
+    'dms': 'dm',
+}
+
+class ListField:
+    '''
+    A list field of a record kept as rows of a child table, in order
+    '''
+    def __init__(self, table, parent, fixed, columns, to_row, from_row):
+        self.table = table
+        self.parent = parent
+        # Columns telling this field's rows apart from other fields sharing the table
+        self.fixed = fixed
+        self.to_row = to_row
+        self.from_row = from_row
+        match = ''.join(f' AND {column} = ?' for column in fixed)
+        self.delete_sql = f'DELETE FROM {table} WHERE {parent} = ?{match} AND position >= ?'
+        self.clear_sql = f'DELETE FROM {table} WHERE {parent} IN ({{}}){match}'
+        names = [parent] + list(fixed) + ['position'] + list(columns)
+        self.insert_sql = f'INSERT INTO {table} ({", ".join(names)}) VALUES ({", ".join("?" * len(names))})'
+        where = ' AND '.join(f'{column} = ?' for column in fixed) or '1'
+        self.select_sql = f'SELECT {parent}, {", ".join(columns)} FROM {table} WHERE {where} ORDER BY {parent}, position'
+
+    def write(self, db, key, values, previous=None):
+        '''
+        Write the list of the record with primary key key. Only the items
+        after the part it shares with previous are written again
+        '''
+        fixed = list(self.fixed.values())
+        start = 0
+        if previous is not None:
+            while start < min(len(values), len(previous)) and values[start] == previous[start]:
+                start += 1
+        db.execute(self.delete_sql, [key] + fixed + [start])
+        db.executemany(self.insert_sql, [
+            [key] + fixed + [position] + list(self.to_row(value))
+            for position, value in enumerate(values[start:], start)
+        ])
+
+    def write_tail(self, db, key, start, values):
+        '''
+        Replace the items of the list of the record with primary key key
+        from position start on
+        '''
+        fixed = list(self.fixed.values())
+        db.execute(self.delete_sql, [key] + fixed + [start])
+        db.executemany(self.insert_sql, [
+            [key] + fixed + [position] + list(self.to_row(value))
+            for position, value in enumerate(values, start)
+        ])
+
+    def clear(self, db, parents_sql, parents_args):
+        '''
+        Delete the lists of every record picked out by the query parents_sql
+        '''
+        db.execute(self.clear_sql.format(parents_sql), list(parents_args) + list(self.fixed.values()))
+
+    def read(self, db):
+        '''
+        Return Value:
+            Returns parent key -> list, for every record with items
+        '''
+        lists = {}
+        for row in db.execute(self.select_sql, list(self.fixed.values())):
+            lists.setdefault(row[0], []).append(self.from_row(row[1:]))
+        return lists
+
+# Helper function for the LAYOUTS
+# Returns the list field of a stats series, a list of {field: total, 'time_stamp': t}
+def stats_field(series, field):
+    return ListField('stats', 'owner', {'series': series}, ('total', 'time_stamp'),
+                     lambda entry: (entry[field], entry['time_stamp']),
+                     lambda row: {field: row[0], 'time_stamp': row[1]})
+
+# Helper function for the LAYOUTS
+# Returns the list field of the u_ids in a channel or DM
+def members_field(container, role):
+    return ListField('memberships', 'container_id', {'container': container, 'role': role}, ('u_id', ),
+                     lambda u_id: (u_id, ), lambda row: row[0])
+
+# Helper function for the LAYOUTS
+# Returns the list field of a list of ids, e.g. a user's session ids
+def ids_field(table, parent, column):
+    return ListField(table, parent, {}, (column, ), lambda value: (value, ), lambda row: row[0])
+
+class Layout:
+    '''
+    How the records of one table are laid out in SQL
+    '''
+    def __init__(self, table, key, columns, lists, scope=(), nested=()):
+        self.table = table
+        self.key = key
+        # Fields copied out of the record into their own column
+        self.columns = columns
+        # List fields kept in child tables, field -> ListField
+        self.lists = lists
+        # Columns telling apart the lists of records sharing the table,
+        # e.g. the messages of each channel and DM
+        self.scope = scope
+        # Nested tables, kept in a table of their own
+        self.nested = nested
+        self.scope_sql = ''.join(f' AND {column} = ?' for column in scope)
+        names = (key, ) + scope + ('position', ) + columns + ('record', )
+        self.insert_sql = f'INSERT OR REPLACE INTO {table} ({", ".join(names)}) VALUES ({", ".join("?" * len(names))})'
+
+    def row(self, scope, position, record):
+        fields = {field: value for field, value in record.items()
+                  if field not in self.lists and field not in self.nested}
+        return ([record[self.key]] + list(scope) + [position]
+                + [record.get(column) for column in self.columns] + [json.dumps(fields)])
+
+    def put(self, db, scope, index, record, previous=None, tails=None):
+        '''
+        Write one record that is at index in its list. List fields in tails
+        are written from their start on, see storage.SERIES
+        '''
+        key = record[self.key]
+        found = db.execute(f'SELECT position FROM {self.table} WHERE {self.key} = ?', (key, )).fetchone()
+        if found is None:
+            db.execute(f'UPDATE {self.table} SET position = position + 1 WHERE position >= ?{self.scope_sql}',
+                       [index] + list(scope))
+            position = index
+            previous = None
+        else:
+            position = found[0]
+        db.execute(self.insert_sql, self.row(scope, position, record))
+        for field, list_field in self.lists.items():
+            if tails is not None and field in tails:
+                list_field.write_tail(db, key, *tails[field])
+                continue
+            list_field.write(db, key, record.get(field, []),
+                             None if previous is None else previous.get(field))
+
+    def delete(self, db, scope, key):
+        '''
+        Delete one record, closing the gap it leaves in its list
+        '''
+        found = db.execute(f'SELECT position FROM {self.table} WHERE {self.key} = ?', (key, )).fetchone()
+        if found is None:
+            return
+        for list_field in self.lists.values():
+            list_field.clear(db, '?', [key])
+        db.execute(f'DELETE FROM {self.table} WHERE {self.key} = ?', (key, ))
+        db.execute(f'UPDATE {self.table} SET position = position - 1 WHERE position > ?{self.scope_sql}',
+                   [found[0]] + list(scope))
+
+    def replace(self, db, scope, records):
+        '''
+        Replace every record in a scope
+        '''
+        keys_sql = f'SELECT {self.key} FROM {self.table} WHERE 1{self.scope_sql}'
+        for list_field in self.lists.values():
+            list_field.clear(db, keys_sql, scope)
+        db.execute(f'DELETE FROM {self.table} WHERE 1{self.scope_sql}', list(scope))
+        db.executemany(self.insert_sql, [self.row(scope, position, record) for position, record in enumerate(records)])
+        for record in records:
+            for field, list_field in self.lists.items():
+                list_field.write(db, record[self.key], record.get(field, []))
+
+    def read(self, db):
+        '''
+        Return Value:
+            Returns scope -> list of records, in order
+        '''
+        lists = {field: list_field.read(db) for field, list_field in self.lists.items()}
+        order = ', '.join(self.scope + ('position', ))
+        records = {}
+        for row in db.execute(f'SELECT {", ".join(self.scope + (self.key, ))}, record FROM {self.table} ORDER BY {order}'):
+            record = json.loads(row[-1])
+            for field, values in lists.items():
+                record[field] = values.get(row[-2], [])
+            records.setdefault(tuple(row[:len(self.scope)]), []).append(record)
+        return records
+
+LAYOUTS = {
+    'users': Layout('users', 'auth_user_id', ('email', 'handle_str', 'is_removed'), dict({
+        'session_list': ids_field('sessions', 'auth_user_id', 'session_id'),
+        'all_notifications': ids_field('user_notifications', 'auth_user_id', 'notification_id'),
+    }, **{series: stats_field(series, field) for series, field in USER_SERIES.items()})),
+    'channels': Layout('channels', 'channel_id', ('name', 'is_public'), {
+        'all_members': members_field('channel', 'member'),
+        'owner_members': members_field('channel', 'owner'),
+    }, nested=('messages', )),
+    'dms': Layout('dms', 'dm_id', ('name', 'creator'), {
+        'members': members_field('dm', 'member'),
+    }, nested=('messages', )),
+    'scheduled_messages': Layout('scheduled_messages', 'message_id', ('u_id', 'time_sent'), {}),
+    'notifications': Layout('notifications', 'notification_id', ('channel_id', 'dm_id', 'notification_message'), {}),
+}
+
+# Messages nested in channels and DMs
+MESSAGES = Layout('messages', 'message_id', ('u_id', 'time_created', 'message', 'is_pinned'), {
+    'reacts': ListField('reacts', 'message_id', {}, ('react_id', 'record'),
+                        lambda react: (react.get('react_id'), json.dumps(react)),
+                        lambda row: json.loads(row[1])),
+}, ('container', 'container_id'))
+
+# Series of the workspace stats kept in the stats table
+WORKSPACE_FIELDS = {series: stats_field(series, field) for series, field in WORKSPACE_SERIES.items()}
+
+class SqliteStorage(Storage):
+    '''
+    SQLite database of the store's records, plus a log of recent commits
+    '''
+    def __init__(self, path, compact_size, legacy=None):
+        '''
+        Arguments:
+            <path>           (<string>)   - the database file
+            <compact_size>   (<int>)      - bytes of oplog kept for other processes
+            <legacy>         (<Storage>)  - optional, storage the store is
+                                            copied from while the database is empty
+        '''
+        super().__init__()
+        self.path = path
+        self.compact_size = compact_size
+        self.legacy = legacy
+        self.db = None
+        # Changes when the whole store is written out again
+        self.generation = None
+        self.oplog_size = 0
+        self.locked = False
+
+    # Opens the database the first time it is needed
+    def connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode = WAL')
+            # FULL syncs every commit to disk, NORMAL leaves it to checkpoints
+            self.db.execute(f"PRAGMA synchronous = {'FULL' if self.fsync else 'NORMAL'}")
+            self.db.executescript(SCHEMA)
+        return self.db
+
+    # Runs a block as one SQLite transaction, or as part of the one lock() holds
+    @contextmanager
+    def writing(self):
+        db = self.connect()
+        if self.locked:
+            yield db
+            return
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    @contextmanager
+    def lock(self):
+        '''
+        Hold SQLite's write lock, shared with other processes
+        '''
+        with self.writing():
+            self.locked = True
+            try:
+                yield
+            finally:
+                self.locked = False
+
+    # Returns a value from the meta table, None if it is not set
+    def meta(self, name):
+        row = self.connect().execute('SELECT value FROM meta WHERE name = ?', (name, )).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set_meta(self, db, name, value):
+        db.execute('INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)', (name, json.dumps(value)))
+
+    ##### Recovery #####
+    def recover(self, default):
+        '''
+        Read the store from the database. An empty database takes the store
+        from the legacy storage, and writes it out once it is upgraded
+
+        Return Value:
+            Returns the recovered store, or default if nothing was persisted
+        '''
+        generation = self.meta('generation')
+        if generation is None:
+            store = default
+            if self.legacy is not None:
+                store = self.legacy.recover(default)
+            # The whole store is written out once it is upgraded, commits
+            # are only added on top of that
+            self.needs_compact = True
+            self.seq = 0
+            self.reset_baseline(store)
+            return store
+        store = self.read_store()
+        self.generation = generation
+        self.seq = self.meta('seq')
+        self.oplog_size = 0
+        self.reset_baseline(store)
+        return store
+
+    # Builds the store from every table
+    def read_store(self):
+        db = self.connect()
+        store = {}
+        for name, value in db.execute('SELECT name, value FROM store_values'):
+            store[name] = json.loads(value)
+        for name in self.meta('tables'):
+            store[name] = LAYOUTS[name].read(db).get((), [])
+        messages = MESSAGES.read(db)
+        for name, container in CONTAINERS.items():
+            for record in store.get(name, []):
+                record['messages'] = messages.get((container, record[TABLES[name]['key']]), [])
+        # Series left out of workspace_stats are in the stats table
+        workspace = store.get('workspace_stats')
+        if isinstance(workspace, dict):
+            for series, list_field in WORKSPACE_FIELDS.items():
+                if series in workspace and workspace[series] is None:
+                    workspace[series] = list_field.read(db).get(WORKSPACE, [])
+        return store
+
+    def refresh(self, store):
+        '''
+        Pick up commits written by other processes from the oplog, or read
+        the store again if they wrote it out from scratch since
+        '''
+        if self.meta('generation') != self.generation:
+            return self.recover(store)
+        rows = self.connect().execute('SELECT seq, ops FROM oplog WHERE seq > ? ORDER BY seq', (self.seq, )).fetchall()
+        if not rows:
+            return store
+        # Commits this process has not seen were dropped from the oplog
+        if rows[0][0] != self.seq + 1:
+            return self.recover(store)
+        parents = self.parent_lookup(store)
+        for seq, ops in rows:
+            for op in json.loads(ops):
+                self.apply_baseline(op)
+                self.apply(store, parents, op)
+            self.seq = seq
+        return store
+
+    ##### Commit #####
+    def write(self, batches):
+        '''
+        Write the records changed by the batches to their tables and add
+        each batch to the oplog, all in one SQLite transaction. Old commits
+        are dropped from the oplog once it is large enough
+        '''
+        with self.writing() as db:
+            for batch in batches:
+                line = json.dumps(batch['ops'])
+                for op in batch['ops']:
+                    self.write_op(db, op, batch['previous'])
+                self.seq += 1
+                db.execute('INSERT INTO oplog (seq, ops) VALUES (?, ?)', (self.seq, line))
+                self.oplog_size += len(line)
+            self.set_meta(db, 'seq', self.seq)
+            if self.oplog_size >= self.compact_size:
+                db.execute('DELETE FROM oplog WHERE seq < ?', (self.seq, ))
+                self.oplog_size = 0
+
+    # Writes one operation worked out by diff() to the tables, previous
+    # holds the records as they were before it
+    def write_op(self, db, op, previous):
+        path = op['path']
+        if op['op'] == 'set':
+            self.write_value(db, path[0], op['value'], previous.get((path[0], )), op.get('tails'))
+            return
+        if len(path) == 1:
+            # Retired tables are dropped when the store is upgraded
+            if path[0] not in LAYOUTS:
+                return
+            layout, scope = LAYOUTS[path[0]], ()
+        else:
+            layout, scope = MESSAGES, (CONTAINERS[path[0]], path[1])
+        if op['op'] == 'put':
+            layout.put(db, scope, op['index'], op['record'], previous.get((tuple(path), op['key'])), op.get('tails'))
+        elif op['op'] == 'delete':
+            layout.delete(db, scope, op['key'])
+            if path[0] in CONTAINERS and len(path) == 1:
+                MESSAGES.replace(db, (CONTAINERS[path[0]], op['key']), [])
+        elif op['op'] == 'replace':
+            if path[0] in CONTAINERS and len(path) == 1:
+                container = CONTAINERS[path[0]]
+                for list_field in MESSAGES.lists.values():
+                    list_field.clear(db, 'SELECT message_id FROM messages WHERE container = ?', [container])
+                db.execute('DELETE FROM messages WHERE container = ?', (container, ))
+                for record in op['records']:
+                    MESSAGES.replace(db, (container, record[TABLES[path[0]]['key']]), record.get('messages', []))
+            layout.replace(db, scope, op['records'])
+
+    # Writes a value that is not a table, the workspace stats series go
+    # to the stats table
+    def write_value(self, db, name, value, previous=None, tails=None):
+        if name == 'workspace_stats' and isinstance(value, dict):
+            value = dict(value)
+            for series, list_field in WORKSPACE_FIELDS.items():
+                if tails is not None and series in tails:
+                    list_field.write_tail(db, WORKSPACE, *tails[series])
+                    value[series] = None
+                elif isinstance(value.get(series), list):
+                    before = previous.get(series) if isinstance(previous, dict) else None
+                    list_field.write(db, WORKSPACE, value[series], before if isinstance(before, list) else None)
+                    value[series] = None
+        db.execute('INSERT OR REPLACE INTO store_values (name, value) VALUES (?, ?)', (name, json.dumps(value)))
+
+    def compact(self, store):
+        '''
+        Write the whole store out again and empty the oplog. Other processes
+        read the store again from scratch when they next refresh
+        '''
+        with self.writing() as db:
+            for table in ('store_values', 'users', 'sessions', 'channels', 'dms', 'memberships', 'messages',
+                          'reacts', 'scheduled_messages', 'notifications', 'user_notifications', 'stats', 'oplog'):
+                db.execute(f'DELETE FROM {table}')
+            tables = []
+            for name, value in store.items():
+                if name in LAYOUTS and isinstance(value, list):
+                    tables.append(name)
+                    LAYOUTS[name].replace(db, (), value)
+                    if name in CONTAINERS:
+                        for record in value:
+                            MESSAGES.replace(db, (CONTAINERS[name], record[TABLES[name]['key']]),
+                                             record.get('messages', []))
+                else:
+                    self.write_value(db, name, value)
+            self.generation = uuid.uuid4().hex
+            self.set_meta(db, 'tables', tables)
+            self.set_meta(db, 'generation', self.generation)
+            self.set_meta(db, 'seq', self.seq)
+        self.oplog_size = 0
+        self.needs_compact = False
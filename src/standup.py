@@ -1,13 +1,14 @@
-import threading
 import time
 from requests.api import get
 
 from werkzeug import exceptions 
-from src.data_store import get_data, save
+from src.data_store import get_data, save, transaction, after_commit
 from src.error import InputError, AccessError
 from src.helper import check_valid_channel_id, check_valid_member_in_channel, get_channel_details, get_handle
+from src.helper import check_valid_message
 from src.server_helper import valid_user, decode_token
-from src.message import message_send_v1
+from src.message import send_channel_message
+from src.scheduler import SCHEDULER
 from datetime import datetime, timezone
 
 def standup_start_v1(token, channel_id, length):
@@ -53,11 +54,12 @@ def standup_start_v1(token, channel_id, length):
         raise InputError('An active standup is currently running in the channel')
         
     time_finish = datetime.utcnow().replace(tzinfo=timezone.utc).timestamp() + length
-    t1 = threading.Timer(length, thread_helper, [token, length, channel_id])
-    t1.start()
     channel['standup']['is_active'] = True
     channel['standup']['time_finish'] = time_finish
+    # the user who started the standup sends the collected messages
+    channel['standup']['u_id'] = auth_user_id
     save()
+    after_commit(SCHEDULER.schedule, time_finish, standup_finish, channel_id, time_finish)
     return {'time_finish': time_finish}
 
 def standup_active_v1(token, channel_id):
@@ -144,19 +146,36 @@ def standup_send_v1(token, channel_id, message):
         save()
     return {}
 
-# Helper function for threading
-def thread_helper(token, length, channel_id):
-    time.sleep(length)
-    channel = get_channel_details(channel_id)
-    channel['standup']['is_active'] = False
-    channel['standup']['time_finish'] = None
-    message = channel['standup']['queue']
-    channel['standup']['queue'] = ''
-    save()
-    try:
-        message_send_v1(token, channel_id, message)
+# Helper function for the scheduler
+# Ends the standup and sends the collected messages as one message
+def standup_finish(channel_id, time_finish):
+    with transaction():
+        channel = get_channel_details(channel_id)
+        # The standup was cleared away or a newer one is running
+        if channel is None or channel['standup']['time_finish'] != time_finish:
+            return
+        standup = channel['standup']
+        standup['is_active'] = False
+        standup['time_finish'] = None
+        message = standup['queue']
+        standup['queue'] = ''
         save()
-    except InputError:
-        pass
-   
-    
\ No newline at end of file
+
+        # Nothing to send if the queue is empty or too long, or the user who
+        # started the standup is no longer in the channel
+        auth_user_id = standup.get('u_id')
+        if not check_valid_message(message):
+            return
+        if not check_valid_member_in_channel(channel_id, auth_user_id):
+            return
+        send_channel_message(auth_user_id, channel_id, message)
+        save()
+
+# Queues the end of every standup loaded from the database, called on
+# startup. Standups that ended while the server was down end straight away
+def restore_standups():
+    for channel in get_data()['channels']:
+        standup = channel['standup']
+        if standup['is_active']:
+            SCHEDULER.schedule(standup['time_finish'], standup_finish,
+                                channel['channel_id'], standup['time_finish'])
@@ -0,0 +1,694 @@
+'''
+Storage backends for the data store
+
+The store lives in memory. A backend writes it out as records and reads
+it back on startup. Every backend keeps a copy of the last committed
+state, so that each commit can compare the store against it record by
+record and write only the records that were added, changed or removed.
+When the caller knows which records may have changed, only those are
+compared, so a commit costs time in proportion to what changed rather
+than to the size of the store. The stats series of users and of the
+workspace only ever grow at the end, so they are written from the first
+entry that changed rather than whole. The same copy is used to undo
+uncommitted changes.
+
+Backends:
+    WriteAheadLog (src/wal.py)              - JSON snapshot plus an append-only log
+    SqliteStorage (src/sqlite_storage.py)   - SQLite database with indexed tables
+'''
+import json
+from src.timeseries import USER_SERIES, WORKSPACE_SERIES
+
+# Collections made up of records with a primary key.
+# Nested collections are stored as their own tables so that sending a
+# message does not rewrite the channel (or DM) that contains it.
+TABLES = {
+    'users': {'key': 'auth_user_id', 'nested': {}},
+    'channels': {'key': 'channel_id', 'nested': {'messages': 'message_id'}},
+    'dms': {'key': 'dm_id', 'nested': {'messages': 'message_id'}},
+    # Only found in logs written before messages were kept in their channel/DM alone
+    'messages': {'key': 'message_id', 'nested': {}},
+    'scheduled_messages': {'key': 'message_id', 'nested': {}},
+    'notifications': {'key': 'notification_id', 'nested': {}},
+}
+
+# Fields of the records of a table, or of a value that is not a table,
+# that hold stats series. A put or set operation for a record that was
+# already written carries them as 'tails', field -> [start, entries]: the
+# entries replace those from position start on, e.g.
+# {'messages_sent': [12, [{'num_messages_sent': 12, 'time_stamp': 1637000000}]]}
+SERIES = {
+    'users': tuple(USER_SERIES),
+    'workspace_stats': tuple(WORKSPACE_SERIES),
+}
+
+# Helper function for Storage
+# Returns the tails that turn the series of old into those of new, or None
+# if they cannot be written that way because either is not a record with
+# the same series
+def series_tails(old, new, fields):
+    if not fields or not isinstance(old, dict) or not isinstance(new, dict):
+        return None
+    tails = {}
+    for field in fields:
+        if field not in old and field not in new:
+            continue
+        before, after = old.get(field), new.get(field)
+        if not isinstance(before, list) or not isinstance(after, list):
+            return None
+        # Most often entries were added, or the last one was folded into
+        start = min(len(before), len(after))
+        if after[:start] != before[:start]:
+            start -= 1
+            if after[:start] != before[:start]:
+                start = 0
+                while after[start] == before[start]:
+                    start += 1
+        tails[field] = [start, after[start:]]
+    return tails
+
+# Helper function for Storage
+# Returns a record made of the fields of record that are not in tails,
+# with the series of old brought up to date by tails. The series lists of
+# old are changed in place
+def with_tails(old, record, tails):
+    merged = {field: value for field, value in record.items() if field not in tails}
+    for field, (start, entries) in tails.items():
+        series = old.get(field) if isinstance(old, dict) else None
+        if not isinstance(series, list):
+            series = []
+        del series[start:]
+        series.extend(entries)
+        merged[field] = series
+    return merged
+
+# Helper function for Storage
+# Returns true if applying tails to old would change any of its series
+def tails_change(old, tails):
+    return any(entries or start < len(old[field]) for field, (start, entries) in tails.items())
+
+# Helper function for Storage
+# Returns a copy of a record that shares nothing with the store
+def copy_record(record):
+    return json.loads(json.dumps(record))
+
+# Helper function for Storage
+# Returns the record without its nested collections
+def strip_nested(record, nested):
+    if not nested:
+        return record
+    return {field: value for field, value in record.items() if field not in nested}
+
+# Helper function for Storage
+# Returns the index of record in records, looking from the end since
+# changed records are most often the newest
+def position_of(records, record):
+    for index in range(len(records) - 1, -1, -1):
+        if records[index] is record:
+            return index
+    return None
+
+# Helper function for Storage
+# Returns the list stored at a table path e.g. ['channels', 1, 'messages']
+def find_table(store, path, parents):
+    if len(path) == 1:
+        return store[path[0]]
+    parent = parents[path[0]].get(path[1])
+    if parent is None:
+        return None
+    return parent[path[2]]
+
+class Storage:
+    '''
+    Base class of the storage backends, holding the last committed state
+    '''
+    def __init__(self):
+        self.seq = 0
+        # Last committed state, used to work out what changed
+        self.tables = {}
+        self.values = {}
+        # Records as they were before the changes found by the last diff(),
+        # as (table path, key) -> record, and values as (name, ) -> value,
+        # for backends that can write out only the part that changed
+        self.previous = {}
+        # True if the whole store has to be written out, e.g. once it is
+        # upgraded or the log has grown too large
+        self.needs_compact = False
+        # True to make sure each write has reached the disk before it returns
+        self.fsync = False
+
+    ##### Backend interface #####
+    def recover(self, default):
+        '''
+        Load the store that was last committed
+
+        Return Value:
+            Returns the recovered store, or default if nothing was persisted
+        '''
+        raise NotImplementedError
+
+    def refresh(self, store):
+        '''
+        Pick up commits written by other processes sharing the same
+        database, should be called while holding lock(). self.seq goes up
+        when anything was picked up
+
+        Return Value:
+            Returns the up to date store, which is a new object if it had to
+            be read again from scratch
+        '''
+        raise NotImplementedError
+
+    def lock(self):
+        '''
+        Context manager holding an exclusive lock on the database shared
+        with other processes
+        '''
+        raise NotImplementedError
+
+    def write(self, batches):
+        '''
+        Write out batches returned by stage(), in the order they were
+        staged, as one commit each. Sets needs_compact when the store should
+        be written out from scratch
+        '''
+        raise NotImplementedError
+
+    def compact(self, store):
+        '''
+        Write out the whole store, e.g. after it was upgraded in place
+        '''
+        raise NotImplementedError
+
+    ##### Commit #####
+    def stage(self, store, changes=None):
+        '''
+        Work out the records that changed since the last commit, and take
+        the store as the last committed state. The changes are written out
+        by passing them to write(), which need not happen straight away
+
+        Arguments:
+            <store>     (<dict>)   - the store
+            <changes>   (<dict>)   - optional, the only records that may have
+                                     changed, see diff()
+
+        Return Value:
+            Returns the batch of changes, or None if nothing changed
+        '''
+        ops = self.diff(store, changes)
+        if not ops:
+            return None
+        return {'ops': ops, 'previous': self.previous}
+
+    def commit(self, store, changes=None):
+        '''
+        Write out the records that changed since the last commit straight
+        away, compacting if the backend asks for it
+
+        Return Value:
+            Returns the number of operations written
+        '''
+        batch = self.stage(store, changes)
+        if batch is None:
+            return 0
+        self.write([batch])
+        if self.needs_compact:
+            self.compact(store)
+        return len(batch['ops'])
+
+    ##### Recovery #####
+    # Maps each parent table to {key: record} so nested ops can find their parent
+    def parent_lookup(self, store):
+        parents = {}
+        for name, spec in TABLES.items():
+            if spec['nested'] and isinstance(store.get(name), list):
+                parents[name] = {record[spec['key']]: record for record in store[name]}
+        return parents
+
+    # Applies one logged operation to the store during recovery
+    def apply(self, store, parents, op):
+        path = op['path']
+        if op['op'] == 'set':
+            value = op['value']
+            if 'tails' in op:
+                value = with_tails(store.get(path[0]), value, op['tails'])
+            store[path[0]] = value
+            return
+        name = path[0]
+        spec = TABLES[name]
+        key_field = spec['key'] if len(path) == 1 else spec['nested'][path[2]]
+        nested = spec['nested'] if len(path) == 1 else {}
+
+        if op['op'] == 'replace':
+            records = op['records']
+            if len(path) == 1:
+                store[name] = records
+                if name in parents:
+                    parents[name] = {record[key_field]: record for record in records}
+            else:
+                parent = parents[name].get(path[1])
+                if parent is not None:
+                    parent[path[2]] = records
+            return
+
+        table = find_table(store, path, parents)
+        if table is None:
+            return
+        if op['op'] == 'delete':
+            for record in table:
+                if record[key_field] == op['key']:
+                    table.remove(record)
+                    break
+            if name in parents and len(path) == 1:
+                parents[name].pop(op['key'], None)
+        elif op['op'] == 'put':
+            record = op['record']
+            existing = None
+            if name in parents and len(path) == 1:
+                existing = parents[name].get(op['key'])
+            else:
+                for iterate_record in table:
+                    if iterate_record[key_field] == op['key']:
+                        existing = iterate_record
+                        break
+            if 'tails' in op:
+                record = with_tails(existing, record, op['tails'])
+            if existing is not None:
+                # Keep nested collections, they are logged separately
+                kept = {field: existing[field] for field in nested if field in existing}
+                existing.clear()
+                existing.update(record)
+                existing.update(kept)
+            else:
+                for field in nested:
+                    record.setdefault(field, [])
+                table.insert(op['index'], record)
+                if name in parents and len(path) == 1:
+                    parents[name][op['key']] = record
+
+    ##### Last committed state #####
+    def reset_baseline(self, store):
+        '''
+        Record the given store as the last committed state
+        '''
+        self.tables = {}
+        self.values = {}
+        for name, value in store.items():
+            if name in TABLES and isinstance(value, list):
+                self.snapshot_table([name], value)
+            else:
+                self.values[name] = copy_record(value)
+
+    # Stores a copy of every record in a table (and its nested tables)
+    def snapshot_table(self, path, records):
+        spec = TABLES[path[0]]
+        nested = spec['nested'] if len(path) == 1 else {}
+        key_field = spec['key'] if len(path) == 1 else spec['nested'][path[2]]
+        self.tables[tuple(path)] = {
+            'keys': [record[key_field] for record in records],
+            'records': {
+                record[key_field]: copy_record(strip_nested(record, nested)) for record in records
+            },
+        }
+        for record in records:
+            for field in nested:
+                self.snapshot_table(path + [record[key_field], field], record.get(field, []))
+
+    # Applies an operation written by another process to the last committed state
+    def apply_baseline(self, op):
+        path = tuple(op['path'])
+        if op['op'] == 'set':
+            value = copy_record(op['value'])
+            if 'tails' in op:
+                value = with_tails(self.values.get(path[0]), value, copy_record(op['tails']))
+            self.values[path[0]] = value
+            return
+        if op['op'] == 'replace':
+            for iterate_path in list(self.tables):
+                if iterate_path[:len(path)] == path:
+                    del self.tables[iterate_path]
+            self.snapshot_table(list(path), op['records'])
+            return
+        table = self.tables.setdefault(path, {'keys': [], 'records': {}})
+        if op['op'] == 'delete':
+            if op['key'] in table['records']:
+                table['keys'].remove(op['key'])
+                del table['records'][op['key']]
+            for iterate_path in list(self.tables):
+                if iterate_path[:len(path) + 1] == path + (op['key'], ):
+                    del self.tables[iterate_path]
+        elif op['op'] == 'put':
+            if op['key'] not in table['records']:
+                table['keys'].insert(op['index'], op['key'])
+                if len(path) == 1:
+                    for field in TABLES[path[0]]['nested']:
+                        self.tables[path + (op['key'], field)] = {'keys': [], 'records': {}}
+            record = copy_record(op['record'])
+            if 'tails' in op:
+                record = with_tails(table['records'].get(op['key']), record, copy_record(op['tails']))
+            table['records'][op['key']] = record
+
+    def diff(self, store, changes=None):
+        '''
+        Work out which records changed since the last commit.
+
+        Arguments:
+            <store>     (<dict>)   - the store
+            <changes>   (<dict>)   - optional, table path -> {key: record, or
+                                     None if there is no such record}, e.g.
+                                     ('channels', 1, 'messages') -> {3: message}.
+                                     Only these records are compared, the rest
+                                     of every table is taken to be unchanged.
+                                     Values that are not tables are always
+                                     compared
+
+        Return Value:
+            Returns a list of operations to append to the log
+        '''
+        if changes is not None:
+            return self.diff_changes(store, changes)
+        ops = []
+        seen = set()
+        self.previous = {}
+        for name, value in store.items():
+            if name in TABLES and isinstance(value, list):
+                self.diff_table(ops, seen, [name], value)
+            else:
+                self.diff_value(ops, name, value)
+        # Nested tables whose parent record has gone
+        for path in list(self.tables):
+            if path not in seen:
+                del self.tables[path]
+        return ops
+
+    # Appends the operations needed to bring one table up to date
+    def diff_table(self, ops, seen, path, records):
+        spec = TABLES[path[0]]
+        nested = spec['nested'] if len(path) == 1 else {}
+        key_field = spec['key'] if len(path) == 1 else spec['nested'][path[2]]
+        table_path = tuple(path)
+        seen.add(table_path)
+        old = self.tables.get(table_path, {'keys': [], 'records': {}})
+
+        keys = [record[key_field] for record in records]
+        key_set = set(keys)
+        old_key_set = set(old['keys'])
+        kept_old = [key for key in old['keys'] if key in key_set]
+        kept_new = [key for key in keys if key in old_key_set]
+
+        # Duplicate keys, reordered records or a cleared table cannot be
+        # described record by record, so the whole table is written instead
+        if (len(key_set) != len(keys) or kept_old != kept_new
+                or (old['keys'] and not kept_new and len(path) == 1)):
+            ops.append({'op': 'replace', 'path': path, 'records': copy_record(records)})
+            for iterate_path in list(self.tables):
+                if iterate_path[:len(path)] == table_path:
+                    del self.tables[iterate_path]
+            self.snapshot_table(path, records)
+            for iterate_path in self.tables:
+                if iterate_path[:len(path)] == table_path:
+                    seen.add(iterate_path)
+            return
+
+        for key in old['keys']:
+            if key not in key_set:
+                ops.append({'op': 'delete', 'path': path, 'key': key})
+                del old['records'][key]
+
+        for index, record in enumerate(records):
+            key = record[key_field]
+            self.diff_record(ops, path, old, key, index, strip_nested(record, nested))
+            for field in nested:
+                self.diff_table(ops, seen, path + [key, field], record.get(field, []))
+
+        old['keys'] = keys
+        self.tables[table_path] = old
+
+    # Same as diff, comparing only the records in changes
+    def diff_changes(self, store, changes):
+        ops = []
+        self.previous = {}
+        for name, value in store.items():
+            if name in TABLES and isinstance(value, list):
+                continue
+            self.diff_value(ops, name, value)
+        parents = None
+        # Top level tables go first, so a channel or DM added since the last
+        # commit is written before its messages
+        for path in sorted(changes, key=len):
+            if len(path) == 1:
+                records = store.get(path[0])
+            else:
+                if parents is None:
+                    parents = self.parent_lookup(store)
+                parent = parents.get(path[0], {}).get(path[1])
+                records = None if parent is None else parent.get(path[2])
+            if isinstance(records, list):
+                self.diff_keys(ops, list(path), records, changes[path])
+        return ops
+
+    # Appends the operations needed to bring the records of one table with
+    # the given keys up to date. Removed records go first and added ones
+    # last, in the order they are in, so the log replays to the same order
+    def diff_keys(self, ops, path, records, changed):
+        spec = TABLES[path[0]]
+        nested = spec['nested'] if len(path) == 1 else {}
+        table_path = tuple(path)
+        old = self.tables.get(table_path)
+        if old is None:
+            # A nested table only has no baseline while its parent is being
+            # added, which writes it out whole
+            if len(path) > 1:
+                return
+            old = self.tables[table_path] = {'keys': [], 'records': {}}
+
+        added = []
+        for key, record in changed.items():
+            baseline = old['records'].get(key)
+            if record is None:
+                if baseline is not None:
+                    ops.append({'op': 'delete', 'path': path, 'key': key})
+                    old['keys'].remove(key)
+                    del old['records'][key]
+                    for field in nested:
+                        self.tables.pop(table_path + (key, field), None)
+                continue
+            if baseline is None:
+                index = position_of(records, record)
+                if index is not None:
+                    added.append((index, key, record))
+                continue
+            index = position_of(records, record)
+            self.diff_record(ops, path, old, key, old['keys'].index(key) if index is None else index,
+                             strip_nested(record, nested))
+
+        for index, key, record in sorted(added, key=lambda item: item[0]):
+            copied = copy_record(strip_nested(record, nested))
+            old['records'][key] = copied
+            old['keys'].insert(index, key)
+            self.previous[(table_path, key)] = None
+            ops.append({'op': 'put', 'path': path, 'key': key, 'index': index, 'record': copied})
+            for field in nested:
+                self.diff_table(ops, set(), path + [key, field], record.get(field, []))
+
+    # Appends a set operation if a value that is not a table changed
+    def diff_value(self, ops, name, value):
+        if name in self.values:
+            baseline = self.values[name]
+            tails = series_tails(baseline, value, SERIES.get(name))
+            if tails is not None:
+                fields = {field: item for field, item in value.items() if field not in tails}
+                if not tails_change(baseline, tails) and fields == strip_nested(baseline, tails):
+                    return
+                self.previous[(name, )] = None
+                copied, tails = copy_record(fields), copy_record(tails)
+                self.values[name] = with_tails(baseline, copied, tails)
+                ops.append({'op': 'set', 'path': [name], 'value': copied, 'tails': tails})
+                return
+            if baseline == value:
+                return
+        self.previous[(name, )] = self.values.get(name)
+        self.values[name] = copy_record(value)
+        ops.append({'op': 'set', 'path': [name], 'value': self.values[name]})
+
+    # Appends a put operation if a record that is in the baseline table old
+    # changed, current is the record without its nested tables
+    def diff_record(self, ops, path, old, key, index, current):
+        baseline = old['records'].get(key)
+        table_path = tuple(path)
+        tails = series_tails(baseline, current, SERIES.get(path[0]) if len(path) == 1 else None)
+        if tails is not None:
+            fields = {field: item for field, item in current.items() if field not in tails}
+            if not tails_change(baseline, tails) and fields == strip_nested(baseline, tails):
+                return
+            # The series of the baseline are brought up to date in place,
+            # so there is no earlier copy of them to hand on
+            self.previous[(table_path, key)] = strip_nested(baseline, tails)
+            copied, tails = copy_record(fields), copy_record(tails)
+            old['records'][key] = with_tails(baseline, copied, tails)
+            ops.append({'op': 'put', 'path': path, 'key': key, 'index': index, 'record': copied, 'tails': tails})
+            return
+        if baseline == current:
+            return
+        self.previous[(table_path, key)] = baseline
+        copied = copy_record(current)
+        old['records'][key] = copied
+        ops.append({'op': 'put', 'path': path, 'key': key, 'index': index, 'record': copied})
+
+    ##### Rollback #####
+    def rollback(self, store, scope=None, changes=None):
+        '''
+        Undo every change made to the store since the last commit.
+        Records that did not change are left untouched.
+
+        Arguments:
+            <store>     (<dict>)   - the store
+            <scope>     (<dict>)   - optional, table name -> primary keys of the
+                                     only records to undo
+            <changes>   (<dict>)   - optional, table path -> keys of the only
+                                     records to undo, leaving the nested tables
+                                     of a top level record alone, e.g.
+                                     {('channels', 1, 'messages'): {3}}
+
+        Return Value:
+            With changes, returns (table path, key, record before, record
+            after) for each record put back, where the record before is a
+            copy and either may be None. Returns None otherwise
+        '''
+        if changes is not None:
+            restored = []
+            parents = self.parent_lookup(store)
+            # Top level tables go first, so a channel or DM is back before
+            # its messages are
+            for path in sorted(changes, key=len):
+                for key in changes[path]:
+                    self.restore_key(store, parents, path, key, restored)
+            return restored
+        if scope is not None:
+            for name, keys in scope.items():
+                for key in keys:
+                    self.restore_record(name, store[name], key)
+            return
+        for name in list(store):
+            if name not in self.values and (name, ) not in self.tables:
+                del store[name]
+        for name, value in self.values.items():
+            if name not in store or store[name] != value:
+                store[name] = copy_record(value)
+        for path in list(self.tables):
+            if len(path) == 1:
+                current = store.get(path[0])
+                store[path[0]] = self.restore_table(list(path), current if isinstance(current, list) else [])
+
+    # Puts one record of a top level table (and its nested tables) back as
+    # it was at the last commit, leaving the other records alone
+    def restore_record(self, name, records, key):
+        spec = TABLES[name]
+        old = self.tables.get((name, ), {'keys': [], 'records': {}})
+        position = next((index for index, record in enumerate(records) if record[spec['key']] == key), None)
+        if key not in old['records']:
+            if position is not None:
+                del records[position]
+            return
+        baseline = old['records'][key]
+        if position is None:
+            record = copy_record(baseline)
+            # Put it back after the records that came before it
+            earlier = set(old['keys'][:old['keys'].index(key)])
+            position = sum(1 for record in records if record[spec['key']] in earlier)
+            records.insert(position, record)
+        record = records[position]
+        if strip_nested(record, spec['nested']) != baseline:
+            kept = {field: record.get(field, []) for field in spec['nested']}
+            record.clear()
+            record.update(copy_record(baseline))
+            record.update(kept)
+        for field in spec['nested']:
+            record[field] = self.restore_table([name, key, field], record.get(field, []))
+
+    # Puts one record back as it was at the last commit. A top level record
+    # that has to be added back gets its nested tables back as well, one
+    # that has to be taken out takes them with it
+    def restore_key(self, store, parents, path, key, restored):
+        spec = TABLES[path[0]]
+        nested = spec['nested'] if len(path) == 1 else {}
+        key_field = spec['key'] if len(path) == 1 else spec['nested'][path[2]]
+        if len(path) == 1:
+            records = store.get(path[0])
+        else:
+            parent = parents.get(path[0], {}).get(path[1])
+            records = None if parent is None else parent.get(path[2])
+        old = self.tables.get(path)
+        if not isinstance(records, list) or old is None:
+            return
+        if path[0] in parents and len(path) == 1:
+            record = parents[path[0]].get(key)
+            position = None if record is None else position_of(records, record)
+        else:
+            position = next((index for index in range(len(records) - 1, -1, -1)
+                             if records[index][key_field] == key), None)
+
+        baseline = old['records'].get(key)
+        if baseline is None:
+            if position is None:
+                return
+            record = records.pop(position)
+            restored.append((path, key, dict(record), None))
+            for field in nested:
+                for child in record.get(field, []):
+                    restored.append((path + (key, field), child[spec['nested'][field]], child, None))
+            if path[0] in parents and len(path) == 1:
+                parents[path[0]].pop(key, None)
+            return
+
+        if position is None:
+            record = copy_record(baseline)
+            earlier = set(old['keys'][:old['keys'].index(key)])
+            position = sum(1 for iterate_record in records if iterate_record[key_field] in earlier)
+            records.insert(position, record)
+            for field in nested:
+                record[field] = self.restore_table(list(path) + [key, field], [])
+                for child in record[field]:
+                    restored.append((path + (key, field), child[spec['nested'][field]], None, child))
+            if path[0] in parents and len(path) == 1:
+                parents[path[0]][key] = record
+            restored.append((path, key, None, record))
+            return
+
+        record = records[position]
+        if strip_nested(record, nested) != baseline:
+            before = dict(record)
+            kept = {field: record.get(field, []) for field in nested}
+            record.clear()
+            record.update(copy_record(baseline))
+            record.update(kept)
+            restored.append((path, key, before, record))
+
+    # Rebuilds a table (and its nested tables) as it was at the last commit
+    def restore_table(self, path, records):
+        spec = TABLES[path[0]]
+        nested = spec['nested'] if len(path) == 1 else {}
+        key_field = spec['key'] if len(path) == 1 else spec['nested'][path[2]]
+        old = self.tables.get(tuple(path), {'keys': [], 'records': {}})
+
+        current = {}
+        for record in records:
+            current.setdefault(record[key_field], record)
+        restored = []
+        for key in old['keys']:
+            baseline = old['records'][key]
+            record = current.pop(key, None)
+            if record is None:
+                record = copy_record(baseline)
+                for field in nested:
+                    record[field] = []
+            elif strip_nested(record, nested) != baseline:
+                kept = {field: record.get(field, []) for field in nested}
+                record.clear()
+                record.update(copy_record(baseline))
+                record.update(kept)
+            for field in nested:
+                record[field] = self.restore_table(path + [key, field], record[field])
+            restored.append(record)
+        records[:] = restored
+        return records
@@ -0,0 +1,107 @@
+'''
+Time series of running totals kept for user/stats and users/stats
+
+A series is a list of {<field>: total, 'time_stamp': t} entries, oldest
+first, e.g. a user's 'messages_sent'. record() adds a change to the latest
+total. Changes made within the same config.stats_coalesce_seconds are folded
+into one entry, downsample() thins out old entries following
+config.stats_retention and select() picks out the entries in a time range.
+
+Example usage:
+
+    record(user['messages_sent'], 'num_messages_sent', 1)
+    select(user['messages_sent'], time_from=time.time() - 3600)
+'''
+import time
+from src import config
+
+# Series kept for each user and for the workspace, and the field holding
+# their total
+USER_SERIES = {
+    'channels_joined': 'num_channels_joined',
+    'dms_joined': 'num_dms_joined',
+    'messages_sent': 'num_messages_sent',
+}
+WORKSPACE_SERIES = {
+    'channels_exist': 'num_channels_exist',
+    'dms_exist': 'num_dms_exist',
+    'messages_exist': 'num_messages_exist',
+}
+
+def record(series, field, change, time_stamp=None):
+    '''
+    Add change to the latest total of a series
+
+    Arguments:
+        <series>       (<list>)     - the series, which has at least one entry
+        <field>        (<string>)   - the field holding the total
+        <change>       (<int>)      - amount the total goes up or down by
+        <time_stamp>   (<int>)      - when the change happened, defaults to now
+    '''
+    if time_stamp is None:
+        time_stamp = int(time.time())
+    last = series[-1]
+    window = config.stats_coalesce_seconds
+    # The first entry is where the series starts, it is never folded into
+    if window > 0 and len(series) > 1 and last['time_stamp'] // window == time_stamp // window:
+        last[field] += change
+        last['time_stamp'] = time_stamp
+    else:
+        series.append({field: last[field] + change, 'time_stamp': time_stamp})
+
+def downsample(series, now):
+    '''
+    Thin out the entries older than each tier of config.stats_retention so
+    that only the last entry of each period of the tier's resolution is kept
+
+    Return Value:
+        Returns true if any entry was dropped
+    '''
+    tiers = sorted(config.stats_retention)
+    kept = []
+    kept_bucket = None
+    for index, entry in enumerate(series):
+        resolution = None
+        for age, tier_resolution in tiers:
+            if now - entry['time_stamp'] > age:
+                resolution = tier_resolution
+        bucket = None if resolution is None or index == 0 else (resolution, entry['time_stamp'] // resolution)
+        # A later entry in the same period holds a more recent total
+        if bucket is not None and bucket == kept_bucket:
+            kept[-1] = entry
+        else:
+            kept.append(entry)
+        kept_bucket = bucket
+    if len(kept) == len(series):
+        return False
+    series[:] = kept
+    return True
+
+def select(series, time_from=None, time_to=None):
+    '''
+    Pick out the entries of a series in a time range
+
+    Arguments:
+        <series>      (<list>)   - the series
+        <time_from>   (<int>)    - earliest time_stamp wanted, None for no limit
+        <time_to>     (<int>)    - latest time_stamp wanted, None for no limit
+
+    Return Value:
+        Returns a list of the entries from time_from to time_to inclusive
+    '''
+    start = 0 if time_from is None else first_after(series, time_from - 1)
+    end = len(series) if time_to is None else first_after(series, time_to)
+    return series[start:end]
+
+# Returns the index of the first entry later than time_stamp, entries are
+# in time order so this is a binary search
+def first_after(series, time_stamp):
+    low = 0
+    high = len(series)
+    while low < high:
+        middle = (low + high) // 2
+        if series[middle]['time_stamp'] <= time_stamp:
+            low = middle + 1
+        else:
+            high = middle
+    return low
@@ -8,11 +8,14 @@ from PIL import Image
 from flask import url_for
 from src.server_helper import decode_token, valid_user
 from src.helper import check_valid_email, channels_create_check_valid_user
-from src.helper import user_info, get_user_details
-from src.helper import check_join_channel_or_dm, get_messages_total_number
+from src.helper import user_info, get_user_details, parse_int
 from requests.api import get
 from src.error import AccessError, InputError
-from src.data_store import get_data, save
+from src.data_store import get_data, save, lookup, total, set_user_email, set_user_handle
+from src.data_store import transaction, touch_user
+from src.timeseries import USER_SERIES, WORKSPACE_SERIES, downsample, select
+from src.scheduler import SCHEDULER
+from src import config
 from src.config import url
 
 def users_all_v1(token): 
@@ -46,15 +49,21 @@ def users_all_v1(token):
         'users': (user_list)
     }
 
-def users_stats_v1(token):
+def users_stats_v1(token, time_from=None, time_to=None):
     '''
     Fetches the required statistics about the use of UNSW Streams.
 
     Arguments:
         <token>          (<string>)      - an authorisation hash
+        <time_from>      (<int>)         - optional, earliest time_stamp of
+                                           the stats returned
+        <time_to>        (<int>)         - optional, latest time_stamp of
+                                           the stats returned
 
     Exceptions:
-        N/A
+        AccessError - Occurs when token is invalid
+        InputError  - Occurs when time_from or time_to is not a time, or
+                      time_from is after time_to
 
     Return Value:
         <work_space_stats> (<dict>)     - stores the channels_exist, dms_exist, 
@@ -62,42 +71,44 @@ def users_stats_v1(token):
     '''
     if not valid_user(token):
         raise AccessError(description='User is not valid')
+    time_from, time_to = parse_time_range(time_from, time_to)
 
     # get the number of users in the stream
-    users = get_data()['users']
-    num_users = 0
-    for user in users:
-        if user['is_removed'] == False:
-            num_users += 1
-    
-    num_users_joined_atleast_one_channel_or_dm = 0
+    num_users = total('active_users')
 
-    # for every user, check if they join at least one channel or dm
-    for i in range(len(users)):
-        if users[i]['is_removed'] == False:
-            if check_join_channel_or_dm(users[i]['auth_user_id']):
-                num_users_joined_atleast_one_channel_or_dm += 1
+    # get the number of users who join at least one channel or dm
+    num_users_joined_atleast_one_channel_or_dm = total('engaged_users')
             
     # compute utilization rate
     utilization_rate = 0.0
     if num_users != 0 and num_users_joined_atleast_one_channel_or_dm != 0:
         utilization_rate = float(num_users_joined_atleast_one_channel_or_dm) / float(num_users)
 
-    get_data()['workspace_stats']['utilization_rate'] = float(utilization_rate)
-    save()
+    # The rate is worked out on every request, so it is not stored
+    workspace_stats = {
+        series: select(get_data()['workspace_stats'][series], time_from, time_to)
+        for series in WORKSPACE_SERIES
+    }
+    workspace_stats['utilization_rate'] = float(utilization_rate)
     return {
-        'workspace_stats': get_data()['workspace_stats']
+        'workspace_stats': workspace_stats
     }
 
-def user_stats_v1(token):
+def user_stats_v1(token, time_from=None, time_to=None):
     '''
     Fetches the required statistics about this user's use of UNSW Streams.
 
     Arguments:
-        <token>     (<string>)    - an authorisation hash
+        <token>       (<string>)    - an authorisation hash
+        <time_from>   (<int>)       - optional, earliest time_stamp of the
+                                      stats returned
+        <time_to>     (<int>)       - optional, latest time_stamp of the
+                                      stats returned
 
     Exceptions:
         AccessError - Occurs when token is invalid
+        InputError  - Occurs when time_from or time_to is not a time, or
+                      time_from is after time_to
 
     Return Value:
         Returns a dictionary of shape {
@@ -110,24 +121,25 @@ def user_stats_v1(token):
 
     if not valid_user(token):
         raise AccessError(description='User is not valid')
+    time_from, time_to = parse_time_range(time_from, time_to)
 
     auth_user_id = decode_token(token)
     user = get_user_details(auth_user_id)
 
     # get the total number of channels
-    num_channels = len(get_data()['channels'])
+    num_channels = total('channels')
     channel_length = len(user['channels_joined'])
     # get the number of channels that the user joined
     num_channels_joined = user['channels_joined'][channel_length - 1]['num_channels_joined']
 
     # get the total number of dms
-    num_dms = len(get_data()['dms'])
+    num_dms = total('dms')
     dm_length = len(user['dms_joined'])
     # get the number of dms that the user joined
     num_dms_joined = user['dms_joined'][dm_length - 1]['num_dms_joined']
 
     # get the total number of messages
-    num_msgs = get_messages_total_number()
+    num_msgs = total('messages')
     msg_length = len(user['messages_sent'])
     # get the number of messages that the user sent
     num_msgs_sent = user['messages_sent'][msg_length - 1]['num_messages_sent']
@@ -146,13 +158,46 @@ def user_stats_v1(token):
 
     return {
         'user_stats': {
-            'channels_joined': user['channels_joined'],
-            'dms_joined': user['dms_joined'],
-            'messages_sent': user['messages_sent'],
+            'channels_joined': select(user['channels_joined'], time_from, time_to),
+            'dms_joined': select(user['dms_joined'], time_from, time_to),
+            'messages_sent': select(user['messages_sent'], time_from, time_to),
             'involvement_rate': float(involvement_rate)
         }
     }
 
+# Helper function for user/stats and users/stats
+# Returns the from and to times asked for as ints, None where not given
+def parse_time_range(time_from, time_to):
+    times = []
+    for value in (time_from, time_to):
+        if value is None:
+            times.append(None)
+            continue
+        value = parse_int(value)
+        if value is None or value < 0:
+            raise InputError(description='Time range is not valid')
+        times.append(value)
+    if None not in times and times[0] > times[1]:
+        raise InputError(description='Time range is not valid')
+    return times[0], times[1]
+
+# Thins out the old entries of every stats series following
+# config.stats_retention, then runs again after config.stats_downsample_interval
+def downsample_stats():
+    with transaction():
+        now = int(time.time())
+        changed = False
+        for user in get_data()['users']:
+            for series in USER_SERIES:
+                if downsample(user[series], now):
+                    touch_user(user)
+                    changed = True
+        for series in WORKSPACE_SERIES:
+            changed = downsample(get_data()['workspace_stats'][series], now) or changed
+        if changed:
+            save()
+    SCHEDULER.schedule(time.time() + config.stats_downsample_interval, downsample_stats)
+
 def user_profile_v1(token, u_id):
     '''
     For a valid user, returns information about their user_id, email, first name, last name, and handle.
@@ -212,35 +257,10 @@ def user_profile_setname_v1(token, name_first, name_last):
         raise InputError(description='name_last is not between 1 - 50 characters in length')
 
     auth_user_id = decode_token(token)
-    for user in get_data()['users']:
-        if user['auth_user_id'] == auth_user_id:
-            user['name_first'] = name_first
-            user['name_last'] = name_last
-            save()
-    
-    # change user's first name and last name in channel
-    for channel in get_data()['channels']:
-        for member in channel['all_members']:
-            if member['u_id'] == auth_user_id:
-                member['name_first'] = name_first
-                member['name_last'] = name_last
-        for owner in channel['owner_members']:
-            if owner['u_id'] == auth_user_id:
-                owner['name_first'] = name_first
-                owner['name_last'] = name_last  
-        save()    
-
-    # change user's first name and last name in dm
-    for dm in get_data()['dms']:
-        for member in dm['members']:
-            if member['u_id'] == auth_user_id:
-                member['name_first'] = name_first
-                member['name_last'] = name_last    
-        if len(dm['creator']) > 0:
-            if dm['creator']['u_id'] == auth_user_id:
-                dm['creator']['name_first'] = name_first
-                dm['creator']['name_last'] = name_last  
-        save()
+    user = get_user_details(auth_user_id)
+    user['name_first'] = name_first
+    user['name_last'] = name_last
+    save()
 
     return {}
 
@@ -270,35 +290,12 @@ def user_profile_setemail_v1(token, email):
         raise InputError(description='Email entered is not a valid email')
 
     # email address is already being used by another user
-    for users in get_data()['users']:
-        if users['email'] == email:
-            raise InputError(description='Email address is already being used by another user')
+    if lookup('emails', email) is not None:
+        raise InputError(description='Email address is already being used by another user')
 
     auth_user_id = decode_token(token)
-    for user in get_data()['users']:
-        if user['auth_user_id'] == auth_user_id:
-            user['email'] = email
-            save()
-
-    # change user's first name and last name in channel
-    for channel in get_data()['channels']:
-        for member in channel['all_members']:
-            if member['u_id'] == auth_user_id:
-                member['email'] = email
-        for owner in channel['owner_members']:
-            if owner['u_id'] == auth_user_id:
-                owner['email'] = email
-        save()
-
-    # change user's first name and last name in dm
-    for dm in get_data()['dms']:
-        for member in dm['members']:
-            if member['u_id'] == auth_user_id:
-                member['email'] = email  
-        if len(dm['creator']) > 0:
-            if dm['creator']['u_id'] == auth_user_id:
-                dm['creator']['email'] = email
-        save()
+    set_user_email(get_user_details(auth_user_id), email)
+    save()
 
     return {}
 
@@ -333,36 +330,12 @@ def user_profile_sethandle_v1(token, handle_str):
         raise InputError(description='handle_str contains characters that are not alphanumeric')
 
     # the handle is already used by another user
-    for users in get_data()['users']:
-        if users['handle_str'] == handle_str:
-             raise InputError(description='The handle is already used by another user')
+    if lookup('handles', handle_str) is not None:
+        raise InputError(description='The handle is already used by another user')
 
     auth_user_id = decode_token(token)
-
-    for user in get_data()['users']:
-        if user['auth_user_id'] == auth_user_id:
-            user['handle_str'] = handle_str
-            save()
-
-    # change user's first name and last name in channel
-    for channel in get_data()['channels']:
-        for member in channel['all_members']:
-            if member['u_id'] == auth_user_id:
-                member['handle_str'] = handle_str
-        for owner in channel['owner_members']:
-            if owner['u_id'] == auth_user_id:
-                owner['handle_str'] = handle_str
-        save()
-    
-    # change user's first name and last name in dm
-    for dm in get_data()['dms']:
-        for member in dm['members']:
-            if member['u_id'] == auth_user_id:
-                member['handle_str'] = handle_str
-        if len(dm['creator']) > 0:
-            if dm['creator']['u_id'] == auth_user_id:
-                dm['creator']['handle_str'] = handle_str
-        save()
+    set_user_handle(get_user_details(auth_user_id), handle_str)
+    save()
     return {}
 
 def user_profile_uploadphoto_v1(token, img_url, x_start, y_start, x_end, y_end):
@@ -392,6 +365,8 @@ def user_profile_uploadphoto_v1(token, img_url, x_start, y_start, x_end, y_end):
 
     auth_user_id = decode_token(token)
 
+    # The image is fetched and cropped before taking the user's lock, since
+    # fetching it may take a while
     # Input Error: img_url returns a status code other then 200 -> REDO IMPLEMENTATION
     try:
         requests.get(img_url, stream=True).status_code != 200
@@ -418,26 +393,9 @@ def user_profile_uploadphoto_v1(token, img_url, x_start, y_start, x_end, y_end):
     cropped.save(img_name, 'JPEG')
     new_url = url + 'static/' + token + updated_time + '.jpg' 
     
-    user = get_user_details(auth_user_id)
-    user['profile_img_url'] = new_url
-    save()
-
-    for channel in get_data()['channels']:
-        for member in channel['all_members']:
-            if member['u_id'] == auth_user_id:
-                member['profile_img_url'] = new_url
-        for owner in channel['owner_members']:
-            if owner['u_id'] == auth_user_id:
-                owner['profile_img_url'] = new_url
-        save()
-    
-    for dm in get_data()['dms']:
-        for member in dm['members']:
-            if member['u_id'] == auth_user_id:
-                member['profile_img_url'] = new_url
-        if len(dm['creator']) > 0:
-            if dm['creator']['u_id'] == auth_user_id:
-                dm['creator']['profile_img_url'] = new_url
+    with transaction(('user', auth_user_id)):
+        user = get_user_details(auth_user_id)
+        user['profile_img_url'] = new_url
         save()
 
     return {}
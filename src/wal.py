@@ -0,0 +1,181 @@
+'''
+Write-ahead log persistence for the data store
+
+Instead of re-serialising the whole store on every save, the store is kept
+as a snapshot file plus an append-only log. Each commit compares the store
+against the last committed state record by record and appends only the
+records that were added, changed or removed. When the log grows past a
+threshold it is folded into a fresh snapshot, written as JSON or in the
+binary format of src/snapshot.py. Either kind is read back on startup.
+
+A commit is written as a single JSON line so that a crash part way through
+a write can only ever lose the last (incomplete) commit.
+'''
+import json
+import os
+from contextlib import contextmanager
+from src.storage import Storage
+from src.snapshot import write_json, write_snapshot, load_any
+
+try:
+    import fcntl
+except ImportError:
+    # Locking between processes is only available on POSIX systems
+    fcntl = None
+
+# Helper function for WriteAheadLog
+# Identifies a version of a file, None if it does not exist
+def file_stamp(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+# Helper function for WriteAheadLog
+# Flushes a file or directory to disk
+def sync_file(path):
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+class WriteAheadLog(Storage):
+    '''
+    Snapshot file plus append-only log of changed records
+    '''
+    def __init__(self, snapshot_path, log_path, compact_size, snapshot_format='json'):
+        super().__init__()
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.compact_size = compact_size
+        # 'json', 'binary' or 'binary-zlib'
+        self.snapshot_format = snapshot_format
+        self.log_size = 0
+        self.snapshot_stamp = None
+
+    ##### Recovery #####
+    def recover(self, default):
+        '''
+        Load the latest snapshot and replay every complete commit in the log.
+        A torn commit at the end of the log is discarded.
+
+        Return Value:
+            Returns the recovered store, or default if nothing was persisted
+        '''
+        store = default
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            snapshot_seq, store = load_any(self.snapshot_path)
+        self.seq = snapshot_seq
+        self.snapshot_stamp = file_stamp(self.snapshot_path)
+
+        self.log_size = 0
+        if os.path.exists(self.log_path):
+            parents = self.parent_lookup(store)
+            for commit in self.read_log():
+                for op in commit['ops']:
+                    self.apply(store, parents, op)
+            # Drop a partially written commit so new commits start on a clean line
+            if os.path.getsize(self.log_path) != self.log_size:
+                with open(self.log_path, 'r+b') as FILE:
+                    FILE.truncate(self.log_size)
+        self.reset_baseline(store)
+        return store
+
+    # Yields each complete commit in the log after the part already read,
+    # skipping commits that are already part of the snapshot
+    def read_log(self):
+        with open(self.log_path, 'rb') as FILE:
+            FILE.seek(self.log_size)
+            for line in FILE:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    commit = json.loads(line)
+                except ValueError:
+                    break
+                self.log_size += len(line)
+                if commit['seq'] <= self.seq:
+                    continue
+                self.seq = commit['seq']
+                yield commit
+
+    @contextmanager
+    def lock(self):
+        '''
+        Hold an exclusive lock on the log shared with other processes
+        '''
+        if fcntl is None:
+            yield
+            return
+        with open(self.log_path + '.lock', 'a') as FILE:
+            fcntl.flock(FILE, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(FILE, fcntl.LOCK_UN)
+
+    def refresh(self, store):
+        '''
+        Pick up commits written by other processes sharing the same files.
+        Only needed when several server processes use one database, and
+        should be called while holding lock().
+
+        Return Value:
+            Returns the up to date store, which is a new object if another
+            process compacted the log
+        '''
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        if file_stamp(self.snapshot_path) != self.snapshot_stamp or log_size < self.log_size:
+            return self.recover(store)
+        if log_size == self.log_size:
+            return store
+        parents = self.parent_lookup(store)
+        for commit in self.read_log():
+            for op in commit['ops']:
+                self.apply_baseline(op)
+                self.apply(store, parents, op)
+        return store
+
+    ##### Commit #####
+    def write(self, batches):
+        '''
+        Append the batches to the log in one write, asking for the log to be
+        compacted into a new snapshot once it is large enough
+        '''
+        lines = []
+        for batch in batches:
+            self.seq += 1
+            lines.append(json.dumps({'seq': self.seq, 'ops': batch['ops']}) + '\n')
+        data = ''.join(lines).encode()
+        with open(self.log_path, 'ab') as FILE:
+            FILE.write(data)
+            if self.fsync:
+                FILE.flush()
+                os.fsync(FILE.fileno())
+        self.log_size += len(data)
+        if self.log_size >= self.compact_size:
+            self.needs_compact = True
+
+    def compact(self, store):
+        '''
+        Write the whole store as a new snapshot and start an empty log
+        '''
+        temp_path = self.snapshot_path + '.tmp'
+        if self.snapshot_format == 'json':
+            write_json(temp_path, self.seq, store)
+        else:
+            write_snapshot(temp_path, self.seq, store, compress=self.snapshot_format == 'binary-zlib')
+        if self.fsync:
+            sync_file(temp_path)
+        os.replace(temp_path, self.snapshot_path)
+        if self.fsync:
+            # Makes the rename itself survive a crash
+            sync_file(os.path.dirname(os.path.abspath(self.snapshot_path)))
+        self.snapshot_stamp = file_stamp(self.snapshot_path)
+        # The snapshot records seq, so a crash before this truncate is harmless
+        with open(self.log_path, 'wb'):
+            pass
+        self.log_size = 0
+        self.needs_compact = False
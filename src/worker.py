@@ -0,0 +1,104 @@
+'''
+Background worker for work that does not need to finish before a request
+returns
+
+Jobs are run one at a time, in the order they were submitted, by a single
+worker thread. A reader that needs to see the result of a job waits for the
+ticket submit() gave it, which only waits for the jobs up to that one, not
+for ones submitted in the meantime.
+
+Example usage:
+
+    from src.worker import Worker
+
+    worker = Worker()
+    ticket = worker.submit(print, 'after the request')
+    worker.wait(ticket)
+'''
+import collections
+import threading
+import traceback
+
+class Worker:
+    '''
+    Queue of jobs run in order by a worker thread
+    '''
+    def __init__(self):
+        # (ticket, callback, args) of the jobs that have not started
+        self.queue = collections.deque()
+        # Tickets handed out, and the newest ticket finished or dropped
+        self.submitted = 0
+        self.finished = 0
+        # Ticket of the job running, if any
+        self.running = None
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, callback, *args):
+        '''
+        Run callback(*args) on the worker thread after every job before it
+
+        Arguments:
+            <callback>   (<function>)   - the job to run
+            <args>                      - arguments passed to callback
+
+        Return Value:
+            Returns a ticket to pass to wait()
+        '''
+        with self.condition:
+            self.submitted += 1
+            self.queue.append((self.submitted, callback, args))
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+            return self.submitted
+
+    def wait(self, ticket=None):
+        '''
+        Block until the job with this ticket, and every job before it, has
+        finished. Without a ticket, waits for every job submitted so far
+        '''
+        with self.condition:
+            if ticket is None:
+                ticket = self.submitted
+            while self.finished < ticket:
+                self.condition.wait()
+
+    def clear(self):
+        '''
+        Drop every job that has not started yet, and wait for the one
+        running to finish
+        '''
+        with self.condition:
+            dropped = self.queue[-1][0] if self.queue else 0
+            self.queue.clear()
+            while self.running is not None:
+                self.condition.wait()
+            # Waiters for the dropped jobs are let go
+            self.finished = max(self.finished, dropped)
+            self.condition.notify_all()
+
+    def pending(self):
+        '''
+        Return Value:
+            Returns the number of jobs that have not finished
+        '''
+        with self.condition:
+            return self.submitted - self.finished
+
+    # Worker loop, runs each job as it arrives
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                self.running, callback, args = self.queue.popleft()
+            try:
+                callback(*args)
+            except Exception:
+                # One failing job must not stop the jobs after it
+                traceback.print_exc()
+            with self.condition:
+                self.finished, self.running = self.running, None
+                self.condition.notify_all()
@@ -0,0 +1,78 @@
+import threading
+import pytest
+from src.flusher import Flusher, WriteFailed
+
+# Batches are written in the order they were submitted, and batches that
+# arrive while a write is in progress share the next write
+def test_flusher_groups_batches():
+    writes = []
+    started = threading.Event()
+    release = threading.Event()
+    def write(batches):
+        writes.append(list(batches))
+        started.set()
+        release.wait(5)
+    flusher = Flusher(write)
+    first = flusher.submit(0)
+    assert started.wait(5)
+    tickets = [flusher.submit(i) for i in range(1, 10)]
+    release.set()
+    flusher.wait(tickets[-1])
+    assert first == 1
+    assert writes == [[0], list(range(1, 10))]
+    assert flusher.pending() == 0
+
+# The interval lets batches submitted close together share one write
+def test_flusher_interval():
+    writes = []
+    flusher = Flusher(writes.append, interval=0.1)
+    tickets = [flusher.submit(i) for i in range(5)]
+    flusher.wait(tickets[-1])
+    assert writes == [list(range(5))]
+
+# drain() writes on the calling thread, and after_write runs after a write
+def test_flusher_drain():
+    writes = []
+    after = threading.Event()
+    flusher = Flusher(writes.append, interval=5, after_write=after.set)
+    flusher.submit('a')
+    flusher.submit('b')
+    flusher.drain()
+    assert writes == [['a', 'b']]
+    assert flusher.pending() == 0
+    assert not after.is_set()
+
+# A failing write fails its waiters and does not stop later writes
+def test_flusher_failing_write():
+    writes = []
+    def write(batches):
+        if batches == ['bad']:
+            raise OSError('disk full')
+        writes.append(batches)
+    flusher = Flusher(write)
+    with pytest.raises(WriteFailed):
+        flusher.wait(flusher.submit('bad'))
+    flusher.wait(flusher.submit('good'))
+    assert writes == [['good']]
+
+# Every batch sharing a failed write fails, whichever thread made the write
+def test_flusher_failing_shared_write():
+    started = threading.Event()
+    release = threading.Event()
+    def write(batches):
+        started.set()
+        release.wait(5)
+        if 'bad' in batches:
+            raise OSError('disk full')
+    flusher = Flusher(write)
+    first = flusher.submit('good')
+    assert started.wait(5)
+    tickets = [flusher.submit('bad'), flusher.submit('other')]
+    release.set()
+    flusher.wait(first)
+    for ticket in tickets:
+        with pytest.raises(WriteFailed):
+            flusher.wait(ticket)
+    # drain() writes the rest without raising for earlier failures
+    flusher.drain()
+    assert flusher.pending() == 0
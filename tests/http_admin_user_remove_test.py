@@ -427,4 +427,18 @@ def test_admin_remove_channel_coverage(global_owner, register_user2, create_chan
         'start': 0
     })
     assert json.loads(messages2.text)['messages'][1]['message'] == 'Removed user'
-    
\ No newline at end of file
+    
+# A removed user's token stops working straight away
+def test_admin_remove_token_invalidated(global_owner, register_user2):
+    user2_token = register_user2['token']
+    resp = requests.get(config.url + "channels/list/v2", params = {'token': user2_token})
+    assert resp.status_code == VALID
+
+    remove = requests.delete(config.url + "admin/user/remove/v1", json = {
+        'token': global_owner['token'],
+        'u_id': register_user2['auth_user_id']
+    })
+    assert remove.status_code == VALID
+
+    resp = requests.get(config.url + "channels/list/v2", params = {'token': user2_token})
+    assert resp.status_code == ACCESSERROR
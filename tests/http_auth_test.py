@@ -138,6 +138,39 @@ def test_reg_handle_h():
     handle2 = json.loads(profile2.text)['users'][1]['handle_str']
     assert handle2 == 'annabelleparkerparke'
 
+# duplicate handles get the lowest free number appended
+def test_reg_handle_duplicate():
+    requests.delete(config.url + "clear/v1", json={})
+    tokens = []
+    for i in range(4):
+        resp = requests.post(config.url + "auth/register/v2", json = {
+            'email': f'anna{i}@gmail.com',
+            'password': 'password',
+            'name_first': 'anna',
+            'name_last': 'park'
+        })
+        assert resp.status_code == VALID
+        tokens.append(resp.json()['token'])
+
+    # annapark0 is freed up and handed out again
+    resp = requests.put(config.url + "user/profile/sethandle/v1", json = {
+        'token': tokens[1],
+        'handle_str': 'annalee'
+    })
+    assert resp.status_code == VALID
+    requests.post(config.url + "auth/register/v2", json = {
+        'email': 'anna4@gmail.com',
+        'password': 'password',
+        'name_first': 'anna',
+        'name_last': 'park'
+    })
+
+    resp = requests.get(config.url + "users/all/v1", params = {
+        'token': tokens[0]
+    })
+    handles = [user['handle_str'] for user in resp.json()['users']]
+    assert handles == ['annapark', 'annalee', 'annapark1', 'annapark2', 'annapark0']
+
 ##########################################
 ############ auth_login tests ############
 ##########################################
@@ -252,3 +285,37 @@ def test_logout():
     })
     assert logout3.status_code == VALID
 
+
+# Logging out of one session leaves the other sessions valid,
+# and a token that is not a valid token is rejected
+def test_logout_other_sessions_valid():
+    requests.delete(config.url + "clear/v1")
+    register = requests.post(config.url + "auth/register/v2", json = {
+        'email': 'abc@gmail.com',
+        'password': 'password',
+        'name_first': 'anna',
+        'name_last': 'park'
+    })
+    token1 = register.json()['token']
+    login = requests.post(config.url + "auth/login/v2", json = {
+        'email': 'abc@gmail.com',
+        'password': 'password',
+    })
+    token2 = login.json()['token']
+    assert token1 != token2
+
+    # Both tokens have been used, then one of them logs out
+    for token in [token1, token2]:
+        resp = requests.get(config.url + "channels/list/v2", params = {'token': token})
+        assert resp.status_code == VALID
+    logout = requests.post(config.url + "auth/logout/v1", json = {
+        'token': token1
+    })
+    assert logout.status_code == VALID
+
+    resp = requests.get(config.url + "channels/list/v2", params = {'token': token1})
+    assert resp.status_code == ACCESSERROR
+    resp = requests.get(config.url + "channels/list/v2", params = {'token': token2})
+    assert resp.status_code == VALID
+    resp = requests.get(config.url + "channels/list/v2", params = {'token': 'not a token'})
+    assert resp.status_code == ACCESSERROR
@@ -412,3 +412,44 @@ def test_addowner_valid_global_private(global_owner, register_user2):
         'u_id': u_id
     })
     assert resp1.status_code == VALID
+
+# Valid case: only the named channel gets the new owner, and a failed request
+# on another channel afterwards leaves the change in place
+def test_addowner_only_named_channel(global_owner, register_user2, create_channel):
+    user1_token = global_owner['token']
+    user2_token = register_user2['token']
+    user2_id = register_user2['auth_user_id']
+    channel1_id = create_channel['channel_id']
+    channel2_id = requests.post(config.url + "channels/create/v2", json = {
+        'token': user1_token,
+        'name': 'other',
+        'is_public': True
+    }).json()['channel_id']
+    for channel_id in [channel1_id, channel2_id]:
+        requests.post(config.url + "channel/join/v2", json = {
+            'token': user2_token,
+            'channel_id': channel_id
+        })
+
+    add = requests.post(config.url + "channel/addowner/v1", json = {
+        'token': user1_token,
+        'channel_id': channel1_id,
+        'u_id': user2_id
+    })
+    assert add.status_code == VALID
+    failed = requests.post(config.url + "message/send/v1", json = {
+        'token': user2_token,
+        'channel_id': channel2_id,
+        'message': ''
+    })
+    assert failed.status_code == INPUTERROR
+
+    owners = {}
+    for channel_id in [channel1_id, channel2_id]:
+        details = requests.get(config.url + "channel/details/v2", params = {
+            'token': user1_token,
+            'channel_id': channel_id
+        })
+        owners[channel_id] = [owner['u_id'] for owner in details.json()['owner_members']]
+    assert user2_id in owners[channel1_id]
+    assert user2_id not in owners[channel2_id]
@@ -163,3 +163,35 @@ def test_owner_leave_add(global_owner, register_user2, create_channel):
     assert len(member_list) == 2
     owner_list = json.loads(details.text)['owner_members']
     assert len(owner_list) == 0
+
+# Valid case: a member who left no longer sees the channel or can post in it
+def test_channel_leave_membership(global_owner, register_user2, create_channel):
+    token2 = register_user2['token']
+    channel_id1 = create_channel['channel_id']
+
+    join = requests.post(config.url + "channel/join/v2", json = {
+        'token': token2,
+        'channel_id': channel_id1
+    })
+    assert join.status_code == VALID
+    channels = requests.get(config.url + "channels/list/v2", params = {
+        'token': token2
+    })
+    assert channels.json()['channels'] == [{'channel_id': channel_id1, 'name': 'anna'}]
+
+    leave = requests.post(config.url + "channel/leave/v1", json = {
+        'token': token2,
+        'channel_id': channel_id1
+    })
+    assert leave.status_code == VALID
+    channels = requests.get(config.url + "channels/list/v2", params = {
+        'token': token2
+    })
+    assert channels.json()['channels'] == []
+
+    send = requests.post(config.url + "message/send/v1", json = {
+        'token': token2,
+        'channel_id': channel_id1,
+        'message': 'hello'
+    })
+    assert send.status_code == ACCESSERROR
@@ -394,3 +394,59 @@ def test_channel_messages_empty(global_owner, create_channel):
     assert len(json.loads(messages.text)['messages']) == 0
 
     assert messages.status_code == VALID
+
+# Input error when limit is out of range or the cursor is invalid
+def test_channel_messages_invalid_limit_cursor(global_owner, create_channel):
+    token = global_owner['token']
+    channel_id = create_channel['channel_id']
+    for params in [{'limit': 0}, {'limit': config.messages_page_cap + 1}, {'limit': 'abc'}, {'cursor': 'abc'}]:
+        messages = requests.get(config.url + "channel/messages/v2", params = {
+            'token': token,
+            'channel_id': channel_id,
+            'start': 0,
+            **params
+        })
+        assert messages.status_code == INPUTERROR
+
+# Valid case: pages taken with a cursor are not shifted by new or removed messages
+def test_channel_messages_cursor(global_owner, create_channel):
+    token = global_owner['token']
+    channel_id = create_channel['channel_id']
+
+    def send(text):
+        resp = requests.post(config.url + "message/send/v1", json = {
+            'token': token,
+            'channel_id': channel_id,
+            'message': text
+        })
+        return json.loads(resp.text)['message_id']
+
+    def page(params):
+        messages = requests.get(config.url + "channel/messages/v2", params = {
+            'token': token,
+            'channel_id': channel_id,
+            'limit': 2,
+            **params
+        })
+        assert messages.status_code == VALID
+        return json.loads(messages.text)
+
+    message_ids = [send(f'message {i}') for i in range(NUM_MESSAGE_EXACT)]
+    page1 = page({'start': 0})
+    assert [message['message'] for message in page1['messages']] == ['message 4', 'message 3']
+
+    # A new message would move an offset based page by one
+    send('new message')
+    page2 = page({'cursor': page1['next_cursor']})
+    assert [message['message'] for message in page2['messages']] == ['message 2', 'message 1']
+
+    # Removing an older message does not lose the place either
+    requests.delete(config.url + "message/remove/v1", json = {
+        'token': token,
+        'message_id': message_ids[0]
+    })
+    send('another message')
+    page2 = page({'cursor': page1['next_cursor']})
+    assert [message['message'] for message in page2['messages']] == ['message 2', 'message 1']
+    assert page2['end'] == -1
+    assert page2['next_cursor'] is None
@@ -348,3 +348,42 @@ def test_remove_owner_valid(global_owner, register_user2, create_channel):
     })
     owner = json.loads(details1.text)['owner_members']
     assert len(owner) == 1
+
+# Valid case: the owner is only removed from the named channel
+def test_removeowner_only_named_channel(global_owner, register_user2, create_channel):
+    user1_token = global_owner['token']
+    user2_token = register_user2['token']
+    user2_id = register_user2['auth_user_id']
+    channel1_id = create_channel['channel_id']
+    channel2_id = requests.post(config.url + "channels/create/v2", json = {
+        'token': user1_token,
+        'name': 'other',
+        'is_public': True
+    }).json()['channel_id']
+    for channel_id in [channel1_id, channel2_id]:
+        requests.post(config.url + "channel/join/v2", json = {
+            'token': user2_token,
+            'channel_id': channel_id
+        })
+        requests.post(config.url + "channel/addowner/v1", json = {
+            'token': user1_token,
+            'channel_id': channel_id,
+            'u_id': user2_id
+        })
+
+    remove = requests.post(config.url + "channel/removeowner/v1", json = {
+        'token': user1_token,
+        'channel_id': channel1_id,
+        'u_id': user2_id
+    })
+    assert remove.status_code == VALID
+
+    owners = {}
+    for channel_id in [channel1_id, channel2_id]:
+        details = requests.get(config.url + "channel/details/v2", params = {
+            'token': user1_token,
+            'channel_id': channel_id
+        })
+        owners[channel_id] = [owner['u_id'] for owner in details.json()['owner_members']]
+    assert user2_id not in owners[channel1_id]
+    assert user2_id in owners[channel2_id]
@@ -334,3 +334,35 @@ def test_dm_message_valid_empty(global_owner, register_user2):
     assert len(json.loads(message.text)['messages']) == 0
 
     assert message.status_code == VALID 
+
+# Valid case: the cursor of a page leads to the next page, even after new messages
+def test_dm_messages_cursor(global_owner, create_dm):
+    token = global_owner['token']
+    dm_id = create_dm['dm_id']
+
+    def send(text):
+        requests.post(config.url + "message/senddm/v1", json = {
+            'token': token,
+            'dm_id': dm_id,
+            'message': text
+        })
+
+    for i in range(NUM_MESSAGE_EXACT):
+        send(f'message {i}')
+    page1 = requests.get(config.url + "dm/messages/v1", params = {
+        'token': token,
+        'dm_id': dm_id,
+        'start': 0,
+        'limit': 3
+    }).json()
+    assert [message['message'] for message in page1['messages']] == ['message 4', 'message 3', 'message 2']
+
+    send('new message')
+    page2 = requests.get(config.url + "dm/messages/v1", params = {
+        'token': token,
+        'dm_id': dm_id,
+        'cursor': page1['next_cursor'],
+        'limit': 3
+    }).json()
+    assert [message['message'] for message in page2['messages']] == ['message 1', 'message 0']
+    assert page2['end'] == -1
@@ -2,7 +2,7 @@ import pytest
 import requests
 import json
 from src import config 
-from tests.fixture import global_owner, register_user2, register_user3, create_dm
+from tests.fixture import global_owner, register_user2, register_user3, create_dm, user1_send_dm
 from tests.fixture import VALID, ACCESSERROR, INPUTERROR
 
 ##########################################
@@ -141,3 +141,62 @@ def test_dm_remove_valid(global_owner, create_dm):
     })
     assert resp2.status_code == VALID
     assert resp2.json() == {'dms': []}
+
+# Removing a DM with messages is written out once
+def test_dm_remove_one_flush(global_owner, create_dm, user1_send_dm):
+    token = global_owner['token']
+    assert user1_send_dm != None
+
+    resp = requests.delete(config.url + "dm/remove/v1", json = {
+        'token': token,
+        'dm_id': create_dm['dm_id']
+    })
+    assert resp.status_code == VALID
+    assert resp.headers['X-Store-Flushes'] == '1'
+
+# A DM created after another was removed does not reuse a dm_id still in use
+def test_dm_remove_unique_dm_id(global_owner, register_user2, create_dm):
+    token = global_owner['token']
+    u_id2 = register_user2['auth_user_id']
+    dm2 = requests.post(config.url + "dm/create/v1", json = {
+        'token': token,
+        'u_ids': [u_id2]
+    }).json()
+
+    resp = requests.delete(config.url + "dm/remove/v1", json = {
+        'token': token,
+        'dm_id': create_dm['dm_id']
+    })
+    assert resp.status_code == VALID
+
+    dm3 = requests.post(config.url + "dm/create/v1", json = {
+        'token': token,
+        'u_ids': [u_id2]
+    }).json()
+    assert dm3['dm_id'] != dm2['dm_id']
+
+    resp = requests.get(config.url + "dm/list/v1", params = {
+        'token': token
+    })
+    assert sorted(dm['dm_id'] for dm in resp.json()['dms']) == sorted([dm2['dm_id'], dm3['dm_id']])
+
+# The dm_id of the newest DM is not handed out again once it is removed
+def test_dm_remove_newest_dm_id(global_owner, register_user2, create_dm):
+    token = global_owner['token']
+    u_id2 = register_user2['auth_user_id']
+    dm2 = requests.post(config.url + "dm/create/v1", json = {
+        'token': token,
+        'u_ids': [u_id2]
+    }).json()
+
+    resp = requests.delete(config.url + "dm/remove/v1", json = {
+        'token': token,
+        'dm_id': dm2['dm_id']
+    })
+    assert resp.status_code == VALID
+
+    dm3 = requests.post(config.url + "dm/create/v1", json = {
+        'token': token,
+        'u_ids': [u_id2]
+    }).json()
+    assert dm3['dm_id'] not in (create_dm['dm_id'], dm2['dm_id'])
@@ -0,0 +1,211 @@
+import pytest
+import requests
+import json
+from src import config
+from tests.fixture import global_owner, register_user2, register_user3, create_channel, create_dm
+from tests.fixture import ACCESSERROR
+
+# Opens an event stream, returning the response and an iterator over its lines
+def open_stream(token):
+    response = requests.get(config.url + "events/stream/v1", params = {
+        'token': token
+    }, stream = True, timeout = 10)
+    return response, response.iter_lines(chunk_size = 1, decode_unicode = True)
+
+# Returns the (event, data) of the next event on a stream, skipping comments
+def next_event(lines):
+    event = None
+    for line in lines:
+        if line.startswith('event: '):
+            event = line[len('event: '):]
+        elif line.startswith('data: '):
+            return event, json.loads(line[len('data: '):])
+
+###############################################
+########## events/stream/v1 tests #############
+###############################################
+
+# Access error: invalid token
+def test_events_stream_invalid_token(global_owner):
+    token = global_owner['token']
+    requests.post(config.url + "auth/logout/v1", json = {
+        'token': token
+    })
+    response = requests.get(config.url + "events/stream/v1", params = {
+        'token': token
+    })
+    assert response.status_code == ACCESSERROR
+
+# Every change to a message in a channel is streamed, in order
+def test_events_stream_channel(global_owner, register_user2, create_channel):
+    user1_token = global_owner['token']
+    user2_token = register_user2['token']
+    channel1_id = create_channel['channel_id']
+    requests.post(config.url + "channel/join/v2", json = {
+        'token': user2_token,
+        'channel_id': channel1_id,
+    })
+
+    response, lines = open_stream(user2_token)
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/event-stream')
+
+    message_id = requests.post(config.url + "message/send/v1", json = {
+        'token': user1_token,
+        'channel_id': channel1_id,
+        'message': 'hello'
+    }).json()['message_id']
+    event, data = next_event(lines)
+    assert event == 'message_create'
+    assert data['channel_id'] == channel1_id
+    assert data['dm_id'] == -1
+    assert data['message']['message_id'] == message_id
+    assert data['message']['message'] == 'hello'
+
+    requests.put(config.url + "message/edit/v1", json = {
+        'token': user1_token,
+        'message_id': message_id,
+        'message': 'hello again'
+    })
+    event, data = next_event(lines)
+    assert event == 'message_edit'
+    assert data['message']['message'] == 'hello again'
+
+    requests.post(config.url + "message/react/v1", json = {
+        'token': user2_token,
+        'message_id': message_id,
+        'react_id': 1
+    })
+    event, data = next_event(lines)
+    assert event == 'message_react'
+    assert data['message']['reacts'] == [{'react_id': 1, 'u_ids': [register_user2['auth_user_id']], 'is_this_user_reacted': True}]
+
+    requests.post(config.url + "message/pin/v1", json = {
+        'token': user1_token,
+        'message_id': message_id
+    })
+    event, data = next_event(lines)
+    assert event == 'message_pin'
+    assert data['message']['is_pinned'] == True
+
+    requests.delete(config.url + "message/remove/v1", json = {
+        'token': user1_token,
+        'message_id': message_id
+    })
+    event, data = next_event(lines)
+    assert event == 'message_remove'
+    assert data['message']['message_id'] == message_id
+    response.close()
+
+# Only channels and DMs the user is a member of are streamed, including
+# ones joined after the stream was opened
+def test_events_stream_membership(global_owner, register_user3, create_channel, create_dm):
+    user1_token = global_owner['token']
+    user3_token = register_user3['token']
+    channel1_id = create_channel['channel_id']
+    dm1_id = create_dm['dm_id']
+
+    response, lines = open_stream(user3_token)
+    requests.post(config.url + "message/send/v1", json = {
+        'token': user1_token,
+        'channel_id': channel1_id,
+        'message': 'not for user3'
+    })
+    requests.post(config.url + "message/senddm/v1", json = {
+        'token': user1_token,
+        'dm_id': dm1_id,
+        'message': 'for user3'
+    })
+    event, data = next_event(lines)
+    assert event == 'message_create'
+    assert data['dm_id'] == dm1_id
+    assert data['channel_id'] == -1
+    assert data['message']['message'] == 'for user3'
+
+    requests.post(config.url + "channel/join/v2", json = {
+        'token': user3_token,
+        'channel_id': channel1_id,
+    })
+    requests.post(config.url + "message/send/v1", json = {
+        'token': user1_token,
+        'channel_id': channel1_id,
+        'message': 'now for user3'
+    })
+    event, data = next_event(lines)
+    assert data['channel_id'] == channel1_id
+    assert data['message']['message'] == 'now for user3'
+
+    requests.post(config.url + "dm/leave/v1", json = {
+        'token': user3_token,
+        'dm_id': dm1_id,
+    })
+    requests.post(config.url + "message/senddm/v1", json = {
+        'token': user1_token,
+        'dm_id': dm1_id,
+        'message': 'user3 left'
+    })
+    requests.post(config.url + "message/send/v1", json = {
+        'token': user1_token,
+        'channel_id': channel1_id,
+        'message': 'still for user3'
+    })
+    event, data = next_event(lines)
+    assert data['message']['message'] == 'still for user3'
+    response.close()
+
+# A request that fails streams nothing
+def test_events_stream_rollback(global_owner, create_channel):
+    user1_token = global_owner['token']
+    channel1_id = create_channel['channel_id']
+    response, lines = open_stream(user1_token)
+    requests.post(config.url + "message/send/v1", json = {
+        'token': user1_token,
+        'channel_id': channel1_id,
+        'message': ''
+    })
+    requests.post(config.url + "message/send/v1", json = {
+        'token': user1_token,
+        'channel_id': channel1_id,
+        'message': 'valid'
+    })
+    event, data = next_event(lines)
+    assert data['message']['message'] == 'valid'
+    response.close()
+
+# A stream opened while the user leaves a channel never streams from it
+def test_events_stream_concurrent_leave(global_owner, register_user3, create_channel, create_dm):
+    from concurrent.futures import ThreadPoolExecutor
+    user1_token = global_owner['token']
+    user3_token = register_user3['token']
+    channel1_id = create_channel['channel_id']
+    dm1_id = create_dm['dm_id']
+
+    def leave():
+        requests.post(config.url + "channel/leave/v1", json = {
+            'token': user3_token,
+            'channel_id': channel1_id,
+        })
+
+    for i in range(10):
+        requests.post(config.url + "channel/join/v2", json = {
+            'token': user3_token,
+            'channel_id': channel1_id,
+        })
+        with ThreadPoolExecutor(max_workers = 2) as pool:
+            stream = pool.submit(open_stream, user3_token)
+            pool.submit(leave).result()
+            response, lines = stream.result()
+        requests.post(config.url + "message/send/v1", json = {
+            'token': user1_token,
+            'channel_id': channel1_id,
+            'message': f'user3 left {i}'
+        })
+        requests.post(config.url + "message/senddm/v1", json = {
+            'token': user1_token,
+            'dm_id': dm1_id,
+            'message': f'for user3 {i}'
+        })
+        event, data = next_event(lines)
+        assert data['dm_id'] == dm1_id
+        assert data['message']['message'] == f'for user3 {i}'
+        response.close()
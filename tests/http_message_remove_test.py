@@ -533,3 +533,24 @@ def test_message_remove_dm_id_two_messages(global_owner, register_user2):
         'message_id': message1_id,
     })
     assert remove_message.status_code == VALID
+
+# Valid case: message ids are not reused after messages are removed
+def test_message_remove_unique_message_id(global_owner, create_channel):
+    token = global_owner['token']
+    channel_id = create_channel['channel_id']
+
+    message_ids = []
+    for _ in range(3):
+        resp = requests.post(config.url + "message/send/v1", json = {
+            'token': token,
+            'channel_id': channel_id,
+            'message': 'hello'
+        })
+        message_ids.append(json.loads(resp.text)['message_id'])
+        requests.delete(config.url + "message/remove/v1", json = {
+            'token': token,
+            'message_id': message_ids[-1]
+        })
+
+    assert len(set(message_ids)) == 3
+    assert all(message_id % 2 == 1 for message_id in message_ids)
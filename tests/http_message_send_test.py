@@ -216,3 +216,74 @@ def test_message_send_valid_two_channel(global_owner, create_channel, register_u
     message_id3 = json.loads(send_message3.text)['message_id']
     assert message_id1 !=  message_id3
     assert send_message3.status_code == VALID
+
+# The store is written out once per request, however many times the handler saves
+def test_message_send_one_flush_per_request(global_owner, create_channel):
+    token = global_owner['token']
+
+    send_message = requests.post(config.url + "message/send/v1", json = {
+        'token': token,
+        'channel_id': create_channel['channel_id'], 
+        'message': 'hello there'
+    })
+    assert send_message.status_code == VALID
+    assert send_message.headers['X-Store-Flushes'] == '1'
+
+    # Reads and failed requests do not write anything
+    channels = requests.get(config.url + "channels/list/v2", params = {
+        'token': token
+    })
+    assert channels.status_code == VALID
+    assert channels.headers['X-Store-Flushes'] == '0'
+
+    send_message = requests.post(config.url + "message/send/v1", json = {
+        'token': token,
+        'channel_id': create_channel['channel_id'], 
+        'message': ''
+    })
+    assert send_message.status_code == INPUTERROR
+    assert send_message.headers['X-Store-Flushes'] == '0'
+
+# Valid case: users sending to their own channels at the same time are let
+# through in parallel, and every message is kept
+def test_message_send_concurrent(global_owner):
+    from concurrent.futures import ThreadPoolExecutor
+    tokens = [global_owner['token']]
+    for i in range(1, 4):
+        tokens.append(requests.post(config.url + "auth/register/v2", json = {
+            'email': f'sender{i}@gmail.com',
+            'password': 'password',
+            'name_first': 'sender',
+            'name_last': f'number{i}'
+        }).json()['token'])
+    channel_ids = [requests.post(config.url + "channels/create/v2", json = {
+        'token': token,
+        'name': f'channel{i}',
+        'is_public': True
+    }).json()['channel_id'] for i, token in enumerate(tokens)]
+
+    def send(i):
+        return requests.post(config.url + "message/send/v1", json = {
+            'token': tokens[i % 4],
+            'channel_id': channel_ids[i % 4],
+            'message': f'hello {i}'
+        })
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        responses = list(pool.map(send, range(200)))
+    assert all(response.status_code == VALID for response in responses)
+    assert len({response.json()['message_id'] for response in responses}) == 200
+    # How many sends ran at once is checked in tests/server_concurrency_test.py
+    assert all('X-Store-Concurrency' not in response.headers for response in responses)
+
+    stats = requests.get(config.url + "users/stats/v1", params = {'token': tokens[0]}).json()
+    assert stats['workspace_stats']['messages_exist'][-1]['num_messages_exist'] == 200
+    for token, channel_id in zip(tokens, channel_ids):
+        stats = requests.get(config.url + "user/stats/v1", params = {'token': token}).json()
+        assert stats['user_stats']['messages_sent'][-1]['num_messages_sent'] == 50
+        messages = requests.get(config.url + "channel/messages/v2", params = {
+            'token': token,
+            'channel_id': channel_id,
+            'start': 0,
+            'limit': 100
+        }).json()['messages']
+        assert len(messages) == 50
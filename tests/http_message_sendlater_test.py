@@ -216,4 +216,98 @@ def test_sendlater_valid_join_user(global_owner, register_user2):
         'message': 'Hello world!',
         'time_sent': time_sent
     })
-    assert send.status_code == VALID
\ No newline at end of file
+    assert send.status_code == VALID
+
+# The request returns straight away and the message appears once it is due
+def test_sendlater_returns_immediately(global_owner, create_channel):
+    token = global_owner['token']
+    channel_id = create_channel['channel_id']
+    start = time.time()
+    send = requests.post(config.url + "message/sendlater/v1", json = {
+        'token': token,
+        'channel_id': channel_id,
+        'message': 'Hello world!',
+        'time_sent': int(start) + 2 * TIME_WAIT
+    })
+    assert send.status_code == VALID
+    assert time.time() - start < TIME_WAIT
+    message_id = send.json()['message_id']
+
+    # Messages sent in the meantime get a different message_id
+    now = requests.post(config.url + "message/send/v1", json = {
+        'token': token,
+        'channel_id': channel_id,
+        'message': 'Right now'
+    })
+    assert now.json()['message_id'] != message_id
+
+    messages = requests.get(config.url + "channel/messages/v2", params = {
+        'token': token,
+        'channel_id': channel_id,
+        'start': 0
+    }).json()['messages']
+    assert [message['message'] for message in messages] == ['Right now']
+
+    time.sleep(3 * TIME_WAIT)
+    messages = requests.get(config.url + "channel/messages/v2", params = {
+        'token': token,
+        'channel_id': channel_id,
+        'start': 0
+    }).json()['messages']
+    assert messages[0]['message_id'] == message_id
+    assert messages[0]['message'] == 'Hello world!'
+
+# Scheduled messages can be listed and cancelled before they are sent
+def test_sendlater_list_cancel(global_owner, register_user2, create_channel):
+    token = global_owner['token']
+    channel_id = create_channel['channel_id']
+    time_sent = int(time.time()) + TIME_WAIT
+    message_id = requests.post(config.url + "message/sendlater/v1", json = {
+        'token': token,
+        'channel_id': channel_id,
+        'message': 'Hello world!',
+        'time_sent': time_sent
+    }).json()['message_id']
+
+    listed = requests.get(config.url + "message/sendlater/list/v1", params = {
+        'token': token
+    })
+    assert listed.status_code == VALID
+    assert listed.json() == {'messages': [{
+        'message_id': message_id,
+        'channel_id': channel_id,
+        'dm_id': -1,
+        'message': 'Hello world!',
+        'time_sent': time_sent
+    }]}
+
+    # Only the user who scheduled it can cancel it
+    cancel = requests.delete(config.url + "message/sendlater/cancel/v1", json = {
+        'token': register_user2['token'],
+        'message_id': message_id
+    })
+    assert cancel.status_code == ACCESSERROR
+
+    cancel = requests.delete(config.url + "message/sendlater/cancel/v1", json = {
+        'token': token,
+        'message_id': message_id
+    })
+    assert cancel.status_code == VALID
+    cancel = requests.delete(config.url + "message/sendlater/cancel/v1", json = {
+        'token': token,
+        'message_id': message_id
+    })
+    assert cancel.status_code == INPUTERROR
+
+    listed = requests.get(config.url + "message/sendlater/list/v1", params = {
+        'token': token
+    })
+    assert listed.json() == {'messages': []}
+
+    time.sleep(2 * TIME_WAIT)
+    messages = requests.get(config.url + "channel/messages/v2", params = {
+        'token': token,
+        'channel_id': channel_id,
+        'start': 0
+    }).json()['messages']
+    assert messages == []
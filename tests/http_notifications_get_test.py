@@ -516,4 +516,50 @@ def test_notifications_get_mixed(global_owner, register_user2, user2_handle_str,
         'token': user2_token
     })
     assert len(json.loads(get_notifications.text)['notifications']) == 3
-    
\ No newline at end of file
+    
+# Only the newest notifications are kept, newest first
+def test_notifications_get_newest_kept(global_owner, user1_handle_str,
+register_user2, user2_handle_str, create_channel, channel1_name):
+
+    user1_token = global_owner['token']
+    user2_token = register_user2['token']
+
+    channel1_id = create_channel['channel_id']
+
+    requests.post(config.url + "channel/join/v2", json = {
+        'token': user2_token,
+        'channel_id': channel1_id,
+    })
+
+    for i in range(25):
+        requests.post(config.url + "message/send/v1", json = {
+            'token': user1_token,
+            'channel_id': channel1_id,
+            'message': f'@{user2_handle_str} {i}'
+        })
+
+    get_notifications = requests.get(config.url + "notifications/get/v1", params = {
+        'token': user2_token
+    })
+    notifications = json.loads(get_notifications.text)['notifications']
+    assert len(notifications) == 20
+    assert notifications[0]['notification_message'] == f"{user1_handle_str} tagged you in {channel1_name}: @{user2_handle_str} 24"
+    assert notifications[-1]['notification_message'] == f"{user1_handle_str} tagged you in {channel1_name}: @{user2_handle_str} 5"
+
+# A request that fails sends no notification
+def test_notifications_get_failed_request(global_owner, register_user2, user2_handle_str, create_channel):
+
+    user1_token = global_owner['token']
+    user2_token = register_user2['token']
+
+    requests.post(config.url + "message/send/v1", json = {
+        'token': user1_token,
+        'channel_id': create_channel['channel_id'] + 1,
+        'message': f'@{user2_handle_str} hello'
+    })
+
+    get_notifications = requests.get(config.url + "notifications/get/v1", params = {
+        'token': user2_token
+    })
+    assert get_notifications.status_code == VALID
+    assert json.loads(get_notifications.text) == {'notifications': []}
@@ -340,4 +340,237 @@ def test_search_query_str_not_found(global_owner, create_dm):
         'query_str': 'hllo'
     })
     assert search.status_code == VALID
-    assert len(json.loads(search.text)['messages']) == 0
\ No newline at end of file
+    assert len(json.loads(search.text)['messages']) == 0
+
+# Edited and removed messages are searched by their current text
+def test_search_edit_remove(global_owner, create_channel):
+
+    user1_token = global_owner['token']
+    channel1_id = create_channel['channel_id']
+
+    message1 = requests.post(config.url + "message/send/v1", json = {
+        'token': user1_token,
+        'channel_id': channel1_id, 
+        'message': 'hello'
+    })
+    message2 = requests.post(config.url + "message/send/v1", json = {
+        'token': user1_token,
+        'channel_id': channel1_id, 
+        'message': 'hello again'
+    })
+
+    requests.put(config.url + "message/edit/v1", json = {
+        'token': user1_token,
+        'message_id': json.loads(message1.text)['message_id'],
+        'message': 'goodbye'
+    })
+    requests.delete(config.url + "message/remove/v1", json = {
+        'token': user1_token,
+        'message_id': json.loads(message2.text)['message_id']
+    })
+
+    search1 = requests.get(config.url + "search/v1", params = {
+        'token': user1_token,
+        'query_str': 'hello'
+    })
+    assert search1.status_code == VALID
+    assert json.loads(search1.text)['messages'] == []
+
+    search2 = requests.get(config.url + "search/v1", params = {
+        'token': user1_token,
+        'query_str': 'GOODBYE'
+    })
+    assert search2.status_code == VALID
+    assert [message['message'] for message in json.loads(search2.text)['messages']] == ['goodbye']
+
+# Input error: limit is not a positive integer, or cursor/order is invalid
+def test_search_invalid_limit_cursor_order(global_owner):
+
+    user1_token = global_owner['token']
+    for params in [{'limit': 0}, {'limit': 'abc'}, {'cursor': 'abc'}, {'cursor': '1,2'}, {'order': 'abc'}]:
+        search1 = requests.get(config.url + "search/v1", params = {
+            'token': user1_token,
+            'query_str': 'hello',
+            **params
+        })
+        assert search1.status_code == INPUTERROR
+
+# Valid case: results are paged with limit and cursor until next_cursor is None
+def test_search_limit_cursor(global_owner, create_channel):
+
+    user1_token = global_owner['token']
+    channel1_id = create_channel['channel_id']
+
+    message_ids = []
+    for i in range(5):
+        message = requests.post(config.url + "message/send/v1", json = {
+            'token': user1_token,
+            'channel_id': channel1_id, 
+            'message': f'hello {i}'
+        })
+        message_ids.append(json.loads(message.text)['message_id'])
+
+    found = []
+    cursor = None
+    for _ in range(3):
+        params = {'token': user1_token, 'query_str': 'hello', 'limit': 2, 'order': 'time'}
+        if cursor is not None:
+            params['cursor'] = cursor
+        search1 = requests.get(config.url + "search/v1", params = params)
+        assert search1.status_code == VALID
+        page = json.loads(search1.text)
+        assert len(page['messages']) <= 2
+        found += [message['message_id'] for message in page['messages']]
+        cursor = page['next_cursor']
+    assert cursor is None
+    assert found == message_ids[::-1]
+
+# Valid case: paging in 'joined' order lists the channel then the DM, newest
+# message first, and a failed request in between does not move the cursor
+def test_search_joined_cursor(global_owner, create_channel, create_dm):
+
+    user1_token = global_owner['token']
+    channel1_id = create_channel['channel_id']
+    dm1_id = create_dm['dm_id']
+
+    message_ids = []
+    for i in range(3):
+        message = requests.post(config.url + "message/send/v1", json = {
+            'token': user1_token,
+            'channel_id': channel1_id,
+            'message': f'hello {i}'
+        })
+        message_ids.append(json.loads(message.text)['message_id'])
+    for i in range(2):
+        message = requests.post(config.url + "message/senddm/v1", json = {
+            'token': user1_token,
+            'dm_id': dm1_id,
+            'message': f'hello {i}'
+        })
+        message_ids.append(json.loads(message.text)['message_id'])
+
+    found = []
+    cursor = None
+    for _ in range(3):
+        params = {'token': user1_token, 'query_str': 'hello', 'limit': 2}
+        if cursor is not None:
+            params['cursor'] = cursor
+        search1 = requests.get(config.url + "search/v1", params = params)
+        assert search1.status_code == VALID
+        page = json.loads(search1.text)
+        found += [message['message_id'] for message in page['messages']]
+        cursor = page['next_cursor']
+        requests.post(config.url + "message/send/v1", json = {
+            'token': user1_token,
+            'channel_id': channel1_id,
+            'message': ''
+        })
+    assert cursor is None
+    assert found == message_ids[2::-1] + message_ids[:2:-1]
+
+# Valid case: messages containing the query most often come first
+def test_search_relevance(global_owner, create_channel):
+
+    user1_token = global_owner['token']
+    channel1_id = create_channel['channel_id']
+
+    for text in ['hello hello', 'hello', 'hello hello hello']:
+        requests.post(config.url + "message/send/v1", json = {
+            'token': user1_token,
+            'channel_id': channel1_id, 
+            'message': text
+        })
+
+    search1 = requests.get(config.url + "search/v1", params = {
+        'token': user1_token,
+        'query_str': 'HELLO',
+        'order': 'relevance',
+        'limit': 2
+    })
+    assert search1.status_code == VALID
+    messages = json.loads(search1.text)['messages']
+    assert [message['message'] for message in messages] == ['hello hello hello', 'hello hello']
+
+# Valid case: streamed results are one message per line
+def test_search_stream(global_owner, create_channel):
+
+    user1_token = global_owner['token']
+    channel1_id = create_channel['channel_id']
+
+    for text in ['hello', 'hello again', 'goodbye']:
+        requests.post(config.url + "message/send/v1", json = {
+            'token': user1_token,
+            'channel_id': channel1_id, 
+            'message': text
+        })
+
+    search1 = requests.get(config.url + "search/v1", params = {
+        'token': user1_token,
+        'query_str': 'hello',
+        'stream': 'true'
+    })
+    assert search1.status_code == VALID
+    lines = [json.loads(line) for line in search1.text.splitlines()]
+    assert [line['message'] for line in lines[:-1]] == ['hello again', 'hello']
+    # Streamed results are paged even without a limit
+    assert lines[-1] == {'next_cursor': None}
+
+    search2 = requests.get(config.url + "search/v1", params = {
+        'token': user1_token,
+        'query_str': 'hello',
+        'stream': 'true',
+        'limit': 1
+    })
+    lines = [json.loads(line) for line in search2.text.splitlines()]
+    assert lines[0]['message'] == 'hello again'
+    assert lines[1]['next_cursor'] is not None
+
+# Valid case: searching while other users send and remove messages in the
+# channels being searched never fails
+def test_search_concurrent_send_remove(global_owner, register_user2, create_channel):
+    from concurrent.futures import ThreadPoolExecutor
+    user1_token = global_owner['token']
+    user2_token = register_user2['token']
+    channel1_id = create_channel['channel_id']
+    requests.post(config.url + "channel/join/v2", json = {
+        'token': user2_token,
+        'channel_id': channel1_id
+    })
+    for i in range(50):
+        requests.post(config.url + "message/send/v1", json = {
+            'token': user1_token,
+            'channel_id': channel1_id,
+            'message': f'hello {i} ' + ' '.join(f'{i}x{j}' for j in range(150))
+        })
+
+    # Each message posts substrings no other message has, so sending and
+    # removing it changes the set of substrings searches look through
+    def send_remove(i):
+        message = requests.post(config.url + "message/send/v1", json = {
+            'token': user2_token,
+            'channel_id': channel1_id,
+            'message': ' '.join(f'{i}y{j}' for j in range(100))
+        })
+        remove = requests.delete(config.url + "message/remove/v1", json = {
+            'token': user2_token,
+            'message_id': message.json()['message_id']
+        })
+        return [message.status_code, remove.status_code]
+
+    def search(i):
+        response = requests.get(config.url + "search/v1", params = {
+            'token': user1_token,
+            'query_str': ['h', 'y1', 'hello', '1y1'][i % 4]
+        })
+        return [response.status_code]
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        futures = [pool.submit(send_remove if i % 3 == 0 else search, i) for i in range(600)]
+        statuses = [status for future in futures for status in future.result()]
+    assert set(statuses) == {VALID}
+
+    search1 = requests.get(config.url + "search/v1", params = {
+        'token': user1_token,
+        'query_str': 'hello'
+    })
+    assert len(json.loads(search1.text)['messages']) == 50
@@ -201,4 +201,36 @@ def test_standup_valid_more_messages(global_owner, create_channel):
         'channel_id': create_channel['channel_id'],
         'start': 0
     })
-    assert json.loads(message.text)['messages'][0]['message'] == 'annalee: message1\nannalee: message2\nannalee: message3\n'
\ No newline at end of file
+    assert json.loads(message.text)['messages'][0]['message'] == 'annalee: message1\nannalee: message2\nannalee: message3\n'
+
+# Valid case: the standup ends once its length has passed, not after twice the length
+def test_standup_ends_on_time(global_owner, create_channel):
+    token = global_owner['token']
+    channel_id = create_channel['channel_id']
+
+    resp1 = requests.post(config.url + "standup/start/v1", json ={
+        'token': token,
+        'channel_id': channel_id,
+        'length': 2
+    })
+    assert resp1.status_code == VALID
+
+    send = requests.post(config.url + "standup/send/v1", json = {
+        'token': token,
+        'channel_id': channel_id,
+        'message': 'message1'
+    })
+    assert send.status_code == VALID
+
+    time.sleep(3)
+    active = requests.get(config.url + "standup/active/v1", params ={
+        'token': token,
+        'channel_id': channel_id
+    })
+    assert json.loads(active.text)['is_active'] == False
+    message = requests.get(config.url + "channel/messages/v2", params ={
+        'token': token,
+        'channel_id': channel_id,
+        'start': 0
+    })
+    assert json.loads(message.text)['messages'][0]['message'] == 'annalee: message1\n'
@@ -1,6 +1,11 @@
 import pytest
 import requests
 import json
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
 from src import config
 from tests.fixture import global_owner, register_user2, register_user3, create_channel, create_dm
 from tests.fixture import VALID, ACCESSERROR, INPUTERROR, DEFAULT_IMG_URL
@@ -291,3 +296,55 @@ def test_user_profile_upload_photos(global_owner):
     img_url2 = json.loads(profile.text)['user']['profile_img_url']
     assert img_url2 != DEFAULT_IMG_URL
     assert img_url2 != img_url
+
+# Serves a small JPG after a delay, like a slow image host
+class SlowImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(1)
+        image = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(image, 'JPEG')
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(image.getvalue())))
+        self.end_headers()
+        self.wfile.write(image.getvalue())
+
+    def log_message(self, *args):
+        pass
+
+# Valid case: fetching a slow image does not hold up other users' requests
+def test_user_profile_uploadphoto_slow_url(global_owner, register_user2):
+    image_server = ThreadingHTTPServer(('127.0.0.1', 0), SlowImageHandler)
+    threading.Thread(target=image_server.serve_forever, daemon=True).start()
+    img_url = f'http://127.0.0.1:{image_server.server_address[1]}/slow.jpg'
+    channel_id = requests.post(config.url + "channels/create/v2", json = {
+        'token': register_user2['token'],
+        'name': 'sally',
+        'is_public': True
+    }).json()['channel_id']
+
+    responses = []
+    upload = threading.Thread(target=lambda: responses.append(
+        requests.post(config.url + "user/profile/uploadphoto/v1", json = {
+            'token': global_owner['token'],
+            'img_url': img_url,
+            'x_start': 0,
+            'y_start': 0,
+            'x_end': 5,
+            'y_end': 5
+        })
+    ))
+    upload.start()
+    time.sleep(0.2)
+    for i in range(2):
+        started = time.time()
+        send = requests.post(config.url + "message/send/v1", json = {
+            'token': register_user2['token'],
+            'channel_id': channel_id,
+            'message': f'hello {i}'
+        })
+        assert send.status_code == VALID
+        assert time.time() - started < 0.5
+    upload.join(10)
+    image_server.shutdown()
+    assert responses[0].status_code == VALID
@@ -5,7 +5,7 @@ import time
 from src import config
 from tests.fixture import global_owner, register_user2, register_user3, create_channel
 from tests.fixture import user1_channel_message_id, user1_send_dm, create_dm
-from tests.fixture import VALID, ACCESSERROR
+from tests.fixture import VALID, INPUTERROR, ACCESSERROR
 
 ##########################################
 ############ user_stats tests ############
@@ -367,3 +367,41 @@ def test_valid_involvement_rate_capped_at_1(global_owner, create_channel, user1_
 
     assert json.loads(stats.text)['user_stats']['involvement_rate'] == 1
 
+
+# Tests only the stats in the time range asked for are returned
+def test_valid_user_stats_time_range(global_owner, create_channel):
+    token = global_owner['token']
+    assert create_channel['channel_id'] != None
+
+    stats = requests.get(config.url + "user/stats/v1", params ={
+        'token': token,
+        'from': int(time.time()) + 60
+    })
+    assert stats.status_code == VALID
+    assert json.loads(stats.text)['user_stats']['channels_joined'] == []
+
+    stats = requests.get(config.url + "user/stats/v1", params ={
+        'token': token,
+        'from': 0,
+        'to': int(time.time()) + 60
+    })
+    assert stats.status_code == VALID
+    assert len(json.loads(stats.text)['user_stats']['channels_joined']) == 2
+    assert json.loads(stats.text)['user_stats']['involvement_rate'] != 0
+
+# Input error: time range is not valid
+def test_user_stats_invalid_time_range(global_owner):
+    token = global_owner['token']
+
+    stats = requests.get(config.url + "user/stats/v1", params ={
+        'token': token,
+        'from': 100,
+        'to': 50
+    })
+    assert stats.status_code == INPUTERROR
+
+    stats = requests.get(config.url + "user/stats/v1", params ={
+        'token': token,
+        'from': 'yesterday'
+    })
+    assert stats.status_code == INPUTERROR
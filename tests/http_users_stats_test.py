@@ -5,7 +5,7 @@ import time
 from src import config
 from tests.fixture import global_owner, register_user2, register_user3, create_channel
 from tests.fixture import user1_channel_message_id, user1_send_dm, create_dm
-from tests.fixture import VALID, ACCESSERROR
+from tests.fixture import VALID, INPUTERROR, ACCESSERROR
 
 TIME_WAIT = 1
 ##########################################
@@ -286,6 +286,8 @@ def test_users_stats_valid_user_sendlater_and_remove_message(global_owner, creat
         'time_sent': time_sent
     })
     message1_id = json.loads(send_message.text)['message_id']
+    # Wait for the scheduled message to be sent
+    time.sleep(TIME_WAIT + 1)
 
     stats2 = requests.get(config.url + "users/stats/v1", params ={
         'token': user1_token
@@ -420,6 +422,8 @@ def test_users_stats_valid_user_senddm_later_and_remove_message(global_owner, cr
         'time_sent': time_sent
     })
     message1_id = json.loads(send_message.text)['message_id']
+    # Wait for the scheduled message to be sent
+    time.sleep(TIME_WAIT + 1)
 
     stats2 = requests.get(config.url + "users/stats/v1", params ={
         'token': user1_token
@@ -532,4 +536,50 @@ def test_users_stats_removed_user(global_owner, register_user2):
     assert stats2.status_code == VALID
     rate2 = json.loads(stats2.text)['workspace_stats']['utilization_rate']
     assert rate2 == 0.0 
-    assert rate1 > rate2
\ No newline at end of file
+    assert rate1 > rate2
+
+# Valid case: reading the stats does not write to the store
+def test_users_stats_read_only(global_owner, register_user2, create_channel):
+    user1_token = global_owner['token']
+
+    stats = requests.get(config.url + "users/stats/v1", params ={
+        'token': user1_token
+    })
+    assert stats.status_code == VALID
+    assert stats.headers['X-Store-Flushes'] == '0'
+    # user1 is in a channel, user2 is not
+    assert json.loads(stats.text)['workspace_stats']['utilization_rate'] == 0.5
+
+    stats = requests.get(config.url + "user/stats/v1", params ={
+        'token': user1_token
+    })
+    assert stats.status_code == VALID
+    assert stats.headers['X-Store-Flushes'] == '0'
+
+# Valid case: only the stats up to the end of the time range are returned
+def test_users_stats_time_range(global_owner, create_channel):
+    user1_token = global_owner['token']
+
+    stats = requests.get(config.url + "users/stats/v1", params ={
+        'token': user1_token,
+        'to': int(time.time()) + 60
+    })
+    assert stats.status_code == VALID
+    assert len(json.loads(stats.text)['workspace_stats']['channels_exist']) == 2
+
+    stats = requests.get(config.url + "users/stats/v1", params ={
+        'token': user1_token,
+        'to': 0
+    })
+    assert stats.status_code == VALID
+    assert json.loads(stats.text)['workspace_stats']['channels_exist'] == []
+    assert json.loads(stats.text)['workspace_stats']['utilization_rate'] == 1.0
+
+# Input error: the time range ends before it starts
+def test_users_stats_invalid_time_range(global_owner):
+    stats = requests.get(config.url + "users/stats/v1", params ={
+        'token': global_owner['token'],
+        'from': 100,
+        'to': 50
+    })
+    assert stats.status_code == INPUTERROR
@@ -0,0 +1,71 @@
+import threading
+from src.hub import Hub
+
+# Events only reach subscriptions watching their topic, numbered in order
+def test_hub_publish():
+    hub = Hub(8)
+    watching = hub.subscribe(1, [('channel', 1)])
+    other = hub.subscribe(2, [('channel', 2)])
+    assert hub.publish(('channel', 1), 'a') == 1
+    assert hub.publish(('channel', 1), 'b') == 2
+    assert watching.get(timeout=0) == (1, 'a')
+    assert watching.get(timeout=0) == (2, 'b')
+    assert watching.get(timeout=0) is None
+    assert other.get(timeout=0) is None
+
+# watch and unwatch apply to every subscription of the user
+def test_hub_watch_unwatch():
+    hub = Hub(8)
+    first = hub.subscribe(1)
+    second = hub.subscribe(1)
+    assert not hub.watched(('dm', 1))
+    hub.watch(1, ('dm', 1))
+    assert hub.watched(('dm', 1))
+    hub.publish(('dm', 1), 'a')
+    assert first.get(timeout=0) == (1, 'a')
+    assert second.get(timeout=0) == (1, 'a')
+    hub.unwatch(1, ('dm', 1))
+    assert not hub.watched(('dm', 1))
+    hub.publish(('dm', 1), 'b')
+    assert first.get(timeout=0) is None
+    # Users without a subscription are ignored
+    hub.watch(2, ('dm', 1))
+    assert not hub.watched(('dm', 1))
+
+# A subscription that falls too far behind is closed, not buffered forever
+def test_hub_overflow_closes():
+    hub = Hub(2)
+    subscription = hub.subscribe(1, [('channel', 1)])
+    for event in range(3):
+        hub.publish(('channel', 1), event)
+    assert subscription.closed
+    assert subscription.get(timeout=0) is None
+
+# A waiting get() wakes for a publish, and for unsubscribe
+def test_hub_get_wakes():
+    hub = Hub(8)
+    subscription = hub.subscribe(1, [('channel', 1)])
+    results = []
+    thread = threading.Thread(target=lambda: results.append(subscription.get(timeout=5)))
+    thread.start()
+    hub.publish(('channel', 1), 'a')
+    thread.join(5)
+    assert results == [(1, 'a')]
+
+    thread = threading.Thread(target=lambda: results.append(subscription.get(timeout=5)))
+    thread.start()
+    hub.unsubscribe(subscription)
+    thread.join(5)
+    assert results == [(1, 'a'), None]
+    assert hub.count() == 0
+    assert not hub.watched(('channel', 1))
+
+# clear closes every subscription
+def test_hub_clear():
+    hub = Hub(8)
+    subscriptions = [hub.subscribe(u_id, [('channel', 1)]) for u_id in range(3)]
+    assert hub.count() == 3
+    hub.clear()
+    assert hub.count() == 0
+    assert all(subscription.closed for subscription in subscriptions)
+    assert not hub.watched(('channel', 1))
@@ -0,0 +1,81 @@
+import threading
+import time
+from src.locks import StripedLocks, SharedLock
+
+# Keys are taken in stripe order, so holders never wait on each other
+def test_striped_locks_order():
+    locks = StripedLocks(8)
+    keys = [('channel', i) for i in range(20)] + [('user', 1), ('user', 1)]
+    stripes = locks.stripes(keys)
+    assert stripes == sorted(set(stripes))
+    assert all(0 <= stripe < 8 for stripe in stripes)
+
+# Threads counting under the same key never lose an update
+def test_striped_locks_same_key():
+    locks = StripedLocks(8)
+    counts = {'total': 0}
+    def add():
+        for _ in range(1000):
+            with locks.hold([('channel', 1)]):
+                total = counts['total']
+                time.sleep(0)
+                counts['total'] = total + 1
+    threads = [threading.Thread(target=add) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counts['total'] == 4000
+
+# Many threads hold it shared at once, but not while one holds it alone
+def test_shared_lock():
+    lock = SharedLock()
+    lock.acquire_shared()
+    lock.acquire_shared()
+    taken = threading.Event()
+    def take():
+        with lock.exclusive():
+            taken.set()
+    thread = threading.Thread(target=take)
+    thread.start()
+    assert not taken.wait(0.1)
+    lock.release_shared()
+    assert not taken.wait(0.1)
+    lock.release_shared()
+    assert taken.wait(5)
+    thread.join()
+
+# A thread waiting to hold it alone goes before new shared holders
+def test_shared_lock_no_starvation():
+    lock = SharedLock()
+    lock.acquire_shared()
+    order = []
+    def take_alone():
+        with lock.exclusive():
+            order.append('alone')
+    def take_shared():
+        lock.acquire_shared()
+        order.append('shared')
+        lock.release_shared()
+    alone = threading.Thread(target=take_alone)
+    alone.start()
+    time.sleep(0.1)
+    shared = threading.Thread(target=take_shared)
+    shared.start()
+    time.sleep(0.1)
+    assert order == []
+    lock.release_shared()
+    alone.join(5)
+    shared.join(5)
+    assert order == ['alone', 'shared']
+
+# The thread holding it alone may take it again either way
+def test_shared_lock_reentrant():
+    lock = SharedLock()
+    with lock.exclusive():
+        with lock.exclusive():
+            lock.acquire_shared()
+            assert lock.is_owned()
+            lock.release_shared()
+        assert lock.is_owned()
+    assert not lock.is_owned()
@@ -0,0 +1,53 @@
+import time
+import threading
+from src.scheduler import Scheduler
+
+# Jobs run in the order they are due, not the order they were scheduled
+def test_scheduler_runs_in_due_order():
+    scheduler = Scheduler()
+    done = []
+    finished = threading.Event()
+    now = time.time()
+    scheduler.schedule(now + 0.2, done.append, 'second')
+    scheduler.schedule(now + 0.1, done.append, 'first')
+    scheduler.schedule(now + 0.3, finished.set)
+    assert finished.wait(5)
+    assert done == ['first', 'second']
+    assert scheduler.pending() == 0
+
+# A failing job does not stop the jobs after it
+def test_scheduler_failing_job():
+    scheduler = Scheduler()
+    finished = threading.Event()
+    now = time.time()
+    scheduler.schedule(now, lambda: 1 / 0)
+    scheduler.schedule(now + 0.05, finished.set)
+    assert finished.wait(5)
+
+# Cleared jobs never run
+def test_scheduler_clear():
+    scheduler = Scheduler()
+    done = []
+    scheduler.schedule(time.time() + 0.1, done.append, 'cleared')
+    scheduler.clear()
+    assert scheduler.pending() == 0
+    time.sleep(0.2)
+    assert done == []
+
+# Jobs running a callback in keep survive a clear, in due order
+def test_scheduler_clear_keep():
+    scheduler = Scheduler()
+    done = []
+    finished = threading.Event()
+    def kept(value):
+        done.append(value)
+        if len(done) == 2:
+            finished.set()
+    now = time.time()
+    scheduler.schedule(now + 0.2, kept, 'second')
+    scheduler.schedule(now + 0.1, done.append, 'cleared')
+    scheduler.schedule(now + 0.1, kept, 'first')
+    scheduler.clear(keep=[kept])
+    assert scheduler.pending() == 2
+    assert finished.wait(5)
+    assert done == ['first', 'second']
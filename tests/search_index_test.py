@@ -0,0 +1,61 @@
+from src.search_index import SearchIndex
+
+CHANNEL = ('channel', 1)
+DM = ('dm', 1)
+
+# Queries of any length match substrings in any case
+def test_search_index_substrings():
+    index = SearchIndex()
+    index.add(CHANNEL, 1, 'Hello world')
+    index.add(CHANNEL, 3, 'say HELLO')
+    index.add(CHANNEL, 5, 'goodbye')
+    assert index.candidates(CHANNEL, 'hello') == {1, 3}
+    assert index.candidates(CHANNEL, 'O') == {1, 3, 5}
+    assert index.candidates(CHANNEL, 'lo wor') == {1}
+    assert index.candidates(CHANNEL, 'hi') == set()
+
+# Only substrings of GRAM_SIZE are posted, messages shorter than that are
+# still found by short queries
+def test_search_index_short_messages():
+    index = SearchIndex()
+    index.add(CHANNEL, 1, 'hi')
+    index.add(CHANNEL, 3, 'ship')
+    assert index.postings[CHANNEL].keys() == {'shi', 'hip'}
+    assert index.candidates(CHANNEL, 'HI') == {1, 3}
+    # Short messages are candidates for every short query
+    assert index.candidates(CHANNEL, 'p') == {1, 3}
+    assert index.candidates(CHANNEL, 'hip') == {3}
+
+# Candidates only need to hold every gram of the query, not the query itself
+def test_search_index_candidates():
+    index = SearchIndex()
+    index.add(CHANNEL, 1, 'abcd bcde')
+    assert index.candidates(CHANNEL, 'abcde') == {1}
+
+# Messages are only found in the channel/DM holding them
+def test_search_index_partitioned():
+    index = SearchIndex()
+    index.add(CHANNEL, 1, 'hello')
+    index.add(DM, 2, 'hello')
+    assert index.candidates(CHANNEL, 'hello') == {1}
+    assert index.candidates(DM, 'hello') == {2}
+    assert index.candidates(('channel', 2), 'hello') == set()
+
+# Edited messages are found by their new text, and removed ones leave
+# nothing behind
+def test_search_index_update_remove():
+    index = SearchIndex()
+    index.add(CHANNEL, 1, 'hello')
+    index.add(CHANNEL, 3, 'hello again')
+    index.update(CHANNEL, 1, 'hello', 'hello there')
+    assert index.candidates(CHANNEL, 'hello') == {1, 3}
+    assert index.candidates(CHANNEL, 'there') == {1}
+    index.update(CHANNEL, 3, 'hello again', 'ok')
+    assert index.candidates(CHANNEL, 'hello') == {1}
+    assert index.candidates(CHANNEL, 'ok') == {3}
+
+    index.remove(CHANNEL, 1, 'hello there')
+    assert index.candidates(CHANNEL, 'hello') == set()
+    assert index.postings == {}
+    index.remove(CHANNEL, 3, 'ok')
+    assert index.short == {}
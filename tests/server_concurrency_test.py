@@ -0,0 +1,52 @@
+import json
+import sys
+import pytest
+from src import config
+
+# A server of its own, run in this process on a database in a temporary
+# directory, so config.concurrency_header can be turned on for it
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('store')
+    config.database_path = str(directory / 'database.json')
+    config.wal_path = str(directory / 'database.log')
+    config.sqlite_path = str(directory / 'database.db')
+    config.concurrency_header = True
+    from src.server import APP
+    test_client = APP.test_client()
+    test_client.delete('/clear/v1')
+    return test_client
+
+# Users sending to their own channels at the same time hold their locks
+# at the same time
+def test_message_send_concurrency(client):
+    from concurrent.futures import ThreadPoolExecutor
+    tokens = [json.loads(client.post('/auth/register/v2', json = {
+        'email': f'sender{i}@gmail.com',
+        'password': 'password',
+        'name_first': 'sender',
+        'name_last': f'number{i}'
+    }).data)['token'] for i in range(4)]
+    channel_ids = [json.loads(client.post('/channels/create/v2', json = {
+        'token': token,
+        'name': f'channel{i}',
+        'is_public': True
+    }).data)['channel_id'] for i, token in enumerate(tokens)]
+
+    def send(i):
+        return client.post('/message/send/v1', json = {
+            'token': tokens[i % 4],
+            'channel_id': channel_ids[i % 4],
+            'message': f'hello {i}'
+        })
+    # Threads are switched between often, as they would be while waiting
+    # on their clients
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            responses = list(pool.map(send, range(200)))
+    finally:
+        sys.setswitchinterval(interval)
+    assert all(response.status_code == 200 for response in responses)
+    assert max(int(response.headers['X-Store-Concurrency']) for response in responses) > 1
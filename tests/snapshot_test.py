@@ -0,0 +1,77 @@
+import json
+import struct
+import pytest
+from src.snapshot import write_snapshot, read_snapshot, convert, is_snapshot, SnapshotError, HEADER
+from src.wal import WriteAheadLog
+
+def new_store():
+    return {
+        'users': [{'auth_user_id': 1, 'handle_str': 'annalee', 'session_list': [1, 2]}],
+        'channels': [{
+            'channel_id': 1,
+            'name': 'anna',
+            'messages': [{'message_id': 1, 'message': 'héllo 👋', 'is_pinned': False, 'reacts': []}],
+        }],
+        'dms': [],
+        'complete_dms': [],
+        'workspace_stats': {'utilization_rate': 0.5, 'channels_exist': [{'num_channels_exist': 1, 'time_stamp': 0}]},
+        'message_ids_issued': 2,
+        'removed': None,
+    }
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_snapshot_round_trip(tmp_path, compress):
+    path = str(tmp_path / 'database.snap')
+    write_snapshot(path, 7, new_store(), compress=compress)
+    assert is_snapshot(path)
+    assert read_snapshot(path) == (7, new_store())
+
+# The log can write binary snapshots, and a JSON one is still read back
+def test_snapshot_wal_format(tmp_path):
+    snapshot_path = str(tmp_path / 'database.json')
+    log_path = str(tmp_path / 'database.log')
+    wal = WriteAheadLog(snapshot_path, log_path, 1024 * 1024)
+    store = wal.recover(new_store())
+    wal.compact(store)
+    assert not is_snapshot(snapshot_path)
+
+    wal = WriteAheadLog(snapshot_path, log_path, 1024 * 1024, 'binary-zlib')
+    store = wal.recover({})
+    assert store == new_store()
+    store['users'].append({'auth_user_id': 2, 'handle_str': 'sallyli', 'session_list': []})
+    wal.commit(store)
+    wal.compact(store)
+    assert is_snapshot(snapshot_path)
+    assert WriteAheadLog(snapshot_path, log_path, 1024 * 1024).recover({}) == store
+
+def test_snapshot_convert(tmp_path):
+    with open(tmp_path / 'database.json', 'w') as FILE:
+        json.dump({'version': 1, 'seq': 3, 'store': new_store()}, FILE)
+    convert('to-binary', str(tmp_path / 'database.json'), str(tmp_path / 'database.snap'))
+    assert read_snapshot(str(tmp_path / 'database.snap')) == (3, new_store())
+
+    convert('to-json', str(tmp_path / 'database.snap'), str(tmp_path / 'converted.json'))
+    with open(tmp_path / 'converted.json', 'r') as FILE:
+        assert json.load(FILE) == {'version': 1, 'seq': 3, 'store': new_store()}
+
+# Snapshots this version cannot read are refused rather than misread
+def test_snapshot_refused(tmp_path):
+    path = str(tmp_path / 'database.snap')
+    write_snapshot(path, 1, new_store())
+    with open(path, 'r+b') as FILE:
+        magic, version, marshal_version, compression, seq = HEADER.unpack(FILE.read(HEADER.size))
+        FILE.seek(0)
+        FILE.write(HEADER.pack(magic, version, marshal_version + 1, compression, seq))
+    with pytest.raises(SnapshotError):
+        read_snapshot(path)
+
+    write_snapshot(path, 1, new_store())
+    with open(path, 'r+b') as FILE:
+        FILE.truncate(HEADER.size + 10)
+    with pytest.raises(SnapshotError):
+        read_snapshot(path)
+
+    with open(path, 'wb') as FILE:
+        FILE.write(struct.pack('<8s', b'NOTASNAP'))
+    with pytest.raises(SnapshotError):
+        read_snapshot(path)
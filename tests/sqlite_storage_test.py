@@ -0,0 +1,205 @@
+import json
+import sqlite3
+from src.sqlite_storage import SqliteStorage
+from src.wal import WriteAheadLog
+
+def new_store():
+    return {
+        'users': [],
+        'channels': [],
+        'dms': [],
+        'notifications': [],
+        'complete_dms': [],
+        'workspace_stats': {
+            'channels_exist': [{'num_channels_exist': 0, 'time_stamp': 0}],
+            'dms_exist': [{'num_dms_exist': 0, 'time_stamp': 0}],
+            'messages_exist': [{'num_messages_exist': 0, 'time_stamp': 0}],
+        },
+    }
+
+def new_user(auth_user_id, handle_str):
+    return {
+        'auth_user_id': auth_user_id,
+        'email': f'{handle_str}@gmail.com',
+        'handle_str': handle_str,
+        'is_removed': False,
+        'session_list': [1],
+        'all_notifications': [],
+        'channels_joined': [{'num_channels_joined': 0, 'time_stamp': 0}],
+        'dms_joined': [{'num_dms_joined': 0, 'time_stamp': 0}],
+        'messages_sent': [{'num_messages_sent': 0, 'time_stamp': 0}],
+    }
+
+def new_channel(channel_id, u_id):
+    return {
+        'channel_id': channel_id,
+        'name': f'channel{channel_id}',
+        'is_public': True,
+        'all_members': [u_id],
+        'owner_members': [u_id],
+        'messages': [],
+    }
+
+def new_message(message_id, u_id, text):
+    return {
+        'message_id': message_id,
+        'u_id': u_id,
+        'message': text,
+        'time_created': 0,
+        'is_pinned': False,
+        'reacts': [{'react_id': 1, 'u_ids': [], 'is_this_user_reacted': False}],
+    }
+
+def new_storage(tmp_path, compact_size=1024 * 1024, legacy=None):
+    return SqliteStorage(str(tmp_path / 'database.db'), compact_size, legacy)
+
+def query(tmp_path, sql, *args):
+    with sqlite3.connect(tmp_path / 'database.db') as db:
+        return db.execute(sql, args).fetchall()
+
+# Collects the statements that write to the database
+def count_writes(storage):
+    writes = []
+    storage.connect().set_trace_callback(
+        lambda sql: writes.append(sql) if sql.split()[0] in ('INSERT', 'UPDATE', 'DELETE') else None)
+    return writes
+
+# The store is rebuilt from the tables after a restart
+def test_sqlite_recover(tmp_path):
+    storage = new_storage(tmp_path)
+    store = storage.recover(new_store())
+    store['users'].append(new_user(1, 'annalee'))
+    store['users'].append(new_user(2, 'sallyli'))
+    store['channels'].append(new_channel(1, 1))
+    store['dms'].append({'dm_id': 1, 'name': 'annalee, sallyli', 'creator': 1, 'members': [1, 2], 'messages': []})
+    storage.commit(store)
+    for message_id in range(1, 6):
+        store['channels'][0]['messages'].append(new_message(message_id, 1, f'hello {message_id}'))
+        store['workspace_stats']['messages_exist'].append({'num_messages_exist': message_id, 'time_stamp': message_id})
+        storage.commit(store)
+    store['dms'][0]['messages'].append(new_message(6, 2, 'hi'))
+    store['channels'][0]['messages'].pop(2)
+    store['channels'][0]['messages'][0]['reacts'][0]['u_ids'].append(2)
+    store['channels'][0]['all_members'].append(2)
+    store['users'][0]['handle_str'] = 'anna'
+    store['users'][1]['session_list'].append(2)
+    storage.commit(store)
+
+    assert new_storage(tmp_path).recover(new_store()) == store
+
+    # Removing the channel removes its messages and members as well
+    store['channels'].clear()
+    storage.commit(store)
+    assert new_storage(tmp_path).recover(new_store()) == store
+    assert query(tmp_path, "SELECT COUNT(*) FROM messages WHERE container = 'channel'") == [(0, )]
+    assert query(tmp_path, "SELECT COUNT(*) FROM memberships WHERE container = 'channel'") == [(0, )]
+
+# Sending a message writes the message and the new stats entry, not every
+# message in the channel or every entry in the series
+def test_sqlite_commit_only_changed_rows(tmp_path):
+    storage = new_storage(tmp_path)
+    store = storage.recover(new_store())
+    store['users'].append(new_user(1, 'annalee'))
+    store['channels'].append(new_channel(1, 1))
+    for message_id in range(1, 51):
+        store['channels'][0]['messages'].append(new_message(message_id, 1, 'hello'))
+        store['users'][0]['messages_sent'].append({'num_messages_sent': message_id, 'time_stamp': message_id})
+    storage.commit(store)
+
+    writes = count_writes(storage)
+    store['channels'][0]['messages'].append(new_message(51, 1, 'hello'))
+    store['users'][0]['messages_sent'].append({'num_messages_sent': 51, 'time_stamp': 51})
+    assert storage.commit(store) == 2
+    inserts = [sql for sql in writes if sql.startswith('INSERT INTO stats') or sql.startswith('INSERT OR REPLACE INTO messages')]
+    assert len(inserts) == 2
+    assert query(tmp_path, "SELECT COUNT(*) FROM stats WHERE owner = 1 AND series = 'messages_sent'") == [(52, )]
+
+    # Nothing changed, nothing is written
+    assert storage.commit(store) == 0
+
+# Stats series written from the first entry that changed read back whole
+def test_sqlite_series_tail(tmp_path):
+    storage = new_storage(tmp_path)
+    store = storage.recover(new_store())
+    store['users'].append(new_user(1, 'annalee'))
+    storage.commit(store)
+
+    for total in range(1, 11):
+        store['users'][0]['messages_sent'].append({'num_messages_sent': total, 'time_stamp': total})
+        store['workspace_stats']['messages_exist'].append({'num_messages_exist': total, 'time_stamp': total})
+        storage.commit(store)
+    store['users'][0]['messages_sent'][-1]['num_messages_sent'] = 11
+    del store['workspace_stats']['messages_exist'][2:6]
+    storage.commit(store)
+
+    assert new_storage(tmp_path).recover(new_store()) == store
+
+# Only the records named by the scope are put back
+def test_sqlite_rollback_scope(tmp_path):
+    storage = new_storage(tmp_path)
+    store = storage.recover(new_store())
+    store['channels'].append(new_channel(1, 1))
+    store['channels'].append(new_channel(2, 1))
+    storage.commit(store)
+
+    store['channels'][0]['messages'].append(new_message(1, 1, 'hello'))
+    store['channels'][1]['messages'].append(new_message(2, 1, 'hello'))
+    storage.rollback(store, {'channels': [1]})
+    assert store['channels'][0]['messages'] == []
+    assert len(store['channels'][1]['messages']) == 1
+
+# A second process sharing the database picks up only the new commits
+def test_sqlite_refresh(tmp_path):
+    first = new_storage(tmp_path)
+    first_store = first.recover(new_store())
+    first_store['users'].append(new_user(1, 'annalee'))
+    first.commit(first_store)
+
+    second = new_storage(tmp_path)
+    second_store = second.recover(new_store())
+    assert second_store == first_store
+
+    first_store['users'].append(new_user(2, 'sallyli'))
+    first_store['users'][0]['is_removed'] = True
+    with first.lock():
+        first.commit(first_store)
+    with second.lock():
+        assert second.refresh(second_store) is second_store
+    assert second_store == first_store
+    assert second.seq == first.seq
+
+    # Once the oplog is emptied the store is read again from scratch
+    first_store['users'].pop()
+    first.compact(first_store)
+    second_store = second.refresh(second_store)
+    assert second_store == first_store
+
+    # Changes made after catching up are still written out
+    second_store['users'][0]['handle_str'] = 'anna'
+    second.commit(second_store)
+    assert new_storage(tmp_path).recover(new_store()) == second_store
+
+# A database kept by the write-ahead log is moved over on first startup
+def test_sqlite_legacy_database(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / 'database.json'), str(tmp_path / 'database.log'), 1024 * 1024)
+    store = wal.recover(new_store())
+    store['users'].append(new_user(1, 'annalee'))
+    wal.commit(store)
+
+    storage = new_storage(tmp_path, legacy=WriteAheadLog(
+        str(tmp_path / 'database.json'), str(tmp_path / 'database.log'), 1024 * 1024))
+    recovered = storage.recover(new_store())
+    assert recovered == store
+    assert storage.needs_compact
+    storage.compact(recovered)
+    assert new_storage(tmp_path).recover(new_store()) == store
+
+# The database runs in WAL journal mode with the lookup columns indexed
+def test_sqlite_schema(tmp_path):
+    storage = new_storage(tmp_path)
+    storage.compact(storage.recover(new_store()))
+    assert query(tmp_path, 'PRAGMA journal_mode') == [('wal', )]
+    indexes = {row[0] for row in query(tmp_path, "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'users_email', 'users_handle', 'memberships_user', 'messages_container', 'messages_user'} <= indexes
+    plan = json.dumps(query(tmp_path, 'EXPLAIN QUERY PLAN SELECT * FROM users WHERE handle_str = ?', 'anna'))
+    assert 'users_handle' in plan
@@ -0,0 +1,53 @@
+from src import config
+from src.timeseries import record, downsample, select
+
+# Returns a series starting at 0 at time 0, with the given (total, time) entries
+def make_series(*entries):
+    series = [{'num_messages_sent': 0, 'time_stamp': 0}]
+    for total, time_stamp in entries:
+        series.append({'num_messages_sent': total, 'time_stamp': time_stamp})
+    return series
+
+# Every change gets its own entry when coalescing is off
+def test_record_appends(monkeypatch):
+    monkeypatch.setattr(config, 'stats_coalesce_seconds', 0)
+    series = make_series()
+    record(series, 'num_messages_sent', 1, 100)
+    record(series, 'num_messages_sent', 1, 100)
+    record(series, 'num_messages_sent', -1, 101)
+    assert series == make_series((1, 100), (2, 100), (1, 101))
+
+# Changes in the same window share an entry, the first entry is kept apart
+def test_record_coalesces(monkeypatch):
+    monkeypatch.setattr(config, 'stats_coalesce_seconds', 10)
+    series = make_series()
+    record(series, 'num_messages_sent', 1, 5)
+    record(series, 'num_messages_sent', 3, 101)
+    record(series, 'num_messages_sent', -1, 109)
+    record(series, 'num_messages_sent', 1, 110)
+    assert series == make_series((1, 5), (3, 109), (4, 110))
+
+# Old entries keep only the latest total of each period
+def test_downsample(monkeypatch):
+    monkeypatch.setattr(config, 'stats_retention', [(1000, 100), (5000, 1000)])
+    series = make_series((1, 10), (2, 20), (3, 950), (4, 1050), (5, 5500), (6, 5510))
+    assert downsample(series, 6000)
+    # 10..950 are over 5000 old, 1050 is over 1000 old, 5500+ are recent
+    assert series == make_series((3, 950), (4, 1050), (5, 5500), (6, 5510))
+    assert not downsample(series, 6000)
+
+# Nothing is dropped without a retention
+def test_downsample_no_retention(monkeypatch):
+    monkeypatch.setattr(config, 'stats_retention', [])
+    series = make_series((1, 10), (2, 11))
+    assert not downsample(series, 10 ** 9)
+    assert len(series) == 3
+
+# The range is inclusive at both ends
+def test_select():
+    series = make_series((1, 10), (2, 20), (3, 30))
+    assert select(series) == series
+    assert select(series, 10, 20) == series[1:3]
+    assert select(series, 11, 29) == series[2:3]
+    assert select(series, time_to=0) == series[:1]
+    assert select(series, 31) == []
@@ -0,0 +1,302 @@
+import json
+from src.wal import WriteAheadLog
+
+def new_store():
+    return {
+        'users': [],
+        'channels': [],
+        'messages': [],
+        'dms': [],
+        'complete_dms': [],
+        'workspace_stats': {},
+    }
+
+def new_log(tmp_path, compact_size=1024 * 1024):
+    return WriteAheadLog(str(tmp_path / 'database.json'), str(tmp_path / 'database.log'), compact_size)
+
+def log_lines(tmp_path):
+    with open(tmp_path / 'database.log', 'r') as FILE:
+        return [json.loads(line) for line in FILE]
+
+# Sending a message only logs the new message, not the whole channel
+def test_wal_commit_only_changed_records(tmp_path):
+    wal = new_log(tmp_path)
+    store = wal.recover(new_store())
+    store['channels'].append({'channel_id': 1, 'name': 'anna', 'messages': []})
+    store['channels'].append({'channel_id': 2, 'name': 'sally', 'messages': []})
+    wal.commit(store)
+
+    store['channels'][0]['messages'].insert(0, {'message_id': 1, 'message': 'hello'})
+    assert wal.commit(store) == 1
+    ops = log_lines(tmp_path)[-1]['ops']
+    assert ops == [{
+        'op': 'put',
+        'path': ['channels', 1, 'messages'],
+        'key': 1,
+        'index': 0,
+        'record': {'message_id': 1, 'message': 'hello'}
+    }]
+
+    # Nothing changed, nothing is written
+    assert wal.commit(store) == 0
+
+# The store is rebuilt from the log after a restart
+def test_wal_recover(tmp_path):
+    wal = new_log(tmp_path)
+    store = wal.recover(new_store())
+    store['users'].append({'auth_user_id': 1, 'handle_str': 'annalee'})
+    store['dms'].append({'dm_id': 1, 'name': 'annalee', 'messages': []})
+    store['workspace_stats'] = {'utilization_rate': 0.0}
+    wal.commit(store)
+    for message_id in range(2, 8, 2):
+        store['dms'][0]['messages'].insert(0, {'message_id': message_id, 'message': 'hi'})
+        wal.commit(store)
+    store['dms'][0]['messages'].pop(1)
+    store['users'][0]['handle_str'] = 'anna'
+    wal.commit(store)
+
+    recovered = new_log(tmp_path).recover(new_store())
+    assert recovered == store
+
+    # Removing the DM removes its messages as well
+    store['dms'].clear()
+    wal.commit(store)
+    assert new_log(tmp_path).recover(new_store()) == store
+
+# A commit that was only partly written before a crash is discarded
+def test_wal_torn_commit(tmp_path):
+    wal = new_log(tmp_path)
+    store = wal.recover(new_store())
+    store['users'].append({'auth_user_id': 1, 'handle_str': 'annalee'})
+    wal.commit(store)
+    with open(tmp_path / 'database.log', 'a') as FILE:
+        FILE.write('{"seq": 2, "ops": [{"op": "del')
+
+    wal = new_log(tmp_path)
+    recovered = wal.recover(new_store())
+    assert recovered['users'] == [{'auth_user_id': 1, 'handle_str': 'annalee'}]
+
+    # New commits carry on after the last complete one
+    recovered['users'].append({'auth_user_id': 2, 'handle_str': 'sallyli'})
+    wal.commit(recovered)
+    assert new_log(tmp_path).recover(new_store()) == recovered
+
+# The log is folded into a snapshot once it gets too big
+def test_wal_compact(tmp_path):
+    wal = new_log(tmp_path, compact_size=512)
+    store = wal.recover(new_store())
+    for u_id in range(1, 30):
+        store['users'].append({'auth_user_id': u_id, 'handle_str': f'user{u_id}'})
+        wal.commit(store)
+
+    assert (tmp_path / 'database.log').stat().st_size < 512
+    with open(tmp_path / 'database.json', 'r') as FILE:
+        assert 'seq' in json.load(FILE)
+    assert new_log(tmp_path).recover(new_store()) == store
+
+# A database.json written before the log existed is still loaded
+def test_wal_legacy_database(tmp_path):
+    store = new_store()
+    store['users'].append({'auth_user_id': 1, 'handle_str': 'annalee'})
+    with open(tmp_path / 'database.json', 'w') as FILE:
+        json.dump(store, FILE)
+    assert new_log(tmp_path).recover(new_store()) == store
+
+# Rolling back restores the last committed state
+def test_wal_rollback(tmp_path):
+    wal = new_log(tmp_path)
+    store = wal.recover(new_store())
+    store['users'].append({'auth_user_id': 1, 'handle_str': 'annalee'})
+    store['channels'].append({'channel_id': 1, 'name': 'anna', 'messages': []})
+    wal.commit(store)
+    user = store['users'][0]
+
+    user['handle_str'] = 'anna'
+    store['users'].append({'auth_user_id': 2, 'handle_str': 'sallyli'})
+    store['channels'][0]['messages'].insert(0, {'message_id': 1, 'message': 'hello'})
+    store['workspace_stats'] = {'utilization_rate': 1.0}
+    wal.rollback(store)
+
+    assert store == {
+        'users': [{'auth_user_id': 1, 'handle_str': 'annalee'}],
+        'channels': [{'channel_id': 1, 'name': 'anna', 'messages': []}],
+        'messages': [],
+        'dms': [],
+        'complete_dms': [],
+        'workspace_stats': {},
+    }
+    # Records are restored in place
+    assert store['users'][0] is user
+    assert wal.commit(store) == 0
+
+# A scoped rollback only undoes the records it names
+def test_wal_rollback_scope(tmp_path):
+    wal = new_log(tmp_path)
+    store = wal.recover(new_store())
+    store['users'].append({'auth_user_id': 1, 'handle_str': 'annalee'})
+    store['users'].append({'auth_user_id': 2, 'handle_str': 'sallyli'})
+    store['channels'].append({'channel_id': 1, 'name': 'anna', 'messages': []})
+    store['channels'].append({'channel_id': 2, 'name': 'sally', 'messages': []})
+    wal.commit(store)
+
+    store['users'][0]['handle_str'] = 'anna'
+    del store['users'][1]
+    store['users'].append({'auth_user_id': 3, 'handle_str': 'bobsmith'})
+    store['channels'][0]['messages'].append({'message_id': 1, 'message': 'hello'})
+    store['channels'][1]['messages'].append({'message_id': 3, 'message': 'kept'})
+    wal.rollback(store, {'users': {2, 3}, 'channels': {1}})
+
+    assert store['users'] == [
+        {'auth_user_id': 1, 'handle_str': 'anna'},
+        {'auth_user_id': 2, 'handle_str': 'sallyli'},
+    ]
+    assert store['channels'] == [
+        {'channel_id': 1, 'name': 'anna', 'messages': []},
+        {'channel_id': 2, 'name': 'sally', 'messages': [{'message_id': 3, 'message': 'kept'}]},
+    ]
+    assert wal.commit(store) == 2
+
+# Given the records that may have changed, only those are compared
+def test_wal_commit_changes(tmp_path):
+    wal = new_log(tmp_path)
+    store = wal.recover(new_store())
+    store['users'].append({'auth_user_id': 1, 'handle_str': 'annalee'})
+    store['users'].append({'auth_user_id': 2, 'handle_str': 'sallyli'})
+    store['channels'].append({'channel_id': 1, 'name': 'anna', 'messages': []})
+    wal.commit(store)
+
+    store['users'][0]['handle_str'] = 'anna'
+    store['users'][1]['handle_str'] = 'sally'
+    message = {'message_id': 1, 'message': 'hello'}
+    store['channels'][0]['messages'].append(message)
+    channel = {'channel_id': 2, 'name': 'sally', 'messages': [{'message_id': 3, 'message': 'hi'}]}
+    store['channels'].append(channel)
+    assert wal.commit(store, {
+        ('users', ): {1: store['users'][0]},
+        ('channels', ): {2: channel},
+        ('channels', 1, 'messages'): {1: message},
+    }) == 4
+
+    # The change left out was not written
+    recovered = new_log(tmp_path).recover(new_store())
+    assert recovered['users'][1] == {'auth_user_id': 2, 'handle_str': 'sallyli'}
+    assert recovered['channels'] == store['channels']
+
+    store['channels'][0]['messages'].remove(message)
+    del store['channels'][1]
+    assert wal.commit(store, {
+        ('channels', ): {2: None},
+        ('channels', 1, 'messages'): {1: None},
+    }) == 2
+    assert new_log(tmp_path).recover(new_store())['channels'] == store['channels']
+
+# Given the records to undo, only those are put back, and each is reported
+def test_wal_rollback_changes(tmp_path):
+    wal = new_log(tmp_path)
+    store = wal.recover(new_store())
+    store['users'].append({'auth_user_id': 1, 'handle_str': 'annalee'})
+    store['channels'].append({'channel_id': 1, 'name': 'anna', 'messages': [
+        {'message_id': 1, 'message': 'hello'},
+        {'message_id': 3, 'message': 'bye'},
+    ]})
+    wal.commit(store)
+
+    store['users'][0]['handle_str'] = 'anna'
+    store['channels'][0]['messages'][0]['message'] = 'edited'
+    del store['channels'][0]['messages'][1]
+    store['channels'][0]['messages'].append({'message_id': 5, 'message': 'new'})
+    restored = wal.rollback(store, changes={
+        ('channels', 1, 'messages'): {1, 3, 5},
+    })
+
+    assert store['users'] == [{'auth_user_id': 1, 'handle_str': 'anna'}]
+    assert store['channels'][0]['messages'] == [
+        {'message_id': 1, 'message': 'hello'},
+        {'message_id': 3, 'message': 'bye'},
+    ]
+    path = ('channels', 1, 'messages')
+    assert sorted(restored, key=lambda item: item[1]) == [
+        (path, 1, {'message_id': 1, 'message': 'edited'}, {'message_id': 1, 'message': 'hello'}),
+        (path, 3, None, {'message_id': 3, 'message': 'bye'}),
+        (path, 5, {'message_id': 5, 'message': 'new'}, None),
+    ]
+    assert wal.commit(store) == 1
+
+# Stats series are logged from the first entry that changed, so the bytes
+# written per change stay the same however long the series get
+def test_wal_commit_series_tail(tmp_path):
+    wal = new_log(tmp_path)
+    store = wal.recover(new_store())
+    store['users'].append({'auth_user_id': 1, 'messages_sent': [{'num_messages_sent': 0, 'time_stamp': 0}]})
+    store['workspace_stats'] = {'messages_exist': [{'num_messages_exist': 0, 'time_stamp': 0}]}
+    wal.commit(store)
+
+    sizes = []
+    for total in range(1, 1001):
+        store['users'][0]['messages_sent'].append({'num_messages_sent': total % 10, 'time_stamp': 0})
+        store['workspace_stats']['messages_exist'].append({'num_messages_exist': total % 10, 'time_stamp': 0})
+        wal.commit(store)
+        with open(tmp_path / 'database.log', 'r') as FILE:
+            sizes.append(len(FILE.readlines()[-1]))
+    # Commits 200 and 900 only differ in the digits of numbers of the same width
+    assert sizes[199] == sizes[899]
+    assert log_lines(tmp_path)[-1]['ops'][1]['tails'] == {
+        'messages_exist': [1000, [{'num_messages_exist': 0, 'time_stamp': 0}]]
+    }
+
+    # Folding into the last entry, or thinning out old ones, is logged from
+    # the first entry that changed
+    store['users'][0]['messages_sent'][-1]['num_messages_sent'] = 10
+    del store['workspace_stats']['messages_exist'][1:500]
+    wal.commit(store)
+    assert log_lines(tmp_path)[-1]['ops'][0]['tails']['messages_sent'][0] == 1000
+    assert log_lines(tmp_path)[-1]['ops'][1]['tails']['messages_exist'][0] == 1
+    assert new_log(tmp_path).recover(new_store()) == store
+
+# A second process sharing the files picks up commits made by the first
+def test_wal_refresh(tmp_path):
+    wal1 = new_log(tmp_path)
+    store1 = wal1.recover(new_store())
+    wal2 = new_log(tmp_path)
+    store2 = wal2.recover(new_store())
+
+    store1['users'].append({'auth_user_id': 1, 'handle_str': 'annalee'})
+    store1['dms'].append({'dm_id': 1, 'name': 'annalee', 'messages': []})
+    wal1.commit(store1)
+    store1['dms'][0]['messages'].insert(0, {'message_id': 2, 'message': 'hi'})
+    wal1.commit(store1)
+
+    with wal2.lock():
+        store2 = wal2.refresh(store2)
+    assert store2 == store1
+    # What was picked up is not written out again
+    assert wal2.commit(store2) == 0
+
+    store2['users'][0]['handle_str'] = 'anna'
+    with wal2.lock():
+        wal2.commit(store2)
+    with wal1.lock():
+        store1 = wal1.refresh(store1)
+    assert store1['users'][0]['handle_str'] == 'anna'
+
+    # Compaction by one process makes the other reload the snapshot
+    wal1.compact(store1)
+    store1['users'].append({'auth_user_id': 2, 'handle_str': 'sallyli'})
+    wal1.commit(store1)
+    with wal2.lock():
+        store2 = wal2.refresh(store2)
+    assert store2 == store1
+
+# Batches staged by several commits go out in one write, one line each
+def test_wal_write_batches(tmp_path):
+    wal = new_log(tmp_path)
+    wal.fsync = True
+    store = wal.recover(new_store())
+    batches = []
+    for u_id in range(1, 4):
+        store['users'].append({'auth_user_id': u_id, 'handle_str': f'user{u_id}'})
+        batches.append(wal.stage(store))
+    assert wal.stage(store) is None
+    wal.write(batches)
+    assert [line['seq'] for line in log_lines(tmp_path)] == [1, 2, 3]
+    assert new_log(tmp_path).recover(new_store()) == store
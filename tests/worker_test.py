@@ -0,0 +1,53 @@
+import threading
+from src.worker import Worker
+
+# Jobs run in the order they were submitted, and wait() sees all of them
+def test_worker_runs_in_order():
+    worker = Worker()
+    done = []
+    for i in range(100):
+        worker.submit(done.append, i)
+    worker.wait()
+    assert done == list(range(100))
+    assert worker.pending() == 0
+
+# wait(ticket) returns once that job is done, without waiting for the
+# jobs submitted after it
+def test_worker_wait_ticket():
+    worker = Worker()
+    release = threading.Event()
+    done = []
+    first = worker.submit(done.append, 'first')
+    worker.submit(release.wait, 5)
+    worker.wait(first)
+    assert done == ['first']
+    assert worker.pending() == 1
+    release.set()
+    worker.wait()
+    assert worker.pending() == 0
+
+# A failing job does not stop the jobs after it
+def test_worker_failing_job():
+    worker = Worker()
+    done = []
+    worker.submit(lambda: 1 / 0)
+    worker.submit(done.append, 'after')
+    worker.wait()
+    assert done == ['after']
+
+# Jobs that have not started when the worker is cleared never run
+def test_worker_clear():
+    worker = Worker()
+    started = threading.Event()
+    release = threading.Event()
+    done = []
+    worker.submit(lambda: (started.set(), release.wait(5)))
+    assert started.wait(5)
+    dropped = worker.submit(done.append, 'dropped')
+    # clear() waits for the running job, which is let go from another thread
+    threading.Timer(0.1, release.set).start()
+    worker.clear()
+    assert release.is_set()
+    assert worker.pending() == 0
+    worker.wait(dropped)
+    assert done == []